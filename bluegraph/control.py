@@ -9,25 +9,47 @@ from PySide import QtCore
 
 from bluegraph import views
 from bluegraph import utils
+from bluegraph.devices import Timing
+from bluegraph.devices import Tracing
+from bluegraph.devices import Processing
 from bluegraph.devices import DeviceWrappers
 
 log = logging.getLogger(__name__)
 
 
 class BlueGraphController(object):
+    notifier = None
+
     def __init__(self, device_class="Simulation",
                  device_type="RegulatedSpectra",
                  device_args=None,
-                 title=None):
+                 title=None,
+                 recorder=None):
 
         if title == None:
             title = device_type.upper()
         print "Class: %s, type: %s" % (device_class, device_type)
 
         dev_wrap = DeviceWrappers.DeviceChooser()
-        self.device = dev_wrap.create(device_class,
-                                      device_type,
-                                      device_args)
+        if recorder is None:
+            self.device = dev_wrap.create(device_class,
+                                          device_type,
+                                          device_args)
+
+        elif device_class == "DeviceWrappers":
+            # Recording happens in the worker of the interface
+            self.device = dev_wrap.create(device_class,
+                                          device_type,
+                                          device_args,
+                                          {"recorder": recorder})
+
+        else:
+            # Direct devices are wrapped to record in a worker
+            if device_args is not None:
+                raise ValueError("Cannot record %s created with arguments"
+                                 % device_type)
+            name = "%s.%s" % (device_class, device_type)
+            self.device = dev_wrap.create_backend(name, recorder=recorder)
         self.device.connect()
 
         self.form = views.PixmapBackedGraph(title=title)
@@ -36,6 +58,10 @@ class BlueGraphController(object):
 
         self.render_fps = utils.SimpleFPS()
         self.data_fps = utils.SimpleFPS()
+        self.frames = utils.FrameMonitor()
+        self.statistics = Processing.FrameStatistics(("min", "max"))
+        self.stages = utils.StageTimer()
+        self.last_overlay = 0.0
 
         self.setup_fps_timers()
 
@@ -46,24 +72,54 @@ class BlueGraphController(object):
         """
         self.form.exit_signal.exit.connect(self.close)
 
+        # Devices that decimate in the worker follow the plot width
+        if hasattr(self.device, "set_plot_width"):
+            resized = self.form.plot_signal.resized
+            resized.connect(self.device.set_plot_width)
+            self.device.set_plot_width(self.form.plot_width())
+
+        self.form.paint_signal.painted.connect(self.add_paint_time)
+        self.form.timing_signal.toggle.connect(self.toggle_timing)
+        self.form.timing_signal.dump.connect(self.dump_timing)
+
         class ControlClose(QtCore.QObject):
             exit = QtCore.Signal(str)
 
         self.control_exit_signal = ControlClose()
 
+    def add_paint_time(self, seconds):
+        self.stages.add("paint", seconds)
+
+    def toggle_timing(self):
+        """ Show or hide the stage timing overlay.
+        """
+        overlay = self.form.graphback.timing
+        overlay.setVisible(not overlay.isVisible())
+        self.last_overlay = 0.0
+
+    def dump_timing(self):
+        """ Log the stage percentiles and histograms, and return them.
+        """
+        text = self.stages.dump()
+        log.info("Stage timing:\n%s", text)
+        return text
+
     def close(self, event):
         """ Cleanup and exit. Don't issue qapplication quit here,
         as that will terminate the qapplication during tests. Use the
         qapplication control from py.test.
         """
         log.debug("blue graph controller level close")
+        if self.notifier is not None:
+            self.notifier.setEnabled(False)
         self.device.disconnect()
         self.control_exit_signal.exit.emit("control exit")
 
 
     def setup_fps_timers(self):
         """ Update the display Frames per second at every qt event
-        timeout.
+        timeout. Devices with a wakeup descriptor are only read again
+        when it says a frame is waiting, instead of spinning.
         """
         #for item in range(10):
             #self.fps.tick()
@@ -71,28 +127,116 @@ class BlueGraphController(object):
         self.data_timer = QtCore.QTimer()
         self.data_timer.timeout.connect(self.update_fps)
         self.data_timer.setSingleShot(True)
+
+        fd = DeviceWrappers.wakeup_fd(self.device)
+        if fd is not None:
+            read_type = QtCore.QSocketNotifier.Read
+            self.notifier = QtCore.QSocketNotifier(fd, read_type)
+            self.notifier.activated.connect(self.wake)
+
         self.data_timer.start(0)
 
+    def wake(self, fd):
+        """ A response is waiting on the data queue.
+        """
+        self.device.wakeup.clear()
+        self.update_fps()
+
     def update_fps(self):
         """ Add tick, display the current rate.
         """
-        rnd_data = self.device.read()
-        if rnd_data is not None:
-            self.form.curve.setData(rnd_data)
-            self.data_fps.tick()
-            self.update_min_max(rnd_data)
+        start = Timing.monotonic()
+        frame = DeviceWrappers.read_frame(self.device)
+        if frame is not None:
+            self.display_frame(frame, Timing.monotonic() - start)
 
         self.render_fps.tick()
-        new_fps = "D: %s\nR: %s" % (self.data_fps.rate(), self.render_fps.rate())
+        self.show_fps()
+        self.schedule_update(frame)
+        Tracing.complete("update_fps", start, Timing.monotonic(), "render")
+
+    def schedule_update(self, frame):
+        """ Without a notifier, read again straight away. With one, read
+        again after a frame to start the next acquire, then wait for the
+        next wakeup. The data queue only signals once the frame can be
+        got, so a wakeup never finds it still on its way.
+        """
+        if self.notifier is None or frame is not None:
+            self.data_timer.start(0)
+
+    def display_frame(self, frame, read_time=None):
+        """ Plot the frame and update the text boxes, timing each stage.
+        """
+        stages = self.stages
+        if frame.worker_time is not None:
+            read_time = frame.worker_time
+        if read_time is not None:
+            stages.add("read", read_time)
+        stages.add("transit", frame.age())
+
+        start = Timing.monotonic()
+        utils.plot_frame(self.form.curve, frame)
+        plotted = Timing.monotonic()
+        stages.add("set_data", plotted - start)
+
+        self.data_fps.tick()
+        self.frames.update(frame, self.device)
+        self.update_min_max(frame)
+        stages.add("min_max", Timing.monotonic() - plotted)
+
+    def show_fps(self):
+        """ Data and render fps, with the age of the displayed frame and
+        the number of sequence gaps seen. The timing overlay, when shown,
+        is refreshed a few times a second.
+        """
+        new_fps = "D: %s\nR: %s\n%s" % (self.data_fps.rate(),
+                                        self.render_fps.rate(),
+                                        self.frames.summary())
         self.form.graphback.view_fps.setText(new_fps)
-        self.data_timer.start(0)
 
-    def update_min_max(self, rnd_data):
+        overlay = self.form.graphback.timing
+        now = Timing.monotonic()
+        if overlay.isVisible() and now - self.last_overlay > 0.25:
+            overlay.setText(self.stages.overlay())
+            self.last_overlay = now
+
+    def update_min_max(self, frame):
         """ Show the current min and maximum values in the interface
-        controls.
+        controls. Frames from the device wrappers arrive with these
+        computed in the worker, direct device readings are summarized
+        here.
+        """
+        stats = frame.stats
+        if not stats or "min" not in stats or "max" not in stats:
+            stats = self.statistics.compute(frame.data)
+
+        self.form.graphback.minimum.setText(stats["min"])
+        self.form.graphback.maximum.setText(stats["max"])
+
+
+class AsyncBlueGraphController(BlueGraphController):
+    """ Same display as BlueGraphController, but the device is read from
+    a generator task on a utils.TaskRunner instead of a zero interval
+    timer that spins over read().
+    """
+    def setup_fps_timers(self):
+        """ Start the acquisition task.
+        """
+        self.runner = utils.TaskRunner()
+        self.runner.start(self.acquire())
+
+    def acquire(self):
+        """ Wait for each reading, then display it.
         """
-        min_conv = numpy.min(rnd_data)
-        self.form.graphback.minimum.setText(min_conv)
+        while True:
+            frame = yield DeviceWrappers.read_async(self.device)
+            self.display_frame(frame)
 
-        max_conv = numpy.max(rnd_data)
-        self.form.graphback.maximum.setText(max_conv)
+            self.render_fps.tick()
+            self.show_fps()
+
+    def close(self, event):
+        """ Stop the acquisition task before disconnecting.
+        """
+        self.runner.stop()
+        super(AsyncBlueGraphController, self).close(event)
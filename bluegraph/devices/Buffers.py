@@ -0,0 +1,143 @@
+""" Preallocated buffers for device readings.
+"""
+
+import numpy
+import logging
+
+from bluegraph.devices import Timing
+
+log = logging.getLogger(__name__)
+
+class HistoryRing(object):
+    """ Fixed capacity history of samples and their timestamps, in
+    preallocated numpy arrays. Every sample is written twice, capacity
+    apart, so the newest samples are always one contiguous slice and
+    view() never copies. Appending costs the same at any capacity.
+
+    The views share memory with the ring and are only valid until the
+    next append, copy them to keep them.
+    """
+    def __init__(self, capacity, dtype=numpy.float64):
+        super(HistoryRing, self).__init__()
+        if capacity < 1:
+            raise ValueError("Capacity must be at least 1: %s" % capacity)
+
+        self.capacity = capacity
+        self.values = numpy.zeros(2 * capacity, dtype=dtype)
+        self.stamps = numpy.zeros(2 * capacity, dtype=numpy.float64)
+
+        self.position = 0 # Next index to write, below capacity
+        self.count = 0 # Samples held, at most capacity
+        self.total = 0 # Samples appended since creation
+
+    def __len__(self):
+        return self.count
+
+    def append(self, value, stamp=None):
+        """ Add one sample, replacing the oldest when full. stamp
+        defaults to the current Timing.monotonic() time.
+        """
+        if stamp is None:
+            stamp = Timing.monotonic()
+
+        position = self.position
+        mirror = position + self.capacity
+        self.values[position] = value
+        self.values[mirror] = value
+        self.stamps[position] = stamp
+        self.stamps[mirror] = stamp
+
+        self.position = (position + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        self.total += 1
+
+    def extend(self, values, stamps):
+        """ Add a block of samples and their timestamps, oldest first.
+        """
+        values = numpy.ravel(values)
+        stamps = numpy.ravel(stamps)
+        self.total += len(values)
+
+        # Only the newest capacity samples can be kept
+        values = values[-self.capacity:]
+        stamps = stamps[-self.capacity:]
+        added = len(values)
+
+        index = (self.position + numpy.arange(added)) % self.capacity
+        for offset in (0, self.capacity):
+            self.values[index + offset] = values
+            self.stamps[index + offset] = stamps
+
+        self.position = (self.position + added) % self.capacity
+        self.count = min(self.count + added, self.capacity)
+
+    def since(self, total):
+        """ Return a HistoryDelta of the samples appended after the
+        first total. When total is None, or so old the samples have been
+        overwritten, the delta is full and holds every sample.
+        """
+        oldest = self.total - self.count
+        full = total is None or total < oldest
+        if full:
+            total = oldest
+
+        window = self.window()
+        start = window.stop - (self.total - total)
+        values = self.values[start:window.stop].copy()
+        stamps = self.stamps[start:window.stop].copy()
+        return HistoryDelta(values, stamps, total, self.capacity, full)
+
+    def apply(self, delta):
+        """ Append the samples in a HistoryDelta, or replace the history
+        with a full one. Return False, leaving the history unchanged, if
+        the delta does not follow on from it, so the caller can ask for a
+        full resync.
+        """
+        if not delta.full and delta.start != self.total:
+            return False
+
+        if delta.full:
+            self.clear()
+        self.total = delta.start
+        self.extend(delta.values, delta.stamps)
+        return True
+
+    def clear(self):
+        """ Forget all samples, keeping the allocated arrays.
+        """
+        self.position = 0
+        self.count = 0
+
+    def window(self):
+        """ Slice of the mirrored arrays holding the samples, oldest
+        first.
+        """
+        start = self.position + self.capacity - self.count
+        return slice(start, start + self.count)
+
+    def view(self):
+        """ Contiguous view of the samples, oldest first.
+        """
+        return self.values[self.window()]
+
+    def timestamps(self):
+        """ Contiguous view of the sample timestamps, matching view().
+        """
+        return self.stamps[self.window()]
+
+class HistoryDelta(object):
+    """ Samples a HistoryRing gained since the last delta was taken, so a
+    consumer with its own ring can follow the history without the whole
+    of it being resent. start is the sample number of the first value.
+    A full delta holds every sample and replaces the consumer history.
+    """
+    def __init__(self, values, stamps, start, capacity, full=False):
+        super(HistoryDelta, self).__init__()
+        self.values = values
+        self.stamps = stamps
+        self.start = start
+        self.capacity = capacity
+        self.full = full
+
+    def __len__(self):
+        return len(self.values)
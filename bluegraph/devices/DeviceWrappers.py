@@ -1,74 +1,290 @@
 """ Simulation devices for bluegraph visualizations
 """
 
+import json
 import time
 import numpy
 import random
 import logging
+import threading
 import Queue
 import multiprocessing
 
 from collections import deque
 
+from bluegraph.devices import Timing
+from bluegraph.devices import Buffers
+from bluegraph.devices import Registry
+from bluegraph.devices import Processing
+from bluegraph.devices import Instrumentation
+from bluegraph.devices import Tracing
 from bluegraph.devices import Simulation
+from bluegraph.devices import Transports
 
 log = logging.getLogger(__name__)
 
+DEFAULT_STATISTICS = Processing.FrameStatistics()
+
 class DeviceChooser(object):
-    """ Convert the string specification to an importable module. This is
-    to define the classes at runtime, so you can add in new modules for
-    display that may not have a testable portion in a CI environment. See
-    Phidgeter for examples.
+    """ Convert the string specification to a device class through the
+    Registry. This is to define the classes at runtime, so you can add in
+    new modules for display that may not have a testable portion in a CI
+    environment. See Phidgeter for examples.
     """
-    def __init__(self):
-        pass
+    wrappers = {("process", True): "BlockingInterface",
+                ("process", False): "NonBlockingInterface",
+                ("thread", True): "ThreadedInterface",
+                ("thread", False): "NonBlockingThreadedInterface",
+                ("host", False): "HostedInterface",
+                ("pool", True): "PooledInterface",
+               }
 
-    def create(self, device_class, device_type, device_args=None):
-        """ Create a device from the bluegraph modules available. Certain
-        modules will only be available at runtime, so attempt to import
-        them during the creation process. This gets really ugly when
-        passing arguments as well. There has to be a more maintainable
-        way to do this.
+    def __init__(self, backends=None, registry=None):
+        """ backends maps device types like "PhidgeterWrappers.IRHistory"
+        to the backend create_backend uses for them: "process", "thread",
+        "host", "pool" or "inline".
+        """
+        if backends is None:
+            backends = {}
+        self.backends = backends
+
+        if registry is None:
+            registry = Registry.registry
+        self.registry = registry
 
-        This approach permits the importing of straight device modules
-        like: Simulation.RegulatedSpectra. As well as the import of the
-        wrapper modules like Blocking.RegulatedSpectra
+    def create_backend(self, device_type, backend=None, blocking=False,
+                       device_kwargs=None, recorder=None):
+        """ Create the device_type wrapped in the configured backend,
+        "process" if none is configured. An "inline" device is created
+        directly and read in the caller's thread. device_kwargs are
+        passed on to the device constructor, and recorder to the
+        wrapper. Raise ValueError for a backend that cannot record.
         """
-        cmd_name = "bluegraph.devices.%s" % device_class
-        from_list = "bluegraph.devices"
-        command_module = __import__(cmd_name, fromlist=from_list)
+        if backend is None:
+            backend = self.backends.get(device_type, "process")
 
-        # This is ugly - there has to be a more pythonic way to do this
+        if device_kwargs is None:
+            device_kwargs = {}
 
-        # command_module is the module name, like Simulation or Phidgeter
-        # Append the class name like NonBlocking
-        cmd_str = "command_module.%s" % device_type
+        if recorder is not None and backend in ("inline", "host"):
+            raise ValueError("The %s backend cannot record" % backend)
+
+        if backend == "inline":
+            return self.registry.create(device_type, **device_kwargs)
+
+        try:
+            wrapper = self.wrappers[(backend, blocking)]
+        except KeyError:
+            raise ValueError("No %s %s backend" %
+                             ("blocking" if blocking else "non blocking",
+                              backend))
+
+        kwargs = {}
+        if device_kwargs:
+            kwargs["device_kwargs"] = device_kwargs
+        if recorder is not None:
+            kwargs["recorder"] = recorder
+        return self.create("DeviceWrappers", wrapper, device_type, kwargs)
+
+    def create(self, device_class, device_type, device_args=None,
+               device_kwargs=None):
+        """ Create a device from the bluegraph modules available. Certain
+        modules will only be available at runtime, so they are imported
+        during the creation process.
 
-        # Pass in the argument string like "RegulatedDevice" if it exists
-        if device_args is not None:
-            cmd_str = cmd_str + "(\"%s\")" % device_args
+        This approach permits the creation of straight device modules
+        like: Simulation.RegulatedSpectra. As well as the wrapper modules
+        like DeviceWrappers.NonBlockingInterface, where device_args is the
+        wrapped device type. device_args is passed as the one positional
+        argument, a tuple of several, or None for no arguments. The
+        arguments are passed as-is, not converted to strings.
+        """
+        if device_args is None:
+            args = ()
+        elif isinstance(device_args, tuple):
+            args = device_args
         else:
-            cmd_str = cmd_str + "()"
+            args = (device_args,)
+
+        if device_kwargs is None:
+            device_kwargs = {}
+
+        name = "%s.%s" % (device_class, device_type)
+        log.debug("Create %s%s %s", name, args, device_kwargs)
+        return self.registry.create(name, *args, **device_kwargs)
+
+def create_device(device_type, device_kwargs=None):
+    """ Create the device named by device_type, a string like
+    "Simulation.SimulatedSpectra", with the optional keyword arguments.
+    """
+    if device_kwargs is None:
+        device_kwargs = {}
+    return Registry.registry.create(device_type, **device_kwargs)
+
+class Frame(object):
+    """ Envelope around one reading. sequence counts every reading the
+    worker has taken from the device since connect, so a jump in it means
+    frames were dropped along the way. timestamp is Timing.monotonic()
+    in the worker when the reading completed, which is comparable with
+    the same clock in the controller process. Readings taken directly
+    from a device have no sequence. stats holds the summary statistics
+    computed in the worker, if any. When the worker has decimated the
+    reading, data is the min/max envelope and x the pixel positions to
+    plot it at. worker_time is only set by instrumented wrappers.
+    """
+    worker_time = None
+
+    def __init__(self, data, sequence=None, timestamp=None, device_id=None,
+                 stats=None, x=None):
+        if timestamp is None:
+            timestamp = Timing.monotonic()
+        self.data = data
+        self.sequence = sequence
+        self.timestamp = timestamp
+        self.device_id = device_id
+        self.stats = stats
+        self.x = x
+
+    def age(self):
+        """ Seconds since the reading was taken.
+        """
+        return Timing.monotonic() - self.timestamp
+
+class PendingRead(object):
+    """ A read that has been started but may not have completed. poll()
+    never blocks, and returns True once result holds the Frame. This
+    is what the read_async() methods hand out for the generator tasks
+    run by bluegraph.utils.TaskRunner. Reads of devices with a wakeup
+    pipe carry it as wakeup, and only need polling once it is set.
+    """
+    def __init__(self, poll_function=None, result=None, wakeup=None):
+        self.poll_function = poll_function
+        self.result = result
+        self.wakeup = wakeup
+        self.done = poll_function is None
+
+    def poll(self):
+        if not self.done:
+            result = self.poll_function()
+            if result is not None:
+                self.result = result
+                self.done = True
+        return self.done
 
-        print "Attempt to import: %s" % cmd_str
-        device = eval(cmd_str)
+def read_frame(device):
+    """ Read a Frame from any device. Devices without a read_frame method
+    have their reading wrapped in a Frame without a sequence number.
+    """
+    if hasattr(device, "read_frame"):
+        return device.read_frame()
 
-        return device
+    data = device.read()
+    if data is None:
+        return None
+    return Frame(data)
 
+def wakeup_fd(device):
+    """ Return the descriptor that becomes readable when the device has
+    a frame waiting, see Transports.WakePipe, or None for devices that
+    have to be polled.
+    """
+    wakeup = getattr(device, "wakeup", None)
+    if wakeup is None:
+        return None
+    return wakeup.fileno()
 
+def read_async(device):
+    """ Start a read on any device. Devices without a read_async method
+    are read immediately, and the returned PendingRead is already done.
+    """
+    if hasattr(device, "read_async"):
+        return device.read_async()
+    return PendingRead(result=read_frame(device))
 
 class BlockingInterface(object):
     """ Wrap the defined device in a separate process. Use queues to
     request and emit data in lock step to create a blocking interface.
+
+    The transport decides how readings cross the process boundary, and
+    defaults to pickling them through the data queue. Every reading is
+    sent as a Frame tagged with device_id, which defaults to device_type.
+    The Processing.FrameStatistics given as statistics are computed in
+    the worker and attached to each frame, use None to skip them. The
+    device is created in the worker with the device_kwargs keyword
+    arguments.
+
+    After set_plot_width(), readings are decimated in the worker to a
+    min/max envelope of the plot width before they are sent. read_full()
+    and read_many() always return full resolution readings.
+
+    A recorder.FrameRecorder given as recorder is opened in the worker
+    and records every full resolution reading before it is decimated.
+
+    With instrument, queue waits, worker time, frame age and queue
+    depths are measured and returned by stats(), and logged every
+    log_interval seconds. Without it nothing is measured at all.
+
+    Devices that keep a Buffers.HistoryRing as their history attribute,
+    like StripChartDevice, only send the samples added since the last
+    frame. The interface keeps its own copy of the history and returns a
+    view of it, asking the worker for a full resync if samples are
+    missed. The view is valid until the next read, copy it to keep it.
+    The samples are copied out of the device ring in the worker, so even
+    a worker thread never writes into a view the reader holds.
+
+    The non blocking subclasses set wakeup to a Transports.WakePipe the
+    data queue sets once each response can be got, see wakeup_fd().
     """
-    def __init__(self, device_type="Simulation.SimulatedDevice"):
+    wakeup = None
+    instruments = None
+
+    def __init__(self, device_type="Simulation.SimulatedDevice",
+                 transport=None, device_id=None,
+                 statistics=DEFAULT_STATISTICS, device_kwargs=None,
+                 recorder=None, instrument=False, log_interval=5.0):
         print "Blocking create type: %s" % device_type
         super(BlockingInterface, self).__init__()
 
         self.device_type = device_type
-        self.data_queue = multiprocessing.Queue()
+        self.device_kwargs = device_kwargs
+        self.recorder = recorder
+        if device_id is None:
+            device_id = device_type
+        self.device_id = device_id
+        self.statistics = statistics
+
+        # Shared with the worker, 0 disables decimation
+        self.plot_width = multiprocessing.RawValue("i", 0)
+
+        # Reader side copy of a history device
+        self.history = None
+        self.resync_sent = False
+
+        if transport is None:
+            transport = Transports.QueueTransport()
+        self.transport = transport
+
+        # Created before the worker starts, which binds its timed acquire
+        if instrument:
+            self.instruments = Instrumentation.WrapperStats(self.device_id,
+                                                            log_interval)
+
+        self.create_queues()
+        self.start_worker()
+
+        # Only now, the timed methods can't be pickled for the worker
+        if self.instruments is not None:
+            self.instruments.attach(self)
+
+    def create_queues(self):
+        """ Create the control and data queues shared with the worker.
+        """
+        self.data_queue = Transports.SignalledQueue.create(self.wakeup)
         self.control_queue = multiprocessing.Queue()
 
+    def start_worker(self):
+        """ Start the worker process on the queues.
+        """
         mp = multiprocessing.Process
         args = (self.control_queue, self.data_queue)
         self.process = mp(target=self.worker, args=args)
@@ -81,9 +297,14 @@ class BlockingInterface(object):
         """
         continue_loop = True
         self.device = None
+        self.sequence = 0
+        self.history_sent = None
+        if self.instruments is not None:
+            self.instruments.attach_worker(self)
 
         while(continue_loop):
-            command = control_queue.get()
+            with Tracing.span("control get", "queue"):
+                command = control_queue.get()
 
             if command == "CONNECT":
                 log.info("NB Setup: %s", self.device_type)
@@ -91,34 +312,116 @@ class BlockingInterface(object):
                 self.device = self.create_device()
 
                 self.device.connect()
+                self.open_recorder()
                 response = "connect_successful"
 
             elif command == "DISCONNECT":
                 self.device.disconnect()
+                self.close_recorder()
                 continue_loop = False
                 response = "disconnect_successful"
 
+            elif command == "RESYNC":
+                # No response, the next frame carries the full history
+                self.history_sent = None
+                continue
+
+            elif command == "ACQUIRE_FULL":
+                response = self.acquire(full=True)
+
+            elif isinstance(command, tuple) and command[0] == "ACQUIRE_MANY":
+                # A failed batch is reported, the worker carries on
+                try:
+                    (frames, stamps) = self.acquire_many(*command[1:])
+                    response = (self.transport.pack(frames), stamps)
+                except Exception as exc:
+                    log.exception("Batch read failed: %s", self.device_type)
+                    response = "acquire_many_failed: %r" % exc
+
             else:
-                response = self.device.read()
+                response = self.acquire()
+
+            with Tracing.span("data put", "queue"):
+                data_queue.put(response)
+
+        Tracing.close_worker()
+
+    def acquire(self, full=False):
+        """ Worker side of read. Read the device once, summarize and
+        decimate it, and wrap the transport packed reading in the next
+        Frame. History devices send a HistoryDelta instead.
+        """
+        with Tracing.span("device read", "device"):
+            data = self.device.read()
+        stamp = Timing.monotonic()
+        self.record(self.sequence, stamp, data)
+
+        stats = None
+        if self.statistics is not None:
+            stats = self.statistics.compute(data)
+
+        x = None
+        width = self.plot_width.value
+        history = getattr(self.device, "history", None)
+        if isinstance(history, Buffers.HistoryRing):
+            if full:
+                self.history_sent = None
+            data = history.since(self.history_sent)
+            self.history_sent = history.total
+
+        elif width and not full:
+            (x, data) = Processing.min_max_envelope(data, width)
+
+        frame = Frame(self.transport.pack(data), self.sequence, stamp,
+                      self.device_id, stats, x)
+        self.sequence += 1
+        return frame
+
+    def acquire_many(self, max_frames, timeout):
+        """ Worker side of read_many. Read at least one frame, then keep
+        reading until max_frames are available or the timeout expires.
+        Return the frames stacked as a 2-D array and their timestamps.
+        Every reading is copied, a device may return a view it reuses,
+        like a HistoryRing. Readings of different lengths raise
+        ValueError.
+        """
+        frames = []
+        stamps = []
+        deadline = Timing.monotonic() + timeout
+        while len(frames) < max_frames:
+            frames.append(numpy.array(self.device.read(), copy=True).ravel())
+            stamps.append(Timing.monotonic())
+            self.record(self.sequence, stamps[-1], frames[-1])
+            self.sequence += 1
+            if stamps[-1] >= deadline:
+                break
 
-            data_queue.put(response)
+        return (numpy.vstack(frames), numpy.array(stamps))
 
     def create_device(self):
-        """ Use eval to import the specified module.
+        """ Import and create the device this interface wraps.
         """
-        (bg_module, bg_class) = self.device_type.split(".")
+        return create_device(self.device_type, self.device_kwargs)
 
-        cmd_name = "bluegraph.devices.%s" % bg_module
-        from_list = "bluegraph.devices"
-        command_module = __import__(cmd_name, fromlist=from_list)
+    def open_recorder(self):
+        if self.recorder is not None:
+            self.recorder.open()
 
-        cmd_str = "command_module.%s" % bg_class
-        cmd_str = cmd_str + "()"
+    def close_recorder(self):
+        if self.recorder is not None:
+            self.recorder.close()
 
-        print "BG Attempt to import: %s" % cmd_str
-        device = eval(cmd_str)
+    def record(self, sequence, stamp, data):
+        """ Worker side, pass the reading to the recorder if there is
+        one. History devices record only their newest sample.
+        """
+        if self.recorder is None:
+            return
 
-        return device
+        history = getattr(self.device, "history", None)
+        if isinstance(history, Buffers.HistoryRing):
+            data = data[-1:]
+        self.recorder.write(sequence, stamp, data)
 
 
 
@@ -136,6 +439,13 @@ class BlockingInterface(object):
         """
         self.control_queue.put(command)
         status = self.data_queue.get()
+
+        # Skip over readings from acquires that were still in flight
+        while not isinstance(status, basestring):
+            if isinstance(status, Frame):
+                self.transport.discard(status.data)
+            status = self.data_queue.get()
+
         if status == success:
             return True
 
@@ -152,64 +462,1197 @@ class BlockingInterface(object):
 
         # Always exit the processes, event if disconnect fails
         self.process.join()
+        self.transport.release()
+        if self.wakeup is not None:
+            self.wakeup.close()
         return result
 
     def read(self):
         """ Add the acquire command to the control queue, then do a
         blocking wait on the data queue.
         """
+        return self.read_frame().data
+
+    def read_frame(self):
+        """ Like read, but return the whole Frame.
+        """
+        with Tracing.span("control put", "queue"):
+            self.control_queue.put("ACQUIRE")
+        with Tracing.span("data get", "queue"):
+            frame = self.data_queue.get()
+        return self.unpack_frame(frame)
+
+    def unpack_frame(self, frame):
+        """ Replace the transport packed data in the frame with the
+        reading itself.
+        """
+        data = self.transport.unpack(frame.data)
+        if isinstance(data, Buffers.HistoryDelta):
+            data = self.apply_delta(data)
+        frame.data = data
+        return frame
+
+    def apply_delta(self, delta):
+        """ Add the delta to the reader side history and return a view
+        of it, valid until the next read. Ask the worker for the full
+        history if samples were missed.
+        """
+        history = self.history
+        if history is None or history.capacity != delta.capacity:
+            history = Buffers.HistoryRing(delta.capacity,
+                                          delta.values.dtype)
+            self.history = history
+
+        if delta.full:
+            self.resync_sent = False
+        if not history.apply(delta) and not self.resync_sent:
+            log.debug("History gap at %s, resync", delta.start)
+            self.control_queue.put("RESYNC")
+            self.resync_sent = True
+        return history.view()
+
+    def read_full(self):
+        """ Return a Frame of the full resolution reading, whatever the
+        plot width.
+        """
+        self.control_queue.put("ACQUIRE_FULL")
+        return self.unpack_frame(self.data_queue.get())
+
+    def stats(self):
+        """ Return the instrumentation summary, see
+        Instrumentation.WrapperStats, or None if not instrumented.
+        """
+        if self.instruments is None:
+            return None
+        return self.instruments.summary()
+
+    def set_plot_width(self, width):
+        """ Decimate readings to a min/max envelope for a plot of width
+        pixels. Use 0 to send full resolution readings.
+        """
+        self.plot_width.value = int(width)
+
+    def read_async(self):
+        """ Issue the acquire command and return a PendingRead that
+        completes, without ever blocking, once the worker has responded.
+        """
         self.control_queue.put("ACQUIRE")
-        result = self.data_queue.get()
-        return result
+        return PendingRead(self.poll_frame)
+
+    def poll_frame(self):
+        """ Return the next Frame if the worker has sent one, or None.
+        """
+        try:
+            frame = self.data_queue.get_nowait()
+        except Queue.Empty:
+            return None
+        return self.unpack_frame(frame)
+
+    def read_many(self, max_frames=100, timeout=1.0):
+        """ Read up to max_frames frames in a single request. The frames
+        are collected in the worker for at most timeout seconds and
+        returned in one message as a (frames x pixels) array plus an
+        array of per-frame timestamps. Raise IOError if the worker could
+        not batch the readings, for example a history still filling up.
+        """
+        command = ("ACQUIRE_MANY", max_frames, timeout)
+        self.control_queue.put(command)
+        response = self.data_queue.get()
+        if isinstance(response, basestring):
+            raise IOError(response)
+
+        (frames, stamps) = response
+        return (self.transport.unpack(frames), stamps)
 
 class NonBlockingInterface(BlockingInterface):
     """ Wrapper around the blocking interface that allows for immediate
     empty queue returns of the data queue. Use this in applications that
     need better responsivity by continuously calling read(), and sleep
-    when the response is None.
+    when the response is None, or wait for wakeup_fd() to be readable.
     """
-    def __init__(self, device_type="Simulation.SimulatedDevice"):
+    def __init__(self, device_type="Simulation.SimulatedDevice",
+                 transport=None, device_id=None,
+                 statistics=DEFAULT_STATISTICS, device_kwargs=None,
+                 recorder=None, instrument=False, log_interval=5.0):
         self.device_type = device_type
         print "non blocking create with: %s" % device_type
-        super(NonBlockingInterface, self).__init__(device_type=device_type)
+        parent = super(NonBlockingInterface, self)
+        parent.__init__(device_type=device_type, transport=transport,
+                        device_id=device_id, statistics=statistics,
+                        device_kwargs=device_kwargs, recorder=recorder,
+                        instrument=instrument, log_interval=log_interval)
 
         self.acquire_sent = False # Wait for an acquire to complete
 
+    def create_queues(self):
+        """ Create the wakeup pipe the data queue sets, see wakeup_fd().
+        """
+        self.wakeup = Transports.WakePipe.create()
+        super(NonBlockingInterface, self).create_queues()
+
     def send_acquire(self):
         """ Only send one acquire onto the control queue at a time.
         Requires that the removal of the data from the data queue resets
-        the acquire_sent parameter. Apparently python 2.7.x on MS windows
-        blocks somehow on the queue.empty call. Replace with an attempted
-        non blocking get.
+        the acquire_sent parameter. The control queue is never read on
+        this side, that would take commands like RESYNC meant for the
+        worker.
         """
         if self.acquire_sent:
             return
 
-        # See notes above on why queue.empty() is not used.
-        queue_empty = True
-        try:
-            result = self.control_queue.get_nowait()
-        except Queue.Empty:
-            log.debug("Queue is empty")
-            self.control_queue.put("ACQUIRE")
-            self.acquire_sent = True
-
+        self.control_queue.put("ACQUIRE")
+        self.acquire_sent = True
 
     def read(self):
         """ Send an acquire command on the control queue. Immediately
         attempt to retrieve data from the data queue, returning a None
         when the data queue is empty.
         """
+        frame = self.read_frame()
+        if frame is None:
+            return None
+        return frame.data
+
+    def read_frame(self):
+        """ Like read, but return the whole Frame.
+        """
         self.send_acquire()
 
-        result = None
         try:
-            result = self.data_queue.get_nowait()
+            with Tracing.span("data get", "queue"):
+                frame = self.data_queue.get_nowait()
             self.acquire_sent = False
 
         except Queue.Empty:
             log.debug("empty queue")
+            return None
+
+        return self.unpack_frame(frame)
+
+    def read_async(self):
+        """ Return a PendingRead driven by the non blocking read.
+        The first poll is made straight away to start the read.
+        """
+        pending = PendingRead(self.read_frame, wakeup=self.wakeup)
+        pending.poll()
+        return pending
+
+    def read_full(self):
+        """ Blocking full resolution read, see BlockingInterface. An
+        outstanding acquire is waited for and its frame discarded.
+        """
+        if self.acquire_sent:
+            frame = self.data_queue.get()
+            self.transport.discard(frame.data)
+            self.acquire_sent = False
+
+        return super(NonBlockingInterface, self).read_full()
+
+    def read_many(self, max_frames=100, timeout=1.0):
+        """ Blocking batch read, see BlockingInterface.read_many. If a
+        single acquire is still outstanding, its frame is waited for and
+        placed at the front of the batch, unless it was decimated, then
+        it is discarded like in read_full.
+        """
+        parent = super(NonBlockingInterface, self)
+        if not self.acquire_sent:
+            return parent.read_many(max_frames, timeout)
+
+        frame = self.data_queue.get()
+        self.acquire_sent = False
+        if frame.x is not None:
+            self.transport.discard(frame.data)
+            return parent.read_many(max_frames, timeout)
+
+        frame = self.unpack_frame(frame)
+        pending = numpy.ravel(frame.data).copy()
+        pending_stamp = frame.timestamp
+        if max_frames <= 1:
+            return (pending[numpy.newaxis, :], numpy.array([pending_stamp]))
+
+        (frames, stamps) = parent.read_many(max_frames - 1, timeout)
+        frames = numpy.vstack((pending, frames))
+        stamps = numpy.hstack(([pending_stamp], stamps))
+        return (frames, stamps)
+
+class ThreadedInterface(BlockingInterface):
+    """ Blocking interface with the worker in a thread instead of a
+    process. Suited to drivers that spend their time in C calls that
+    release the GIL, where a process and pickled queues cost more than
+    they save. Readings are handed over through a deque, never pickled.
+    History devices hand over copies of their new samples, so the worker
+    thread never writes into a history view the reader holds.
+    """
+    def create_queues(self):
+        self.data_queue = Transports.DequeHandoff(self.wakeup)
+        self.control_queue = Transports.DequeHandoff()
+
+    def start_worker(self):
+        """ The thread is kept as self.process so disconnect joins it
+        like the worker process.
+        """
+        args = (self.control_queue, self.data_queue)
+        self.process = threading.Thread(target=self.worker, args=args)
+        self.process.daemon = True
+        self.process.start()
+
+class NonBlockingThreadedInterface(NonBlockingInterface, ThreadedInterface):
+    """ Non blocking read semantics on top of the threaded worker.
+    """
+    pass
+
+class SharedMemoryInterface(BlockingInterface):
+    """ Blocking interface where numpy frames are passed through a ring of
+    shared memory slots instead of being pickled. The array returned by
+    read() is a view on shared memory, valid until the next read().
+    """
+    def __init__(self, device_type="Simulation.SimulatedSpectra",
+                 slots=8, slot_bytes=16384 * 8):
+        transport = Transports.SharedMemoryTransport(slots, slot_bytes)
+        super(SharedMemoryInterface, self).__init__(device_type=device_type,
+                                                    transport=transport)
+
+class NonBlockingSharedMemoryInterface(NonBlockingInterface):
+    """ Non blocking interface on top of the shared memory frame ring.
+    See SharedMemoryInterface for the lifetime of the returned arrays.
+    """
+    def __init__(self, device_type="Simulation.SimulatedSpectra",
+                 slots=8, slot_bytes=16384 * 8):
+        transport = Transports.SharedMemoryTransport(slots, slot_bytes)
+        parent = super(NonBlockingSharedMemoryInterface, self)
+        parent.__init__(device_type=device_type, transport=transport)
+
+
+
+class WorkerPool(object):
+    """ Worker processes started ahead of time, so a PooledInterface
+    gets a process that has already imported its driver instead of
+    starting one on connect. preload is a list of device types each
+    worker imports while it waits.
+
+    take() does not start a replacement, refill() does, one worker per
+    call, from the thread that owns the pool while it is idle, see
+    utils.PoolRefiller. Python 2 does not reset locks after a fork, so a
+    fork from a helper thread could hand the worker a lock another
+    thread was holding, like a logging handler lock, and deadlock it.
+    """
+    shared_pool = None
+
+    @classmethod
+    def shared(cls):
+        """ Return the process wide default pool.
+        """
+        if cls.shared_pool is None:
+            cls.shared_pool = cls()
+        return cls.shared_pool
+
+    def __init__(self, size=2, preload=("Simulation.SimulatedSpectra",)):
+        super(WorkerPool, self).__init__()
+        self.size = size
+        self.preload = tuple(preload)
+        self.idle = deque()
+        self.fill()
+
+    def fill(self):
+        """ Start workers until size are waiting.
+        """
+        while self.refill():
+            pass
+
+    def refill(self):
+        """ Start one worker if fewer than size are waiting. Return True
+        if the pool is still short after it.
+        """
+        if len(self.idle) < self.size:
+            self.idle.append(self.spawn())
+        return len(self.idle) < self.size
+
+    def spawn(self):
+        """ Start one worker. Its target is a module function, so only
+        the queues and preload list are handed to the new process.
+        """
+        control_queue = multiprocessing.Queue()
+        data_queue = multiprocessing.Queue()
+        plot_width = multiprocessing.RawValue("i", 0)
 
+        args = (control_queue, data_queue, plot_width, self.preload)
+        process = multiprocessing.Process(target=pool_worker, args=args)
+        process.daemon = True
+        process.start()
+        return (process, control_queue, data_queue, plot_width)
+
+    def take(self):
+        """ Hand out an idle worker, leaving its replacement to refill().
+        Only an empty pool spawns while the caller waits.
+        """
+        try:
+            return self.idle.popleft()
+        except IndexError:
+            return self.spawn()
+
+    def close(self):
+        """ Stop the idle workers.
+        """
+        while self.idle:
+            (process, control_queue) = self.idle.popleft()[:2]
+            control_queue.put("STOP")
+            process.join()
+        return True
+
+def pool_worker(control_queue, data_queue, plot_width, preload):
+    """ WorkerPool process. Import the preload devices, wait to be
+    assigned a device, then run the usual worker loop for it.
+    """
+    for device_type in preload:
+        try:
+            Registry.registry.resolve(device_type)
+        except (ImportError, ValueError):
+            log.exception("Preload %s failed", device_type)
+
+    command = control_queue.get()
+    if command == "STOP":
+        return
+
+    settings = command[1]
+    worker = PooledWorker(plot_width, **settings)
+    worker.worker(control_queue, data_queue)
+
+class PooledWorker(BlockingInterface):
+    """ Worker side of a PooledInterface. Holds the assigned settings so
+    the BlockingInterface worker loop can run in a pool process, without
+    creating queues or a process of its own.
+    """
+    def __init__(self, plot_width, device_type, device_kwargs, device_id,
+                 statistics, recorder):
+        self.device_type = device_type
+        self.device_kwargs = device_kwargs
+        self.recorder = recorder
+        self.device_id = device_id
+        self.statistics = statistics
+        self.plot_width = plot_width
+        self.transport = Transports.QueueTransport()
+
+class PooledInterface(BlockingInterface):
+    """ Blocking interface that is assigned a pre-started worker from a
+    WorkerPool on connect(), instead of starting a process when it is
+    created. Uses the shared default pool unless one is given. Readings
+    are always pickled through the data queue.
+    """
+    def __init__(self, device_type="Simulation.SimulatedDevice",
+                 pool=None, device_id=None, statistics=DEFAULT_STATISTICS,
+                 device_kwargs=None, recorder=None):
+        if pool is None:
+            pool = WorkerPool.shared()
+        self.pool = pool
+        self.process = None
+        super(PooledInterface, self).__init__(device_type=device_type,
+                                              device_id=device_id,
+                                              statistics=statistics,
+                                              device_kwargs=device_kwargs,
+                                              recorder=recorder)
+
+    def create_queues(self):
+        """ The queues come with the pool worker on connect.
+        """
+        pass
+
+    def start_worker(self):
+        """ The worker is already running in the pool.
+        """
+        pass
+
+    def connect(self):
+        """ Take a worker from the pool, assign this device to it, then
+        connect as usual.
+        """
+        (self.process, self.control_queue, self.data_queue,
+         plot_width) = self.pool.take()
+
+        # Keep any width set before connect
+        plot_width.value = self.plot_width.value
+        self.plot_width = plot_width
+
+        settings = {"device_type": self.device_type,
+                    "device_kwargs": self.device_kwargs,
+                    "device_id": self.device_id,
+                    "statistics": self.statistics,
+                    "recorder": self.recorder,
+                   }
+        self.control_queue.put(("ASSIGN", settings))
+        return super(PooledInterface, self).connect()
+
+class StreamingInterface(BlockingInterface):
+    """ Free running acquisition. After connect, the worker reads from the
+    device continuously at its native rate into a bounded data queue,
+    instead of waiting for an acquire command per frame. read() never
+    blocks: it drains the queue, returns only the newest frame and
+    records how many older frames were skipped in frames_skipped.
+
+    The overflow policy decides what the worker does when the buffer is
+    full: "drop-oldest" replaces the oldest queued frame, "drop-newest"
+    throws away the frame just read, and "block" waits for the reader.
+    """
+    policies = ("drop-oldest", "drop-newest", "block")
+
+    def __init__(self, device_type="Simulation.SimulatedDevice",
+                 buffer_size=4, overflow="drop-oldest", transport=None,
+                 device_id=None, statistics=DEFAULT_STATISTICS,
+                 device_kwargs=None, recorder=None, instrument=False,
+                 log_interval=5.0):
+        if overflow not in self.policies:
+            raise ValueError("Unknown overflow policy: %s" % overflow)
+
+        self.buffer_size = buffer_size
+        self.overflow = overflow
+        self.frames_skipped = 0
+        self.total_skipped = 0
+        self.last_sequence = -1
+        super(StreamingInterface, self).__init__(device_type=device_type,
+                                                 transport=transport,
+                                                 device_id=device_id,
+                                                 statistics=statistics,
+                                                 device_kwargs=device_kwargs,
+                                                 recorder=recorder,
+                                                 instrument=instrument,
+                                                 log_interval=log_interval)
+
+    def create_queues(self):
+        """ The data queue is the bounded frame buffer.
+        """
+        self.wakeup = Transports.WakePipe.create()
+        self.data_queue = Transports.SignalledQueue.create(self.wakeup,
+                                                           self.buffer_size)
+        self.control_queue = multiprocessing.Queue()
+
+    def worker(self, control_queue, data_queue):
+        """ Block on the control queue until connected, then read the
+        device as fast as it allows, checking for the disconnect command
+        between reads. Every reading gets a sequence number, including
+        the ones dropped on overflow, so the reader can count them.
+        """
+        self.device = None
+        self.sequence = 0
+        self.history_sent = None
+        if self.instruments is not None:
+            self.instruments.attach_worker(self)
+        streaming = False
+
+        while True:
+            try:
+                command = control_queue.get(block=not streaming)
+            except Queue.Empty:
+                command = None
+
+            if command == "CONNECT":
+                log.info("Stream Setup: %s", self.device_type)
+                self.device = self.create_device()
+                self.device.connect()
+                self.open_recorder()
+                data_queue.put("connect_successful")
+                streaming = True
+
+            elif command == "DISCONNECT":
+                self.device.disconnect()
+                self.close_recorder()
+                data_queue.put("disconnect_successful")
+                break
+
+            elif command == "RESYNC":
+                self.history_sent = None
+
+            elif command == "ACQUIRE_FULL":
+                # Tagged so the reader can tell it from streamed frames,
+                # and never dropped on overflow
+                data_queue.put(("full", self.acquire(full=True)))
+
+            if streaming:
+                frame = self.acquire()
+                with Tracing.span("data put", "queue"):
+                    self.offer(data_queue, frame)
+
+        Tracing.close_worker()
+
+    def offer(self, data_queue, frame):
+        """ Put the frame on the data queue according to the overflow
+        policy.
+        """
+        if self.overflow == "block":
+            data_queue.put(frame)
+            return
+
+        try:
+            data_queue.put_nowait(frame)
+            return
+        except Queue.Full:
+            pass
+
+        if self.overflow == "drop-oldest":
+            try:
+                oldest = data_queue.get_nowait()
+                if isinstance(oldest, Frame):
+                    self.transport.discard(oldest.data)
+                    data_queue.put_nowait(frame)
+                    return
+
+                # Never discard a command response
+                data_queue.put(oldest)
+            except (Queue.Empty, Queue.Full):
+                log.debug("Buffer changed during drop-oldest")
+
+        self.transport.discard(frame.data)
+
+    def count_skipped(self, frame):
+        """ Return how many readings were skipped before this frame.
+        """
+        skipped = frame.sequence - self.last_sequence - 1
+        self.last_sequence = frame.sequence
+        return skipped
+
+    def read(self):
+        """ Return the newest frame in the buffer or None if it is empty.
+        Everything older is discarded and counted in frames_skipped.
+        """
+        frame = self.read_frame()
+        if frame is None:
+            return None
+        return frame.data
+
+    def read_frame(self):
+        """ Like read, but return the whole Frame.
+        """
+        newest = None
+        while True:
+            try:
+                frame = self.data_queue.get_nowait()
+            except Queue.Empty:
+                break
+
+            if newest is not None:
+                self.skip_frame(newest)
+            newest = frame
+
+        if newest is None:
+            return None
+
+        self.frames_skipped = self.count_skipped(newest)
+        self.total_skipped += self.frames_skipped
+        return self.unpack_frame(newest)
+
+    def skip_frame(self, frame):
+        """ Drop a frame the reader has no use for. History deltas are
+        still applied, or the history would have a gap.
+        """
+        if isinstance(frame.data, Buffers.HistoryDelta):
+            self.unpack_frame(frame)
+        else:
+            self.transport.discard(frame.data)
+
+    def read_async(self):
+        """ Return a PendingRead that completes with the newest frame.
+        The first poll is made straight away to start the read.
+        """
+        pending = PendingRead(self.read_frame, wakeup=self.wakeup)
+        pending.poll()
+        return pending
+
+    def read_full(self):
+        """ Blocking full resolution read. The worker reads one frame
+        without decimating it between streamed frames. Streamed frames
+        that arrive first are dropped and counted in frames_skipped, like
+        read().
+        """
+        self.control_queue.put("ACQUIRE_FULL")
+        while True:
+            item = self.data_queue.get()
+            if isinstance(item, tuple) and item[0] == "full":
+                break
+            self.skip_frame(item)
+
+        frame = item[1]
+        self.frames_skipped = self.count_skipped(frame)
+        self.total_skipped += self.frames_skipped
+        return self.unpack_frame(frame)
+
+    def read_many(self, max_frames=100, timeout=1.0):
+        """ Take up to max_frames buffered frames in arrival order,
+        waiting up to timeout seconds for the first one. Frames the worker
+        dropped on overflow are counted in frames_skipped. Returns
+        (None, None) if nothing arrived in time. The frames are at the
+        resolution they were streamed at.
+        """
+        frames = []
+        stamps = []
+        skipped = 0
+        deadline = time.time() + timeout
+        while len(frames) < max_frames:
+            wait = deadline - time.time()
+            try:
+                if frames or wait <= 0:
+                    frame = self.data_queue.get_nowait()
+                else:
+                    frame = self.data_queue.get(timeout=wait)
+            except Queue.Empty:
+                break
+
+            skipped += self.count_skipped(frame)
+            frame = self.unpack_frame(frame)
+            frames.append(numpy.ravel(frame.data).copy())
+            stamps.append(frame.timestamp)
+
+        self.frames_skipped = skipped
+        self.total_skipped += skipped
+        if not frames:
+            return (None, None)
+
+        return (numpy.vstack(frames), numpy.array(stamps))
+
+
+DEFAULT_ENDPOINT = "ipc:///tmp/bluegraph-device"
+
+def device_topic(device_id):
+    """ zmq subscriptions match by prefix, so the topic ends in a null
+    to keep "X" from also receiving "XY".
+    """
+    return "%s\0" % device_id
+
+class DeviceServer(object):
+    """ Run a device in its own process and publish every reading on a
+    zmq PUB socket, so any number of SubscriberInterface consumers can
+    share one physical device. Each message has three parts: the device
+    id topic, see device_topic(), a small json header and the raw frame
+    buffer, a copy of the reading that zmq sends without copying again.
+    Requires pyzmq, which is imported in the server process only.
+    """
+    def __init__(self, device_type="Simulation.SimulatedSpectra",
+                 endpoint=DEFAULT_ENDPOINT, device_id=None,
+                 statistics=DEFAULT_STATISTICS, device_kwargs=None):
+        super(DeviceServer, self).__init__()
+        self.device_type = device_type
+        self.device_kwargs = device_kwargs
+        self.endpoint = endpoint
+        if device_id is None:
+            device_id = device_type
+        self.device_id = device_id
+        self.statistics = statistics
+
+        self.stop_event = multiprocessing.Event()
+        self.ready_event = multiprocessing.Event()
+
+        mp = multiprocessing.Process
+        args = (self.stop_event, self.ready_event)
+        self.process = mp(target=self.worker, args=args)
+
+    def start(self, timeout=5.0):
+        """ Start the publishing process, wait until it is bound and the
+        device is connected.
+        """
+        self.process.start()
+        return self.ready_event.wait(timeout)
+
+    def stop(self):
+        """ Signal the publishing process to exit and wait for it.
+        """
+        self.stop_event.set()
+        self.process.join()
+        return True
+
+    def worker(self, stop_event, ready_event):
+        """ Bind the socket, then read and publish until stopped.
+        """
+        import zmq
+
+        context = zmq.Context()
+        socket = context.socket(zmq.PUB)
+        socket.bind(self.endpoint)
+
+        device = create_device(self.device_type, self.device_kwargs)
+        device.connect()
+        log.info("Publish %s on %s", self.device_type, self.endpoint)
+        ready_event.set()
+
+        sequence = 0
+        while not stop_event.is_set():
+            # zmq sends the buffer after send_multipart returns, and a
+            # device may reuse it, like a HistoryRing view
+            data = numpy.array(device.read(), copy=True)
+            header = {"device_id": self.device_id,
+                      "sequence": sequence,
+                      "timestamp": Timing.monotonic(),
+                      "dtype": data.dtype.str,
+                      "shape": data.shape,
+                      "stats": None,
+                     }
+            if self.statistics is not None:
+                header["stats"] = self.statistics.compute(data)
+            parts = [device_topic(self.device_id), json.dumps(header), data]
+            socket.send_multipart(parts, copy=False)
+            sequence += 1
+
+        device.disconnect()
+        socket.close(linger=0)
+        context.term()
+
+class SubscriberInterface(object):
+    """ Consume frames published by a DeviceServer with the same
+    connect/read/disconnect API as the other wrappers. read() never
+    blocks, returning the newest frame as a numpy view on the received
+    message buffer, or None. Frames that were skipped over or lost in
+    transit are counted in frames_skipped.
+    """
+    def __init__(self, endpoint=DEFAULT_ENDPOINT, device_id=None):
+        super(SubscriberInterface, self).__init__()
+        self.endpoint = endpoint
+        self.device_id = device_id
+        self.header = None
+        self.frames_skipped = 0
+        self.total_skipped = 0
+
+    def connect(self):
+        """ Subscribe to the endpoint, filtered by device id if one was
+        given.
+        """
+        import zmq
+        self.zmq = zmq
+
+        self.context = zmq.Context.instance()
+        self.socket = self.context.socket(zmq.SUB)
+        topic = ""
+        if self.device_id is not None:
+            topic = device_topic(self.device_id)
+        self.socket.setsockopt(zmq.SUBSCRIBE, topic)
+        self.socket.connect(self.endpoint)
+        return True
+
+    def read(self):
+        """ Drain all waiting messages and return the newest frame.
+        """
+        frame = self.read_frame()
+        if frame is None:
+            return None
+        return frame.data
+
+    def read_frame(self):
+        """ Like read, but return the whole Frame built from the header.
+        """
+        newest = None
+        while True:
+            try:
+                parts = self.socket.recv_multipart(self.zmq.NOBLOCK,
+                                                   copy=False)
+            except self.zmq.Again:
+                break
+            newest = parts
+
+        if newest is None:
+            return None
+
+        header = json.loads(newest[1].bytes)
+        skipped = 0
+        if self.header is not None:
+            skipped = header["sequence"] - self.header["sequence"] - 1
+            skipped = max(skipped, 0)
+        self.header = header
+        newest = newest[2]
+
+        self.frames_skipped = skipped
+        self.total_skipped += skipped
+        data = numpy.frombuffer(newest, dtype=self.header["dtype"])
+        data = data.reshape(self.header["shape"])
+        return Frame(data, header["sequence"], header["timestamp"],
+                     header["device_id"], header["stats"])
+
+    def read_async(self):
+        """ Return a PendingRead that completes with the next frame.
+        The first poll is made straight away to start the read.
+        """
+        pending = PendingRead(self.read_frame)
+        pending.poll()
+        return pending
+
+    def disconnect(self):
+        """ Close the subscription socket.
+        """
+        self.socket.close(linger=0)
+        return True
+
+class DeviceHost(object):
+    """ Run many devices in a single worker process. Each device gets its
+    own thread in the host process, so a slow device does not hold up
+    the others, and all readings come back on one shared data queue
+    tagged with the device id. Create HostedInterface proxies to use it.
+    The host process starts with the first connected device and exits
+    when the last one disconnects.
+
+    A command that gets no response within command_timeout seconds, for
+    example because the host process died, raises IOError.
+    """
+    shared_host = None
+    command_timeout = 30.0
+
+    @classmethod
+    def shared(cls):
+        """ Return the process wide default host.
+        """
+        if cls.shared_host is None:
+            cls.shared_host = cls()
+        return cls.shared_host
+
+    def __init__(self):
+        super(DeviceHost, self).__init__()
+        self.control_queue = multiprocessing.Queue()
+        self.data_queue = None
+        self.process = None
+
+        # Shared by every hosted device while the host runs, see wakeup_fd()
+        self.wakeup = None
+
+        self.next_id = 0
+        self.connected = set()
+        self.latest = {}
+        self.status = {}
+
+    def register(self):
+        """ Reserve a device id for a new proxy.
+        """
+        device_id = self.next_id
+        self.next_id += 1
+        return device_id
+
+    def connect(self, device_id, device_type, interval=0.0,
+                statistics=DEFAULT_STATISTICS, device_kwargs=None,
+                plot_width=0):
+        """ Create and connect the device in the host process, starting
+        the host process if required.
+        """
+        if self.process is None:
+            self.start()
+
+        command = ("CONNECT", device_id, device_type, interval, statistics,
+                   device_kwargs, plot_width)
+        self.connected.add(device_id)
+        result = self.queue_command(command, "connect_successful")
+        if not result:
+            # The device thread waits to be told to exit
+            self.disconnect(device_id)
+        return result
+
+    def start(self):
+        """ Start the host process, with a new wakeup pipe and the data
+        queue that sets it.
+        """
+        self.wakeup = Transports.WakePipe.create()
+        self.data_queue = Transports.SignalledQueue.create(self.wakeup)
+
+        mp = multiprocessing.Process
+        args = (self.control_queue, self.data_queue)
+        self.process = mp(target=self.worker, args=args)
+        self.process.start()
+
+    def stop(self):
+        """ Stop the host process and close its wakeup pipe.
+        """
+        self.control_queue.put(("STOP", None))
+        self.process.join()
+        self.process = None
+
+        if self.wakeup is not None:
+            self.wakeup.close()
+            self.wakeup = None
+
+    def disconnect(self, device_id):
+        """ Disconnect the device. Stop the host process when no devices
+        remain.
+        """
+        command = ("DISCONNECT", device_id)
+        result = self.queue_command(command, "disconnect_successful")
+        self.connected.discard(device_id)
+        self.latest.pop(device_id, None)
+
+        if not self.connected:
+            self.stop()
+        return result
+
+    def acquire(self, device_id):
+        """ Ask the device for one more reading.
+        """
+        self.control_queue.put(("ACQUIRE", device_id))
+
+    def set_plot_width(self, device_id, width):
+        """ Decimate the readings of a connected device to a min/max
+        envelope of width pixels, see BlockingInterface.set_plot_width.
+        """
+        self.control_queue.put(("PLOT_WIDTH", device_id, int(width)))
+
+    def resync(self, device_id):
+        """ Have the next frame of a history device carry its full
+        history.
+        """
+        self.control_queue.put(("RESYNC", device_id))
+
+    def take(self, device_id):
+        """ Return the newest Frame for the device, or None.
+        """
+        self.dispatch()
+        return self.latest.pop(device_id, None)
+
+    def dispatch(self, block=False, timeout=None):
+        """ Route everything waiting on the shared data queue to its
+        device. With block, wait up to timeout seconds for at least one
+        item.
+        """
+        while True:
+            try:
+                if block:
+                    item = self.data_queue.get(timeout=timeout)
+                    block = False
+                else:
+                    item = self.data_queue.get_nowait()
+            except Queue.Empty:
+                return
+
+            (device_id, kind, payload) = item
+            if kind == "frame":
+                self.latest[device_id] = payload
+            else:
+                self.status[device_id] = payload
+
+    def queue_command(self, command, success):
+        """ Issue a command for one device and wait for its response,
+        routing readings for other devices while waiting.
+        """
+        device_id = command[1]
+        self.control_queue.put(command)
+        deadline = Timing.monotonic() + self.command_timeout
+        while device_id not in self.status:
+            remaining = deadline - Timing.monotonic()
+            if remaining <= 0:
+                raise IOError("No response from the device host to %s"
+                              % (command[:2],))
+            self.dispatch(block=True, timeout=remaining)
+
+        status = self.status.pop(device_id)
+        if status == success:
+            return True
+
+        log.critical("Command %s problem: %s", command, status)
+        return False
+
+    def worker(self, control_queue, data_queue):
+        """ Host process main loop. Hand commands to the per device
+        threads until the stop command is received.
+        """
+        devices = {}
+        while True:
+            command = control_queue.get()
+            (name, device_id) = command[:2]
+
+            if name == "CONNECT":
+                (device_type, interval, statistics, kwargs,
+                 plot_width) = command[2:]
+                log.info("Host Setup %s: %s", device_id, device_type)
+                requests = Queue.Queue()
+                args = (device_id, device_type, interval, statistics,
+                        requests, data_queue, kwargs, plot_width)
+                thread = threading.Thread(target=self.device_loop,
+                                          args=args)
+                thread.daemon = True
+                thread.start()
+                devices[device_id] = (thread, requests)
+
+            elif name == "STOP":
+                break
+
+            elif device_id not in devices:
+                # A late command for a disconnected device must not stop
+                # the host, a repeated disconnect still gets its answer
+                log.warning("Host ignores %s for unknown device %s",
+                            name, device_id)
+                if name == "DISCONNECT":
+                    data_queue.put((device_id, "status",
+                                    "disconnect_successful"))
+
+            elif name == "ACQUIRE":
+                devices[device_id][1].put("ACQUIRE")
+
+            elif name == "PLOT_WIDTH":
+                devices[device_id][1].put(("PLOT_WIDTH", command[2]))
+
+            elif name == "RESYNC":
+                devices[device_id][1].put("RESYNC")
+
+            elif name == "DISCONNECT":
+                (thread, requests) = devices.pop(device_id)
+                requests.put("DISCONNECT")
+                thread.join()
+
+    def device_loop(self, device_id, device_type, interval, statistics,
+                    requests, data_queue, device_kwargs=None, plot_width=0):
+        """ Per device thread in the host process. Readings are spaced
+        at least interval seconds apart, and decimated to plot_width
+        like those of a BlockingInterface. History devices send the
+        HistoryDelta since the last frame, and the full history after a
+        RESYNC. A device that fails to connect reports connect_failed and
+        waits to be disconnected.
+        """
+        try:
+            device = create_device(device_type, device_kwargs)
+            device.connect()
+            status = "connect_successful"
+        except Exception as exc:
+            log.exception("Host device %s failed: %s", device_id, device_type)
+            device = None
+            status = "connect_failed: %r" % exc
+        data_queue.put((device_id, "status", status))
+
+        last_read = 0
+        sequence = 0
+        history_sent = None
+        while True:
+            command = requests.get()
+            if isinstance(command, tuple) and command[0] == "PLOT_WIDTH":
+                plot_width = command[1]
+                continue
+
+            if command == "RESYNC":
+                history_sent = None
+                continue
+
+            if command == "DISCONNECT":
+                if device is not None:
+                    device.disconnect()
+                data_queue.put((device_id, "status", "disconnect_successful"))
+                return
+
+            if device is None:
+                continue
+
+            wait = last_read + interval - Timing.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            last_read = Timing.monotonic()
+
+            data = device.read()
+            stamp = Timing.monotonic()
+            stats = None
+            if statistics is not None:
+                stats = statistics.compute(data)
+
+            x = None
+            history = getattr(device, "history", None)
+            if isinstance(history, Buffers.HistoryRing):
+                # A copy, the ring changes while the frame is being sent
+                data = history.since(history_sent)
+                history_sent = history.total
+
+            elif plot_width:
+                (x, data) = Processing.min_max_envelope(data, plot_width)
+
+            frame = Frame(data, sequence, stamp, device_id, stats, x)
+            data_queue.put((device_id, "frame", frame))
+            sequence += 1
+
+class HostedInterface(object):
+    """ Lightweight proxy for one device running in a DeviceHost, with
+    the same non blocking read semantics as NonBlockingInterface. Uses
+    the shared default host unless one is given. Hosted devices cannot be
+    recorded, giving a recorder raises ValueError.
+    """
+    def __init__(self, device_type="Simulation.SimulatedDevice",
+                 host=None, interval=0.0, statistics=DEFAULT_STATISTICS,
+                 device_kwargs=None, recorder=None):
+        super(HostedInterface, self).__init__()
+        if recorder is not None:
+            raise ValueError("Hosted %s cannot be recorded" % device_type)
+        if host is None:
+            host = DeviceHost.shared()
+
+        self.device_type = device_type
+        self.device_kwargs = device_kwargs
+        self.interval = interval
+        self.statistics = statistics
+        self.host = host
+        self.device_id = host.register()
+        self.acquire_sent = False
+        self.plot_width = 0
+
+        # Reader side copy of a history device
+        self.history = None
+        self.resync_sent = False
+
+    @property
+    def wakeup(self):
+        """ The wakeup pipe of the host, only there while it runs.
+        """
+        return self.host.wakeup
+
+    def connect(self):
+        """ Connect the device in the host. Raise IOError if it could not
+        be created or connected.
+        """
+        result = self.host.connect(self.device_id, self.device_type,
+                                   self.interval, self.statistics,
+                                   self.device_kwargs, self.plot_width)
+        if not result:
+            raise IOError("Hosted %s failed to connect" % self.device_type)
         return result
 
+    def read(self):
+        """ Request a reading if none is outstanding, then return the
+        newest reading for this device or None.
+        """
+        frame = self.read_frame()
+        if frame is None:
+            return None
+        return frame.data
+
+    def read_frame(self):
+        """ Like read, but return the whole Frame.
+        """
+        if not self.acquire_sent:
+            self.host.acquire(self.device_id)
+            self.acquire_sent = True
+
+        frame = self.host.take(self.device_id)
+        if frame is not None:
+            self.acquire_sent = False
+            if isinstance(frame.data, Buffers.HistoryDelta):
+                frame.data = self.apply_delta(frame.data)
+        return frame
+
+    def apply_delta(self, delta):
+        """ Add the delta to the reader side history and return a view
+        of it, see BlockingInterface.apply_delta.
+        """
+        history = self.history
+        if history is None or history.capacity != delta.capacity:
+            history = Buffers.HistoryRing(delta.capacity,
+                                          delta.values.dtype)
+            self.history = history
+
+        if delta.full:
+            self.resync_sent = False
+        if not history.apply(delta) and not self.resync_sent:
+            log.debug("Hosted history gap at %s, resync", delta.start)
+            self.host.resync(self.device_id)
+            self.resync_sent = True
+        return history.view()
 
+    def read_async(self):
+        """ Return a PendingRead driven by the non blocking read.
+        The first poll is made straight away to start the read.
+        """
+        pending = PendingRead(self.read_frame, wakeup=self.wakeup)
+        pending.poll()
+        return pending
+
+    def set_plot_width(self, width):
+        """ Decimate readings to a min/max envelope for a plot of width
+        pixels, in the host. Use 0 to send full resolution readings.
+        """
+        self.plot_width = int(width)
+        if self.device_id in self.host.connected:
+            self.host.set_plot_width(self.device_id, self.plot_width)
+
+    def disconnect(self):
+        self.acquire_sent = False
+        return self.host.disconnect(self.device_id)
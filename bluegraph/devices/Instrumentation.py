@@ -0,0 +1,162 @@
+""" Optional timing and queue depth statistics for the device wrappers.
+Nothing here runs unless a wrapper is created with instrument=True, the
+timed methods are only bound onto the instances that ask for them.
+"""
+
+import sys
+import logging
+
+from bluegraph.devices import Timing
+from bluegraph.devices import Transports
+
+log = logging.getLogger(__name__)
+
+# multiprocessing.Queue.qsize raises NotImplementedError on OS X
+QSIZE_WORKS = sys.platform != "darwin"
+
+def has_depth(queue):
+    """ Whether queue.qsize() works. The Transports queues count their
+    items themselves, so they always have a depth.
+    """
+    if QSIZE_WORKS:
+        return True
+    return isinstance(queue, (Transports.SignalledQueue,
+                              Transports.DequeHandoff))
+
+class Metric(object):
+    """ Count, mean and maximum of one measurement since the last reset.
+    """
+    def __init__(self):
+        super(Metric, self).__init__()
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        if value > self.maximum:
+            self.maximum = value
+
+    def summary(self):
+        mean = 0.0
+        if self.count:
+            mean = self.total / self.count
+        return {"count": self.count, "mean": mean, "max": self.maximum}
+
+class WrapperStats(object):
+    """ Measure where the time goes for one device wrapper:
+
+    command_wait  seconds queue_command waited for the worker
+    read_wait     seconds read_frame took, including the queue wait
+    worker        seconds the worker spent producing each frame
+    age           seconds from the worker reading a frame to its return
+    control_depth, data_depth  queue lengths sampled after each read
+
+    Every log_interval seconds a summary line is logged and the
+    statistics start over, use 0 to never log. On OS X only the depths
+    of the Transports queues are sampled, see has_depth().
+
+    The stats hold no functions, so they can be pickled for a worker
+    process. The timed methods are bound onto the interface in each
+    process once its side is running, see attach() and attach_worker().
+    """
+    names = ("command_wait", "read_wait", "worker", "age",
+             "control_depth", "data_depth")
+
+    def __init__(self, name, log_interval=5.0):
+        super(WrapperStats, self).__init__()
+        self.name = name
+        self.log_interval = log_interval
+        self.metrics = dict((metric, Metric()) for metric in self.names)
+        self.last_log = Timing.monotonic()
+
+    def attach(self, interface):
+        """ Reader side. Bind timed versions of the interface methods
+        onto the instance, wrapping whatever the class provides. Call it
+        after the worker has started, so the worker never gets them.
+        """
+        interface.queue_command = self.timed_command(interface.queue_command)
+        interface.read_frame = self.timed_read(interface, interface.read_frame)
+
+    def attach_worker(self, interface):
+        """ Worker side. Bind the timed acquire, from the running worker.
+        """
+        interface.acquire = self.timed_acquire(interface.acquire)
+
+    def timed_command(self, queue_command):
+        metric = self.metrics["command_wait"]
+        def timed_queue_command(command, success):
+            start = Timing.monotonic()
+            result = queue_command(command, success)
+            metric.add(Timing.monotonic() - start)
+            return result
+        return timed_queue_command
+
+    def timed_read(self, interface, read_frame):
+        metric = self.metrics["read_wait"]
+        def timed_read_frame():
+            start = Timing.monotonic()
+            frame = read_frame()
+            metric.add(Timing.monotonic() - start)
+            self.sample(interface, frame)
+            return frame
+        return timed_read_frame
+
+    def timed_acquire(self, acquire):
+        """ Worker side. The duration travels back on the frame.
+        """
+        def timed_acquire(*args, **kwargs):
+            start = Timing.monotonic()
+            frame = acquire(*args, **kwargs)
+            frame.worker_time = Timing.monotonic() - start
+            return frame
+        return timed_acquire
+
+    def sample(self, interface, frame):
+        """ Record the frame timings and queue depths after a read, and
+        log the summary when it is due.
+        """
+        if frame is not None:
+            if frame.timestamp is not None:
+                self.metrics["age"].add(frame.age())
+            if frame.worker_time is not None:
+                self.metrics["worker"].add(frame.worker_time)
+
+        for (metric, queue) in (("control_depth", interface.control_queue),
+                                ("data_depth", interface.data_queue)):
+            if has_depth(queue):
+                self.metrics[metric].add(queue.qsize())
+
+        if self.log_interval and \
+                Timing.monotonic() - self.last_log >= self.log_interval:
+            log.info(self.format())
+            self.reset()
+
+    def summary(self):
+        """ Return the count, mean and max of every measurement.
+        """
+        return dict((name, metric.summary())
+                    for (name, metric) in self.metrics.items())
+
+    def format(self):
+        """ One line summary, times in ms as mean/max.
+        """
+        summary = self.summary()
+        parts = [self.name]
+        for name in ("command_wait", "read_wait", "worker", "age"):
+            parts.append("%s %.1f/%.1f ms" % (name,
+                                              summary[name]["mean"] * 1e3,
+                                              summary[name]["max"] * 1e3))
+        for name in ("control_depth", "data_depth"):
+            parts.append("%s %.1f/%d" % (name, summary[name]["mean"],
+                                         summary[name]["max"]))
+        return ", ".join(parts)
+
+    def reset(self):
+        for metric in self.metrics.values():
+            metric.reset()
+        self.last_log = Timing.monotonic()
@@ -10,6 +10,7 @@ import multiprocessing
 
 from collections import deque
 
+from bluegraph.devices import Buffers
 from bluegraph.devices import Simulation
 
 from phidgeter.temperature import IRSensor
@@ -24,7 +25,7 @@ class IRHistory(object):
         log.debug("IR History Phidgeter wrapper")
         self.connected = False
         self.size = size
-        self.history = deque()
+        self.history = Buffers.HistoryRing(size)
 
     def connect(self):
         """ Establish connection to actual phidget hardware.
@@ -35,16 +36,12 @@ class IRHistory(object):
         return self.connected
 
     def read(self):
-        """ Get actual data from the phidget device.
+        """ Get actual data from the phidget device. Return a view of the
+        history ring, valid until the next read, copy it to keep it.
         """
         result = self.sensor.get_temperature()
         self.history.append(result)
-
-        if len(self.history) > self.size:
-            self.history.popleft()
-
-        #print("History is %s", self.history)
-        return self.history
+        return self.history.view()
 
     def disconnect(self):
         """ Close the connection to the phidget hardware.
@@ -0,0 +1,95 @@
+""" Processing stages applied to readings in the device worker, before
+they are sent to the controller.
+"""
+
+import numpy
+import logging
+
+log = logging.getLogger(__name__)
+
+class FrameStatistics(object):
+    """ Summary statistics computed in the worker and attached to each
+    Frame, so the GUI thread only has to format them. stats is any of
+    the names in available. Values at or above saturation are counted
+    as saturated.
+    """
+    available = ("min", "max", "mean", "argmin", "argmax", "saturated")
+
+    def __init__(self, stats=("min", "max", "mean", "argmax", "saturated"),
+                 saturation=65535):
+        super(FrameStatistics, self).__init__()
+        for name in stats:
+            if name not in self.available:
+                raise ValueError("Unknown statistic: %s" % name)
+
+        self.stats = tuple(stats)
+        self.saturation = saturation
+
+    def compute(self, data):
+        """ Return a dict of the configured statistics as python numbers.
+        Each of argmin, argmax, mean and the saturated count is its own
+        numpy pass over the data, up to four in all. numpy has no single
+        reduction for them, and reducing cache sized blocks with every
+        statistic in turn measured no faster on frames of 1k to 4M
+        values, so the passes are kept and made as few as possible: min
+        and max come from the arg positions, and the saturated count is
+        skipped when the maximum is below saturation.
+        """
+        flat = numpy.ravel(numpy.asarray(data))
+        result = {}
+        if flat.size == 0:
+            return result
+
+        stats = self.stats
+        if "min" in stats or "argmin" in stats:
+            position = int(flat.argmin())
+            self.store(result, "argmin", position)
+            self.store(result, "min", flat[position].item())
+
+        highest = None
+        if "max" in stats or "argmax" in stats:
+            position = int(flat.argmax())
+            highest = flat[position].item()
+            self.store(result, "argmax", position)
+            self.store(result, "max", highest)
+
+        if "mean" in stats:
+            result["mean"] = flat.mean().item()
+
+        if "saturated" in stats:
+            saturated = 0
+            if highest is None or highest >= self.saturation:
+                saturated = numpy.count_nonzero(flat >= self.saturation)
+            result["saturated"] = int(saturated)
+
+        return result
+
+    def store(self, result, name, value):
+        if name in self.stats:
+            result[name] = value
+
+def min_max_envelope(data, width):
+    """ Reduce a 1-D reading to the minimum and maximum of width equal
+    bins, interleaved, which draws the same as the full reading on a
+    plot width pixels wide. Return (x, envelope) where x holds the pixel
+    index at the center of each bin, or (None, data) when the reading is
+    already small enough to plot as-is.
+    """
+    if width <= 0:
+        return (None, data)
+
+    flat = numpy.ravel(numpy.asarray(data))
+    total = flat.size
+    if total <= 2 * width:
+        return (None, data)
+    data = flat
+
+    edges = numpy.linspace(0, total, width + 1).astype(numpy.intp)
+    starts = edges[:-1]
+    envelope = numpy.empty(2 * width, dtype=data.dtype)
+    envelope[0::2] = numpy.minimum.reduceat(data, starts)
+    envelope[1::2] = numpy.maximum.reduceat(data, starts)
+
+    centers = (starts + edges[1:] - 1) / 2.0
+    x = numpy.repeat(centers, 2)
+    return (x, envelope)
@@ -0,0 +1,117 @@
+""" Look up device classes by name, like "Simulation.SimulatedSpectra",
+without eval. Built-in modules in bluegraph.devices and drivers
+installed under the "bluegraph.devices" setuptools entry point group are
+only imported the first time a device from them is created.
+
+An out of tree driver registers itself in its own setup.py with:
+
+    entry_points={"bluegraph.devices":
+                  ["Acme.Camera = acme_bluegraph.camera:Camera"]}
+"""
+
+import logging
+import importlib
+
+log = logging.getLogger(__name__)
+
+ENTRY_POINT_GROUP = "bluegraph.devices"
+
+class DeviceRegistry(object):
+    """ Resolve device names to factories and cache them. A name is
+    looked up in the explicitly registered factories, then in the
+    bluegraph.devices package, then in the installed entry points.
+    """
+    def __init__(self, package="bluegraph.devices",
+                 group=ENTRY_POINT_GROUP):
+        super(DeviceRegistry, self).__init__()
+        self.package = package
+        self.group = group
+
+        self.factories = {}
+        self.registered = {}
+        self._entry_points = None
+
+    def register(self, name, factory):
+        """ Make name create devices with factory, a callable or a
+        "module.path:Class" string that is imported on first use.
+        """
+        self.registered[name] = factory
+        self.factories.pop(name, None)
+
+    def create(self, name, *args, **kwargs):
+        """ Create the device called name, passing the arguments on to
+        its constructor unchanged.
+        """
+        return self.resolve(name)(*args, **kwargs)
+
+    def resolve(self, name):
+        """ Return the cached factory for name, importing it if this is
+        the first time it is used.
+        """
+        try:
+            return self.factories[name]
+        except KeyError:
+            pass
+
+        if name in self.registered:
+            factory = self.registered[name]
+            if isinstance(factory, basestring):
+                factory = self.load_path(factory)
+        else:
+            factory = self.load_builtin(name)
+
+        log.debug("Resolved %s to %s", name, factory)
+        self.factories[name] = factory
+        return factory
+
+    def load_builtin(self, name):
+        """ Import Module.Class from the package, falling back to the
+        entry points if there is no such built-in module.
+        """
+        (module_name, class_name) = name.rsplit(".", 1)
+        try:
+            module = importlib.import_module("%s.%s" % (self.package,
+                                                        module_name))
+        except ImportError:
+            entry_point = self.entry_points().get(name)
+            if entry_point is None:
+                raise
+            return entry_point.load()
+
+        try:
+            return getattr(module, class_name)
+        except AttributeError:
+            raise ValueError("No device %s in %s" % (class_name,
+                                                     module.__name__))
+
+    def load_path(self, path):
+        """ Import a "module.path:Class" string.
+        """
+        (module_name, class_name) = path.split(":")
+        module = importlib.import_module(module_name)
+        return getattr(module, class_name)
+
+    def entry_points(self):
+        """ Map names to the installed entry points. Only the package
+        metadata is read here, the driver modules are imported by
+        load().
+        """
+        if self._entry_points is None:
+            self._entry_points = {}
+            try:
+                import pkg_resources
+            except ImportError:
+                log.warn("setuptools unavailable, no device entry points")
+                return self._entry_points
+
+            for entry_point in pkg_resources.iter_entry_points(self.group):
+                self._entry_points[entry_point.name] = entry_point
+        return self._entry_points
+
+    def names(self):
+        """ Registered and installed device names, without importing
+        any of them.
+        """
+        return sorted(set(self.registered) | set(self.entry_points()))
+
+registry = DeviceRegistry()
@@ -11,6 +11,10 @@ import multiprocessing
 from random import randint
 from collections import deque
 
+from bluegraph import recorder
+from bluegraph.devices import Timing
+from bluegraph.devices import Buffers
+
 log = logging.getLogger(__name__)
 
 class SimulatedDevice(object):
@@ -41,33 +45,32 @@ class SimulatedDevice(object):
 
 
 class RegulatedDevice(SimulatedDevice):
-    """ Enforce a minimum time delay for every read.
+    """ Pace reads to rate per second on a Timing.DeadlineScheduler.
+    Each read returns at its deadline, so the first takes a full period.
     """
+    def __init__(self, rate=5.0, policy="skip"):
+        super(RegulatedDevice, self).__init__()
+        self.scheduler = Timing.DeadlineScheduler(rate, policy)
+
     def read(self):
-        cue_time = time.time()
+        self.scheduler.start()
         result = super(RegulatedDevice, self).read()
-        end_time = time.time()
-
-        time_diff = end_time - cue_time
-        if time_diff < 0.2:
-            time.sleep(0.2 - time_diff)
-
+        self.scheduler.wait()
         return result
 
 class StripChartDevice(RegulatedDevice):
-    """ Return a list of readings up to the maximum size. Automatically
-    roll the list when it has been filled.
+    """ Return an array of readings up to the maximum size. Automatically
+    roll the history when it has been filled.
     """
     def __init__(self, size=20):
         super(StripChartDevice, self).__init__()
         self.size = size
-        self.history = deque()
+        self.history = Buffers.HistoryRing(size)
 
     def read(self):
-        """ Read and add to list, then roll.
+        """ Read and add to the history. Return a view of the history
+        ring, valid until the next read, copy it to keep it.
         """
-
-
         result = super(StripChartDevice, self).read()
 
         # This is because numpy.nonuniform noise is not random on multiple
@@ -76,12 +79,7 @@ class StripChartDevice(RegulatedDevice):
         result += more_random
 
         self.history.append(result[0])
-
-        if len(self.history) > self.size:
-            self.history.popleft()
-
-        #print("History is %s", self.history)
-        return self.history
+        return self.history.view()
 
 
 
@@ -111,18 +109,167 @@ class SimulatedSpectra(SimulatedDevice):
         return noise_data
 
 class RegulatedSpectra(SimulatedSpectra):
-    """ Enforce a minimum time delay for every read.
+    """ Pace reads to rate per second, see RegulatedDevice.
     """
+    def __init__(self, pixel_width=1024, rate=5.0, policy="skip"):
+        super(RegulatedSpectra, self).__init__(pixel_width)
+        self.scheduler = Timing.DeadlineScheduler(rate, policy)
+
     def read(self):
-        cue_time = time.time()
+        self.scheduler.start()
         result = super(RegulatedSpectra, self).read()
-        end_time = time.time()
+        self.scheduler.wait()
+        return result
+
+class BankedSpectra(SimulatedSpectra):
+    """ High rate spectra for throughput tests. A bank of noise frames
+    and a bank of spectra with Gaussian and Lorentzian peaks are computed
+    once, then each read adds one of each, so the simulator is not the
+    bottleneck. rate is the target reads per second, 0 for as fast as
+    possible, paced by a Timing.DeadlineScheduler that skips missed
+    deadlines. Integer dtypes are scaled to stay inside their range.
+    """
+    def __init__(self, pixel_width=1024, dtype=numpy.float64, rate=0.0,
+                 noise_frames=61, spectra=8, peaks=6, seed=None,
+                 noise=0.05):
+        super(BankedSpectra, self).__init__(pixel_width)
+        self.dtype = numpy.dtype(dtype)
+        self.rate = rate
+
+        generator = numpy.random.RandomState(seed)
+        if self.dtype.kind in "iu":
+            top = min(numpy.iinfo(self.dtype).max, 65535)
+        else:
+            top = 65535
+        self.top = top
+
+        # Noise up to the noise fraction of the range, peaks in the rest
+        noise_top = top * noise
+        noise = generator.uniform(0, noise_top, (noise_frames, pixel_width))
+        self.noise_bank = noise.astype(self.dtype)
+
+        peak_top = top - noise_top - 1
+        pixels = numpy.arange(pixel_width, dtype=numpy.float64)
+        bank = numpy.zeros((spectra, pixel_width))
+        for spectrum in bank:
+            for peak in range(peaks):
+                center = generator.uniform(0, pixel_width)
+                width = generator.uniform(2, max(3, pixel_width / 50.0))
+                height = generator.uniform(0.1, 1.0)
+                offset = (pixels - center) / width
+                if peak % 2:
+                    spectrum += height / (1.0 + offset ** 2)
+                else:
+                    spectrum += height * numpy.exp(-0.5 * offset ** 2)
+            spectrum *= peak_top / max(spectrum.max(), 1.0)
+        self.spectra_bank = bank.astype(self.dtype)
+
+        self.count = 0
+        self.scheduler = None
+        if rate:
+            self.scheduler = Timing.DeadlineScheduler(rate)
 
-        time_diff = end_time - cue_time
-        if time_diff < 0.2:
-            time.sleep(0.2 - time_diff)
+    def read(self):
+        """ Wait for the next deadline, then combine the next frames of
+        the banks. The bank sizes are coprime by default, so the
+        combinations repeat rarely.
+        """
+        if self.scheduler is not None:
+            self.scheduler.wait()
+        count = self.count
+        self.count += 1
 
-        return result
+        noise = self.noise_bank[count % len(self.noise_bank)]
+        spectrum = self.spectra_bank[count % len(self.spectra_bank)]
+        data = numpy.add(noise, spectrum, dtype=self.dtype)
+
+        # Enforce the first and last for min/max tests
+        data[0] = 100
+        data[-1] = self.top
+        return data
+
+class PlaybackDevice(SimulatedDevice):
+    """ Replay a recording made by the recorder module. Raw recordings
+    are memory mapped and every read returns a read-only view into the
+    file, without copying. speed 1.0 keeps the recorded timing, 10.0
+    plays ten times faster and 0 as fast as possible. With loop the
+    recording starts over at the end, otherwise finished is set and the
+    last frame repeats, paced at the mean recorded frame interval so a
+    reader polling the device does not spin. The interval is scaled by
+    speed, unscaled when unpaced, and at least minimum_hold seconds.
+    """
+    minimum_hold = 0.01
+
+    def __init__(self, path, speed=1.0, loop=True):
+        super(PlaybackDevice, self).__init__()
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+        self.reader = None
+        self.finished = False
+
+    def connect(self):
+        """ Open the recording, in the process that will read it.
+        """
+        self.reader = recorder.open_recording(self.path)
+        if not len(self.reader):
+            raise ValueError("Empty recording: %s" % self.path)
+
+        self.position = 0
+        self.started = None
+        self.hold = self.hold_interval()
+        return super(PlaybackDevice, self).connect()
+
+    def hold_interval(self):
+        """ Seconds between repeats of the last frame once finished.
+        """
+        count = len(self.reader)
+        interval = 0.0
+        if count > 1:
+            recorded = self.reader.timestamp(-1) - self.reader.timestamp(0)
+            interval = recorded / (count - 1)
+        if self.speed:
+            interval /= self.speed
+        return max(interval, self.minimum_hold)
+
+    def disconnect(self):
+        self.reader = None
+        return super(PlaybackDevice, self).disconnect()
+
+    def read(self):
+        """ Wait until the next frame is due, then return it.
+        """
+        if self.position == len(self.reader):
+            if self.loop:
+                self.position = 0
+                self.started = None
+            else:
+                self.finished = True
+                time.sleep(self.hold)
+                return self.reader[-1]
+
+        self.wait(self.position)
+        frame = self.reader[self.position]
+        self.position += 1
+        return frame
+
+    def wait(self, position):
+        """ Sleep until the frame at position is due, relative to the
+        first frame played since the start or the last loop.
+        """
+        if not self.speed:
+            return
+
+        stamp = self.reader.timestamp(position)
+        if self.started is None:
+            self.started = Timing.monotonic()
+            self.first_stamp = stamp
+            return
+
+        due = self.started + (stamp - self.first_stamp) / self.speed
+        delay = due - Timing.monotonic()
+        if delay > 0:
+            time.sleep(delay)
 
 class SimulatedLaserPowerMeter(object):
     """ Provide a Thorlabs pm100usb encapsulation of typical values seen
@@ -0,0 +1,144 @@
+""" Clock helpers shared by the device workers and the controllers.
+"""
+
+import sys
+import time
+import ctypes
+import ctypes.util
+
+def system_monotonic():
+    """ Return a monotonic() function whose readings are comparable
+    between processes on the same machine. Python 2 has no
+    time.monotonic, so use the platform clock directly.
+    """
+    if hasattr(time, "monotonic"):
+        return time.monotonic
+
+    if sys.platform.startswith("linux"):
+        class timespec(ctypes.Structure):
+            _fields_ = [("tv_sec", ctypes.c_long),
+                        ("tv_nsec", ctypes.c_long)]
+
+        libc_name = ctypes.util.find_library("c")
+        clock_gettime = ctypes.CDLL(libc_name).clock_gettime
+        clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+        CLOCK_MONOTONIC = 1
+
+        def linux_monotonic():
+            now = timespec()
+            clock_gettime(CLOCK_MONOTONIC, ctypes.byref(now))
+            return now.tv_sec + now.tv_nsec * 1e-9
+        return linux_monotonic
+
+    if sys.platform == "win32":
+        kernel32 = ctypes.windll.kernel32
+        frequency = ctypes.c_int64()
+        kernel32.QueryPerformanceFrequency(ctypes.byref(frequency))
+        frequency = float(frequency.value)
+
+        def windows_monotonic():
+            counter = ctypes.c_int64()
+            kernel32.QueryPerformanceCounter(ctypes.byref(counter))
+            return counter.value / frequency
+        return windows_monotonic
+
+    return time.time
+
+monotonic = system_monotonic()
+
+class DeadlineScheduler(object):
+    """ Pace a loop to rate calls per second against absolute deadlines
+    on the monotonic clock, so timing error does not accumulate from one
+    call to the next. policy decides what happens after deadlines are
+    missed: "catch-up" runs the missed calls back to back, "skip" drops
+    them and waits for the next deadline still in the future. A call less
+    than a period late is not a miss, it runs straight away. For rates
+    beyond the resolution of time.sleep, spin ends each sleep that many
+    seconds early and busy waits the rest, which holds a cpu and the GIL.
+    """
+    policies = ("catch-up", "skip")
+
+    def __init__(self, rate, policy="skip", spin=0.0, clock=None):
+        super(DeadlineScheduler, self).__init__()
+        if rate <= 0:
+            raise ValueError("Rate must be positive: %s" % rate)
+        if policy not in self.policies:
+            raise ValueError("Unknown missed deadline policy: %s" % policy)
+
+        self.period = 1.0 / rate
+        self.policy = policy
+        self.spin = spin
+        if clock is None:
+            clock = monotonic
+        self.clock = clock
+        self.reset()
+
+    def reset(self):
+        """ Stop the schedule and clear the jitter statistics.
+        """
+        self.deadline = None
+        self.count = 0
+        self.missed = 0
+        self.late_sum = 0.0
+        self.late_squares = 0.0
+        self.late_max = 0.0
+
+    def start(self):
+        """ Start the schedule if it is not running, with the first
+        deadline one period from now.
+        """
+        if self.deadline is None:
+            self.deadline = self.clock() + self.period
+
+    def wait(self):
+        """ Wait for the next deadline and return how late the wake up
+        was, in seconds. The first call starts the schedule and returns
+        straight away.
+        """
+        now = self.clock()
+        if self.deadline is None:
+            self.deadline = now + self.period
+            return 0.0
+
+        # Less than a period late still runs, just late
+        behind = now - self.deadline
+        if behind >= self.period:
+            if self.policy == "skip":
+                # Every deadline up to now, so the next one is in the future
+                skipped = int(behind / self.period) + 1
+                self.deadline += skipped * self.period
+                self.missed += skipped
+            else:
+                self.missed += 1
+
+        remaining = self.deadline - now - self.spin
+        if remaining > 0:
+            time.sleep(remaining)
+        while self.clock() < self.deadline:
+            pass
+
+        late = max(0.0, self.clock() - self.deadline)
+        self.record(late)
+        self.deadline += self.period
+        return late
+
+    def record(self, late):
+        self.count += 1
+        self.late_sum += late
+        self.late_squares += late * late
+        self.late_max = max(self.late_max, late)
+
+    def jitter(self):
+        """ Return the wake up lateness statistics, in seconds. missed
+        is the number of deadlines skipped, or with catch-up the number of
+        calls made a period or more late.
+        """
+        count = max(self.count, 1)
+        mean = self.late_sum / count
+        variance = max(0.0, self.late_squares / count - mean * mean)
+        return {"count": self.count,
+                "mean": mean,
+                "std": variance ** 0.5,
+                "max": self.late_max,
+                "missed": self.missed,
+               }
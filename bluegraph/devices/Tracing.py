@@ -0,0 +1,226 @@
+""" Optional timeline tracing of the acquisition and render pipeline, in
+the Chrome trace event format read by chrome://tracing and Perfetto.
+
+Nothing is recorded until enable() is called. Each process then records
+spans into its own in-memory buffer, which a background thread writes
+to a per-process file next to path. Worker processes forked after
+enable() start their own tracer on first use. merge() combines the
+per-process files into one trace. Times come from Timing.monotonic, so
+spans from different processes line up on the same timeline.
+"""
+
+import os
+import glob
+import json
+import logging
+import threading
+
+from collections import deque
+
+from bluegraph.devices import Timing
+
+log = logging.getLogger(__name__)
+
+class NullSpan(object):
+    """ What span() returns while tracing is disabled.
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+NULL_SPAN = NullSpan()
+
+class Span(object):
+    """ Record a complete event from entering the context to leaving it.
+    """
+    def __init__(self, tracer, name, category):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+
+    def __enter__(self):
+        self.start = Timing.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.tracer.complete(self.name, self.start, Timing.monotonic(),
+                             self.category)
+        return False
+
+class Tracer(object):
+    """ Trace events of one process. Events are appended to a deque,
+    which needs no lock, and a daemon thread writes them out every
+    flush_interval seconds to path.<pid>.events, one JSON event per line.
+    At most capacity events are buffered, when the writer falls behind
+    the oldest are dropped and counted in dropped.
+    """
+    def __init__(self, path, capacity=100000, flush_interval=0.5,
+                 process_name=None):
+        super(Tracer, self).__init__()
+        self.path = path
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.pid = os.getpid()
+        if process_name is None:
+            process_name = "bluegraph %d" % self.pid
+        self.process_name = process_name
+
+        self.events = deque(maxlen=capacity)
+        self.dropped = 0
+        self.filename = "%s.%d.events" % (path, self.pid)
+        self.output = open(self.filename, "w")
+        self.write_metadata()
+
+        self.stop_event = threading.Event()
+        self.writer = threading.Thread(target=self.write_loop)
+        self.writer.daemon = True
+        self.writer.start()
+
+    def write_metadata(self):
+        event = {"name": "process_name", "ph": "M", "pid": self.pid,
+                 "args": {"name": self.process_name}}
+        self.output.write(json.dumps(event) + "\n")
+
+    def span(self, name, category="bluegraph"):
+        return Span(self, name, category)
+
+    def complete(self, name, start, end, category="bluegraph"):
+        """ Record a span from start to end, in Timing.monotonic seconds.
+        """
+        events = self.events
+        if len(events) == self.capacity:
+            self.dropped += 1
+        events.append((name, category, "X", start, end - start,
+                       threading.current_thread().ident))
+
+    def instant(self, name, category="bluegraph"):
+        """ Record a point in time.
+        """
+        events = self.events
+        if len(events) == self.capacity:
+            self.dropped += 1
+        events.append((name, category, "i", Timing.monotonic(), None,
+                       threading.current_thread().ident))
+
+    def write_loop(self):
+        while not self.stop_event.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        """ Write out everything buffered so far.
+        """
+        events = self.events
+        lines = []
+        while events:
+            (name, category, phase, start, duration, tid) = events.popleft()
+            event = {"name": name, "cat": category, "ph": phase,
+                     "ts": start * 1e6, "pid": self.pid, "tid": tid}
+            if duration is None:
+                event["s"] = "t"
+            else:
+                event["dur"] = duration * 1e6
+            lines.append(json.dumps(event))
+
+        if lines:
+            self.output.write("\n".join(lines) + "\n")
+        self.output.flush()
+
+    def close(self):
+        """ Stop the writer and write out the remaining events.
+        """
+        self.stop_event.set()
+        if self.writer is not threading.current_thread():
+            self.writer.join()
+        self.flush()
+        self.output.close()
+        if self.dropped:
+            log.warning("%s trace events dropped, buffer of %s",
+                        self.dropped, self.capacity)
+
+settings = None
+tracer = None
+
+def enable(path, capacity=100000, flush_interval=0.5, process_name=None):
+    """ Start tracing this process, and any worker process it starts, to
+    files named after path.
+    """
+    global settings, tracer
+    disable()
+    settings = (path, capacity, flush_interval, os.getpid())
+    tracer = Tracer(path, capacity, flush_interval, process_name)
+    return tracer
+
+def disable():
+    """ Stop tracing this process and write out its events.
+    """
+    global settings, tracer
+    if tracer is not None and tracer.pid == os.getpid():
+        tracer.close()
+    settings = None
+    tracer = None
+
+def active():
+    """ Return the tracer of this process, or None while tracing is
+    disabled. A forked process inherits the settings but not the writer
+    thread, so it starts a tracer of its own.
+    """
+    global tracer
+    current = tracer
+    if current is None or current.pid == os.getpid():
+        return current
+
+    (path, capacity, flush_interval, enabled_pid) = settings
+    tracer = Tracer(path, capacity, flush_interval)
+    return tracer
+
+def span(name, category="bluegraph"):
+    """ Context manager recording a span when tracing is enabled.
+    """
+    current = active()
+    if current is None:
+        return NULL_SPAN
+    return current.span(name, category)
+
+def complete(name, start, end, category="bluegraph"):
+    current = active()
+    if current is not None:
+        current.complete(name, start, end, category)
+
+def close_worker():
+    """ Worker side. Write out the events of a worker process before it
+    exits, the writer thread does not outlive it. Does nothing in the
+    process that called enable(), for workers running as threads.
+    """
+    global tracer
+    current = tracer
+    if current is not None and current.pid == os.getpid() \
+            and current.pid != settings[3]:
+        current.close()
+        tracer = None
+
+def merge(path, output=None, remove=True):
+    """ Combine the per-process event files of path into one trace at
+    output, path by default. Return the number of events.
+    """
+    if output is None:
+        output = path
+
+    events = []
+    filenames = sorted(glob.glob("%s.*.events" % path))
+    for filename in filenames:
+        with open(filename) as events_file:
+            for line in events_file:
+                line = line.strip()
+                if line:
+                    events.append(json.loads(line))
+
+    with open(output, "w") as trace_file:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"},
+                  trace_file)
+
+    if remove:
+        for filename in filenames:
+            os.remove(filename)
+    return len(events)
@@ -0,0 +1,399 @@
+""" Transports for moving device readings from the worker process to the
+controller side of the device wrappers.
+"""
+
+import os
+import errno
+import numpy
+import Queue
+import cPickle
+import logging
+import threading
+import multiprocessing
+import multiprocessing.util
+
+from collections import deque
+
+from bluegraph.devices import Timing
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None # Windows, where QSocketNotifier can't watch a pipe anyway
+
+log = logging.getLogger(__name__)
+
+class QueueTransport(object):
+    """ Default transport. Readings are placed on the data queue as-is,
+    which means they are pickled by multiprocessing on the way across.
+    """
+    def pack(self, result):
+        """ Called in the worker process before the data queue put.
+        """
+        return result
+
+    def unpack(self, result):
+        """ Called in the controller process after the data queue get.
+        """
+        return result
+
+    def discard(self, result):
+        """ Called on either side for a packed reading that is dropped
+        without being unpacked.
+        """
+        pass
+
+    def release(self):
+        """ Called when the controller side is done with the transport.
+        """
+        pass
+
+class SlotHeader(object):
+    """ The only thing that crosses the data queue for a shared memory
+    frame: which slot it is in and how to view it.
+    """
+    def __init__(self, slot, dtype, shape):
+        self.slot = slot
+        self.dtype = dtype
+        self.shape = shape
+
+class SharedMemoryTransport(QueueTransport):
+    """ Preallocated ring of shared memory frame slots. The worker copies
+    each numpy reading into a free slot and queues a SlotHeader. The
+    controller side returns a numpy view directly on the slot, so the
+    frame is never pickled and never copied on the GUI side.
+
+    A view returned from unpack is only valid until the next unpack, at
+    which point its slot is handed back to the worker. Readings that are
+    not numpy arrays, or do not fit in a slot, fall back to pickling.
+    """
+    def __init__(self, slots=8, slot_bytes=16384 * 8):
+        if slots < 2:
+            raise ValueError("Shared memory ring requires at least 2 slots")
+
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+
+        # Must be created before the worker process is started, so the
+        # memory is inherited rather than pickled
+        self.shared = multiprocessing.RawArray("b", slots * slot_bytes)
+        self.free_slots = multiprocessing.Queue()
+        for slot in range(slots):
+            self.free_slots.put(slot)
+
+        self.held_slot = None
+        self._memory = None
+
+    @property
+    def memory(self):
+        """ Flat uint8 numpy view of the whole ring, created lazily in
+        whichever process asks for it.
+        """
+        if self._memory is None:
+            self._memory = numpy.frombuffer(self.shared, dtype=numpy.uint8)
+        return self._memory
+
+    def slot_view(self, slot, dtype, shape):
+        """ Return a numpy array of dtype and shape backed by the slot.
+        """
+        dtype = numpy.dtype(dtype)
+        nbytes = dtype.itemsize * int(numpy.prod(shape))
+        start = slot * self.slot_bytes
+        raw = self.memory[start:start + nbytes]
+        return raw.view(dtype).reshape(shape)
+
+    def pack(self, result):
+        """ Copy the reading into the next free slot. Blocks if the
+        controller side is holding every slot.
+        """
+        if not isinstance(result, numpy.ndarray):
+            return result
+
+        if result.nbytes > self.slot_bytes:
+            log.debug("Frame of %s bytes exceeds slot size", result.nbytes)
+            return result
+
+        slot = self.free_slots.get()
+        view = self.slot_view(slot, result.dtype, result.shape)
+        view[...] = result
+        return SlotHeader(slot, result.dtype.str, result.shape)
+
+    def unpack(self, result):
+        """ Return the slot view for a header, releasing the previously
+        held slot back to the worker.
+        """
+        if not isinstance(result, SlotHeader):
+            return result
+
+        self.release()
+        self.held_slot = result.slot
+        return self.slot_view(result.slot, result.dtype, result.shape)
+
+    def discard(self, result):
+        """ Return the slot of a dropped frame straight to the free list.
+        """
+        if isinstance(result, SlotHeader):
+            self.free_slots.put(result.slot)
+
+    def release(self):
+        """ Hand the currently held slot back to the worker.
+        """
+        if self.held_slot is not None:
+            self.free_slots.put(self.held_slot)
+            self.held_slot = None
+
+class DequeHandoff(object):
+    """ Queue.Queue work-alike for handing readings between threads of
+    the same process. Items go through a collections.deque, whose append
+    and popleft are atomic, so put and get_nowait take no lock. An event
+    is only waited on by blocking gets that find the deque empty. A
+    WakePipe given as wakeup is set after every put.
+    """
+    def __init__(self, wakeup=None):
+        self.items = deque()
+        self.available = threading.Event()
+        self.wakeup = wakeup
+
+    def put(self, item):
+        self.items.append(item)
+        self.available.set()
+        if self.wakeup is not None:
+            self.wakeup.set()
+
+    put_nowait = put
+
+    def get_nowait(self):
+        try:
+            return self.items.popleft()
+        except IndexError:
+            raise Queue.Empty
+
+    def get(self, block=True, timeout=None):
+        """ Wait for an item, raising Queue.Empty on timeout.
+        """
+        if not block:
+            return self.get_nowait()
+
+        while True:
+            try:
+                return self.items.popleft()
+            except IndexError:
+                pass
+
+            # Clear, then check again, so a put between the two is seen
+            self.available.clear()
+            if self.items:
+                continue
+            if not self.available.wait(timeout) and timeout is not None:
+                raise Queue.Empty
+
+    def qsize(self):
+        return len(self.items)
+
+class WakePipe(object):
+    """ Wake the reader when the worker has put a frame on the data
+    queue, through a pipe the reader can watch with select or a
+    QSocketNotifier instead of polling the queue. The data queue calls
+    set() once each item can be got, see SignalledQueue and
+    DequeHandoff, the woken reader calls clear(). Both ends are non
+    blocking, a full pipe already means the reader will wake. Created
+    before the worker starts, so a forked worker inherits it.
+    """
+    @classmethod
+    def create(cls):
+        """ Return a new WakePipe, or None where pipes can't be made non
+        blocking.
+        """
+        if fcntl is None:
+            return None
+        return cls()
+
+    def __init__(self):
+        super(WakePipe, self).__init__()
+        (self.read_fd, self.write_fd) = os.pipe()
+        for fd in (self.read_fd, self.write_fd):
+            flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+            fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+    def fileno(self):
+        """ The descriptor that becomes readable on set().
+        """
+        return self.read_fd
+
+    def set(self):
+        try:
+            os.write(self.write_fd, b"\0")
+        except OSError as exc:
+            if exc.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                raise
+
+    def clear(self):
+        """ Consume every pending wakeup, return how many there were.
+        """
+        count = 0
+        while True:
+            try:
+                data = os.read(self.read_fd, 4096)
+            except OSError as exc:
+                if exc.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                raise
+            if not data:
+                break
+            count += len(data)
+        return count
+
+    def close(self):
+        for fd in (self.read_fd, self.write_fd):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+class SignalledQueue(object):
+    """ multiprocessing.Queue work-alike that sets wakeup once an item
+    can be got. multiprocessing.Queue.put hands the item to a feeder
+    thread that writes it to the pipe some time later, so a reader woken
+    straight after put() can still find the queue empty. Here the feeder
+    counts each item in ready and sets wakeup as it starts writing it, so
+    a woken reader always gets the item. At most the get waits for the
+    rest of an item larger than the pipe buffer, which the feeder can
+    only finish writing while it is read. Each putting process starts its
+    own feeder on first use, and waits for it to finish writing before it
+    exits.
+    """
+    @classmethod
+    def create(cls, wakeup, maxsize=0):
+        """ Return a SignalledQueue, or a plain multiprocessing.Queue when
+        there is no wakeup to set.
+        """
+        if wakeup is None:
+            return multiprocessing.Queue(maxsize)
+        return cls(wakeup, maxsize)
+
+    def __init__(self, wakeup, maxsize=0):
+        super(SignalledQueue, self).__init__()
+        self.wakeup = wakeup
+        (self.reader, self.writer) = multiprocessing.Pipe(duplex=False)
+        self.read_lock = multiprocessing.Lock()
+        self.write_lock = multiprocessing.Lock()
+        self.size = multiprocessing.Value("i", 0)
+        self.ready = multiprocessing.Value("i", 0)
+
+        self.slots = None
+        if maxsize > 0:
+            self.slots = multiprocessing.BoundedSemaphore(maxsize)
+
+        self.feeder_lock = threading.Lock()
+        self.feeder_pid = None
+        self.buffer = None
+
+    def put(self, item, block=True, timeout=None):
+        """ Queue the item for the feeder, raising Queue.Full if the
+        queue stays full for timeout seconds.
+        """
+        if self.slots is not None and not self.slots.acquire(block, timeout):
+            raise Queue.Full
+
+        with self.size.get_lock():
+            self.size.value += 1
+        self.feeder().put(item)
+
+    def put_nowait(self, item):
+        self.put(item, block=False)
+
+    def get(self, block=True, timeout=None):
+        """ Wait for an item, raising Queue.Empty on timeout. The read
+        lock is only held to take a ready item, never while waiting, so
+        a blocked reader can't hold up the worker taking the oldest
+        item off a full queue.
+        """
+        deadline = None
+        if timeout is not None:
+            deadline = Timing.monotonic() + timeout
+
+        while True:
+            with self.read_lock:
+                if self.ready.value:
+                    data = self.reader.recv_bytes()
+
+                    # Before another reader can see the count
+                    with self.ready.get_lock():
+                        self.ready.value -= 1
+                    break
+
+            if not block:
+                raise Queue.Empty
+            remaining = None
+            if deadline is not None:
+                remaining = max(deadline - Timing.monotonic(), 0)
+            if not self.reader.poll(remaining) and remaining is not None:
+                raise Queue.Empty
+
+        self.release()
+        return cPickle.loads(data)
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def qsize(self):
+        """ Items put and not yet got, including any the feeder has still
+        to write.
+        """
+        return self.size.value
+
+    def feeder(self):
+        """ Return the buffer of this process's feeder thread, starting
+        the thread on first use.
+        """
+        with self.feeder_lock:
+            if self.feeder_pid != os.getpid():
+                self.feeder_pid = os.getpid()
+                self.buffer = Queue.Queue()
+                thread = threading.Thread(target=self.feed,
+                                          args=(self.buffer,))
+                thread.daemon = True
+                thread.start()
+
+                # Like multiprocessing.Queue, flush before the process exits
+                multiprocessing.util.Finalize(self, self.buffer.join,
+                                              exitpriority=10)
+            return self.buffer
+
+    def feed(self, buffer):
+        """ Feeder thread. Pickle each item, count it as ready and set
+        wakeup, then write it to the pipe.
+        """
+        while True:
+            item = buffer.get()
+            try:
+                data = cPickle.dumps(item, cPickle.HIGHEST_PROTOCOL)
+            except Exception:
+                log.exception("Failed to pickle %r", type(item))
+                self.release()
+                buffer.task_done()
+                continue
+
+            try:
+                with self.write_lock:
+                    with self.ready.get_lock():
+                        self.ready.value += 1
+                    self.wakeup.set()
+                    self.writer.send_bytes(data)
+            except Exception:
+                log.exception("Failed to send %r", type(item))
+                with self.ready.get_lock():
+                    self.ready.value -= 1
+                self.release()
+            finally:
+                buffer.task_done()
+
+    def release(self):
+        """ Give back the size count and slot of an item, once it is got
+        or failed to send, so it is not left counted in qsize() or taking
+        a slot of a bounded queue.
+        """
+        with self.size.get_lock():
+            self.size.value -= 1
+        if self.slots is not None:
+            self.slots.release()
@@ -10,6 +10,7 @@ from PySide import QtCore, QtGui
 
 from bluegraph import views
 from bluegraph import utils
+from bluegraph.devices import Processing
 from bluegraph.devices import DeviceWrappers
 
 log = logging.getLogger(__name__)
@@ -41,10 +42,12 @@ class SensorsController(object):
 
         self.render_fps = utils.SimpleFPS()
         self.data_fps = utils.SimpleFPS()
+        self.frames = utils.FrameMonitor()
+        self.statistics = Processing.FrameStatistics(("min", "max"))
 
         dev_wrap = DeviceWrappers.DeviceChooser()
         device_class = "DeviceWrappers"
-        device_type = "NonBlockingInterface"
+        device_type = "HostedInterface"
         device_args = "Simulation.StripChartDevice"
 
         self.amps_graph.device = dev_wrap.create(device_class,
@@ -52,13 +55,13 @@ class SensorsController(object):
                                                  device_args)
 
         device_class = "DeviceWrappers"
-        device_type = "NonBlockingInterface"
+        device_type = "HostedInterface"
         device_args = "Simulation.StripChartDevice"
         self.ir_temp.device = dev_wrap.create(device_class,
                                               device_type,
                                               device_args)
         device_class = "DeviceWrappers"
-        device_type = "NonBlockingInterface"
+        device_type = "HostedInterface"
         device_args = "Simulation.SimulatedSpectra"
         self.humidity.device = dev_wrap.create(device_class,
                                                device_type,
@@ -67,7 +70,7 @@ class SensorsController(object):
         for sensor in self.sensor_list:
             sensor.device.connect()
 
-
+        self.notifiers = {}
         self.setup_fps_timers()
 
         self.connect_signals()
@@ -77,6 +80,13 @@ class SensorsController(object):
         """
         self.form.exit_signal.exit.connect(self.close)
 
+        # Devices that decimate in the worker follow their plot width
+        for sensor in self.sensor_list:
+            if hasattr(sensor.device, "set_plot_width"):
+                resized = sensor.plot_signal.resized
+                resized.connect(sensor.device.set_plot_width)
+                sensor.device.set_plot_width(sensor.plot_width())
+
         class ControlClose(QtCore.QObject):
             exit = QtCore.Signal(str)
 
@@ -89,6 +99,8 @@ class SensorsController(object):
         """
         log.debug("blue graph controller level close")
         print("blue graph controller level close")
+        for notifier in self.notifiers.values():
+            notifier.setEnabled(False)
         for sensor in self.sensor_list:
             sensor.device.disconnect()
         self.control_exit_signal.exit.emit("control exit")
@@ -96,41 +108,107 @@ class SensorsController(object):
 
     def setup_fps_timers(self):
         """ Update the display Frames per second at every qt event
-        timeout.
+        timeout. When every device has a wakeup descriptor, the sensors
+        are only read again when one of them says a frame is waiting.
+        Hosted devices share the descriptor of their host.
         """
         self.data_timer = QtCore.QTimer()
         self.data_timer.timeout.connect(self.update_fps)
         self.data_timer.setSingleShot(True)
+
+        wakeups = {}
+        for sensor in self.sensor_list:
+            wakeups[DeviceWrappers.wakeup_fd(sensor.device)] = \
+                getattr(sensor.device, "wakeup", None)
+        self.wakeups = wakeups.values()
+
+        if None not in wakeups:
+            read_type = QtCore.QSocketNotifier.Read
+            for fd in wakeups:
+                notifier = QtCore.QSocketNotifier(fd, read_type)
+                notifier.activated.connect(self.wake)
+                self.notifiers[fd] = notifier
+
         self.data_timer.start(0)
 
+    def wake(self, fd):
+        """ A response is waiting on a data queue.
+        """
+        for wakeup in self.wakeups:
+            if wakeup is not None:
+                wakeup.clear()
+        self.update_fps()
+
     def update_fps(self):
         """ Add tick, display the current rate.
         """
+        received = False
         for sensor in self.sensor_list:
-            rnd_data = sensor.device.read()
-            if rnd_data is not None:
-                sensor.curve.setData(rnd_data)
+            frame = DeviceWrappers.read_frame(sensor.device)
+            if frame is not None:
+                received = True
+                utils.plot_frame(sensor.curve, frame)
                 self.data_fps.tick()
-                self.update_min_max(sensor, rnd_data)
+                self.frames.update(frame, sensor.device)
+                self.update_min_max(sensor, frame)
                 self.show_fps(sensor)
 
         self.render_fps.tick()
-        self.data_timer.start(0)
+
+        # See BlueGraphController.schedule_update
+        if not self.notifiers or received:
+            self.data_timer.start(0)
 
     def show_fps(self, sensor):
-        """ Primitive fps calculations of data and render fps.
+        """ Primitive fps calculations of data and render fps, with the
+        age of the displayed frame and the number of sequence gaps seen.
         """
-        new_fps = "D: %s\nR: %s" % (self.data_fps.rate(),
-                                    self.render_fps.rate())
+        new_fps = "D: %s\nR: %s\n%s" % (self.data_fps.rate(),
+                                        self.render_fps.rate(),
+                                        self.frames.summary())
         sensor.graphback.view_fps.setText(new_fps)
 
 
-    def update_min_max(self, sensor, rnd_data):
+    def update_min_max(self, sensor, frame):
         """ Show the current min and maximum values in the interface
-        controls.
+        controls. Frames from the device wrappers arrive with these
+        computed in the worker, direct device readings are summarized
+        here.
         """
-        min_conv = numpy.min(rnd_data)
-        sensor.graphback.minimum.setText(min_conv)
+        stats = frame.stats
+        if not stats or "min" not in stats or "max" not in stats:
+            stats = self.statistics.compute(frame.data)
 
-        max_conv = numpy.max(rnd_data)
-        sensor.graphback.maximum.setText(max_conv)
+        sensor.graphback.minimum.setText(stats["min"])
+        sensor.graphback.maximum.setText(stats["max"])
+
+
+class AsyncSensorsController(SensorsController):
+    """ Same display as SensorsController, but each sensor is read from
+    its own generator task on a utils.TaskRunner, so all sensors are
+    waited on concurrently instead of spun over in update_fps.
+    """
+    def setup_fps_timers(self):
+        """ Start one acquisition task per sensor.
+        """
+        self.runner = utils.TaskRunner()
+        for sensor in self.sensor_list:
+            self.runner.start(self.acquire(sensor))
+
+    def acquire(self, sensor):
+        """ Wait for each reading from the sensor, then display it.
+        """
+        while True:
+            frame = yield DeviceWrappers.read_async(sensor.device)
+            utils.plot_frame(sensor.curve, frame)
+            self.data_fps.tick()
+            self.render_fps.tick()
+            self.frames.update(frame, sensor.device)
+            self.update_min_max(sensor, frame)
+            self.show_fps(sensor)
+
+    def close(self, event):
+        """ Stop the acquisition tasks before disconnecting.
+        """
+        self.runner.stop()
+        super(AsyncSensorsController, self).close(event)
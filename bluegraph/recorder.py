@@ -0,0 +1,496 @@
+""" Record device frames to disk and read them back.
+
+A recording is two files. The frame file starts with a fixed size
+header, the magic bytes and a space padded json description of the
+dtype, pixel width and device id, followed by the raw frame payloads
+appended one after another. The index file beside it, with .idx added
+to the name, holds one INDEX_DTYPE record of sequence number, timestamp
+and payload offset per frame, and is read back with numpy.memmap.
+
+ChunkedRecorder writes the same header, then compressed chunks of
+frames, with one index record per chunk.
+"""
+
+import os
+import bz2
+import zlib
+import json
+import numpy
+import Queue
+import logging
+import threading
+
+from multiprocessing.pool import ThreadPool
+
+log = logging.getLogger(__name__)
+
+MAGIC = "BGFRAMES"
+HEADER_SIZE = 256
+INDEX_DTYPE = numpy.dtype([("sequence", "<i8"),
+                           ("timestamp", "<f8"),
+                           ("offset", "<i8")])
+
+def index_path(path):
+    return path + ".idx"
+
+def map_index(path, dtype):
+    """ Memory map the index of a recording. An empty index, of a
+    recording without frames, cannot be mapped and is an empty array.
+    """
+    if not os.path.getsize(path):
+        return numpy.zeros(0, dtype=dtype)
+    return numpy.memmap(path, dtype=dtype, mode="r")
+
+class FrameRecorder(object):
+    """ Append frames to a recording from a background writer thread, so
+    the caller never waits on the disk. Frames are copied and queued
+    without limit, and close() writes everything queued before it
+    returns, so no frame is dropped. The dtype and pixel width are taken
+    from the first frame unless given, and every frame must match them.
+
+    A recorder can be handed to a device interface before it is opened,
+    the interface opens it in the worker and records every full
+    resolution reading there.
+
+    The header is written by open(), so even a recording without frames
+    can be read. Until the first frame gives the dtype and pixel width
+    they are null in it, and the header is rewritten with them.
+    """
+    def __init__(self, path, device_id="", dtype=None, pixel_width=None):
+        super(FrameRecorder, self).__init__()
+        self.path = path
+        self.device_id = device_id
+        self.dtype = dtype
+        self.pixel_width = pixel_width
+
+        self.written = 0
+        self.queue = None
+        self.thread = None
+
+    def open(self):
+        """ Create the files, write the header and start the writer
+        thread.
+        """
+        if self.dtype is not None:
+            self.dtype = numpy.dtype(self.dtype)
+
+        self.queue = Queue.Queue()
+        self.frame_file = open(self.path, "wb")
+        self.index_file = open(index_path(self.path), "wb")
+        self.offset = HEADER_SIZE
+        self.write_header()
+        self.frame_file.flush()
+
+        self.thread = threading.Thread(target=self.writer)
+        self.thread.daemon = True
+        self.thread.start()
+        log.info("Recording %s to %s", self.device_id, self.path)
+        return True
+
+    def write(self, sequence, timestamp, data):
+        """ Queue one frame for writing. The data is copied, so the
+        caller may reuse its buffer straight away.
+        """
+        data = numpy.ravel(data)
+        if self.dtype is None:
+            self.dtype = data.dtype
+        if self.pixel_width is None:
+            self.pixel_width = data.size
+
+        if data.size != self.pixel_width:
+            raise ValueError("Frame of %s pixels in a %s pixel recording"
+                             % (data.size, self.pixel_width))
+
+        payload = data.astype(self.dtype).tostring()
+        self.queue.put((sequence, timestamp, payload))
+
+    def write_frame(self, frame):
+        """ Queue a DeviceWrappers.Frame for writing.
+        """
+        self.write(frame.sequence, frame.timestamp, frame.data)
+
+    def pending(self):
+        """ Number of frames queued but not yet written.
+        """
+        return self.queue.qsize()
+
+    def close(self):
+        """ Write every queued frame, then close the files.
+        """
+        if self.thread is None:
+            return False
+
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+        self.frame_file.close()
+        self.index_file.close()
+        log.info("Recorded %s frames to %s", self.written, self.path)
+        return True
+
+    def writer(self):
+        """ Writer thread. Take everything queued at once, then write the
+        payloads before the index records that point at them, so a
+        reader never sees an index record without its frame.
+        """
+        running = True
+        while running:
+            batch = [self.queue.get()]
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except Queue.Empty:
+                    break
+
+            if batch[-1] is None:
+                batch.pop()
+                running = False
+            if not batch:
+                continue
+
+            if not self.header_written:
+                self.frame_file.seek(0)
+                self.write_header()
+
+            index = numpy.zeros(len(batch), dtype=INDEX_DTYPE)
+            for (position, (sequence, timestamp, payload)) in \
+                    enumerate(batch):
+                index[position] = (sequence, timestamp, self.offset)
+                self.frame_file.write(payload)
+                self.offset += len(payload)
+            self.frame_file.flush()
+
+            self.index_file.write(index.tostring())
+            self.index_file.flush()
+            self.written += len(batch)
+
+    def write_header(self):
+        """ Write the header at the start of the frame file. It is only
+        complete once the dtype and pixel width are known.
+        """
+        dtype = None
+        if self.dtype is not None:
+            dtype = self.dtype.str
+
+        description = {"dtype": dtype,
+                       "pixel_width": self.pixel_width,
+                       "device_id": self.device_id,
+                      }
+        header = MAGIC + json.dumps(description)
+        if len(header) > HEADER_SIZE:
+            raise ValueError("Recording header too long: %s" % header)
+
+        self.frame_file.write(header.ljust(HEADER_SIZE))
+        self.header_written = None not in (dtype, self.pixel_width)
+
+class FrameReader(object):
+    """ Read a recording made by FrameRecorder. index and frames are
+    memory mapped, so opening even a very long recording is immediate
+    and only the frames used are read from disk. Recordings still being
+    written can be opened, they hold the frames written so far.
+    """
+    def __init__(self, path):
+        super(FrameReader, self).__init__()
+        self.path = path
+
+        with open(path, "rb") as frame_file:
+            header = frame_file.read(HEADER_SIZE)
+        if not header.startswith(MAGIC):
+            raise ValueError("Not a BlueGraph recording: %s" % path)
+
+        description = json.loads(header[len(MAGIC):])
+        self.dtype = numpy.dtype(description["dtype"])
+        self.pixel_width = description["pixel_width"]
+        self.device_id = description["device_id"]
+
+        self.index = map_index(index_path(path), INDEX_DTYPE)
+        if not len(self.index):
+            shape = (0, self.pixel_width or 0)
+            self.frames = numpy.zeros(shape, dtype=self.dtype)
+            return
+
+        shape = (len(self.index), self.pixel_width)
+        self.frames = numpy.memmap(path, dtype=self.dtype, mode="r",
+                                   offset=HEADER_SIZE, shape=shape)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, position):
+        return self.frames[position]
+
+    @property
+    def sequences(self):
+        return self.index["sequence"]
+
+    @property
+    def timestamps(self):
+        return self.index["timestamp"]
+
+    def timestamp(self, position):
+        return self.index["timestamp"][position]
+
+CHUNK_MAGIC = "BGCHUNKS"
+CHUNK_INDEX_DTYPE = numpy.dtype([("first_sequence", "<i8"),
+                                 ("first_timestamp", "<f8"),
+                                 ("frames", "<i8"),
+                                 ("offset", "<i8"),
+                                 ("size", "<i8")])
+
+def available_codecs():
+    """ Map codec names to (compress, decompress) functions. lzma is
+    only in the standard library from Python 3.3.
+    """
+    codecs = {"zlib": (zlib.compress, zlib.decompress),
+              "bz2": (bz2.compress, bz2.decompress),
+             }
+    try:
+        import lzma
+        codecs["lzma"] = (lambda data, level: lzma.compress(data,
+                                                            preset=level),
+                          lzma.decompress)
+    except ImportError:
+        pass
+    return codecs
+
+CODECS = available_codecs()
+
+def delta_encode(frames):
+    """ Replace every pixel but the first of each frame with its
+    difference from the pixel before, wrapping in uint16. Then store all
+    the high bytes before all the low bytes. Neighbouring pixels of a
+    spectrum are close, so most high bytes become 0 or 255 and compress
+    well.
+    """
+    encoded = frames.copy()
+    encoded[:, 1:] -= frames[:, :-1]
+    planes = encoded.astype(">u2").view(numpy.uint8).reshape(-1, 2)
+    return planes.T.copy()
+
+def delta_decode(planes, count, pixel_width):
+    planes = planes.reshape(2, -1).T.copy()
+    encoded = planes.view(">u2").reshape(count, pixel_width)
+    return numpy.cumsum(encoded, axis=1, dtype=numpy.uint16)
+
+def encode_chunk(sequences, stamps, frames, codec, level):
+    """ Delta encode and compress one chunk. Runs in the compression
+    pool.
+    """
+    payload = (sequences.tostring() + stamps.tostring() +
+               delta_encode(frames).tostring())
+    return CODECS[codec][0](payload, level)
+
+class ChunkedRecorder(FrameRecorder):
+    """ Record frames in compressed chunks of chunk_frames frames. Frames
+    are stored as uint16, rounded and clipped if they are not already,
+    and delta encoded along the pixels before compression with codec.
+    Chunks are compressed on a pool of worker threads, the compressors
+    release the GIL, and written in order by the writer thread, so
+    acquisition is never held up by compression or the disk.
+
+    The chunk file has the same fixed size header as a FrameRecorder
+    file. The .idx file holds one CHUNK_INDEX_DTYPE record per chunk for
+    random access.
+    """
+    def __init__(self, path, device_id="", pixel_width=None,
+                 chunk_frames=64, codec="zlib", level=6, workers=2):
+        if codec not in CODECS:
+            raise ValueError("Unknown codec: %s" % codec)
+
+        super(ChunkedRecorder, self).__init__(path, device_id,
+                                              numpy.uint16, pixel_width)
+        self.chunk_frames = chunk_frames
+        self.codec = codec
+        self.level = level
+        self.workers = workers
+        self.pool = None
+
+    def open(self):
+        """ Start the compression pool, then open as FrameRecorder.
+        """
+        self.pool = ThreadPool(self.workers)
+        self.filled = 0
+        self.chunk = None
+        return super(ChunkedRecorder, self).open()
+
+    def write(self, sequence, timestamp, data):
+        """ Copy the frame into the current chunk, and hand the chunk to
+        the compression pool when it is full.
+        """
+        data = numpy.ravel(data)
+        if self.pixel_width is None:
+            self.pixel_width = data.size
+        if data.size != self.pixel_width:
+            raise ValueError("Frame of %s pixels in a %s pixel recording"
+                             % (data.size, self.pixel_width))
+
+        if self.chunk is None:
+            self.sequences = numpy.zeros(self.chunk_frames, dtype="<i8")
+            self.stamps = numpy.zeros(self.chunk_frames, dtype="<f8")
+            self.chunk = numpy.zeros((self.chunk_frames, self.pixel_width),
+                                     dtype=numpy.uint16)
+
+        row = self.filled
+        self.sequences[row] = sequence
+        self.stamps[row] = timestamp
+        if data.dtype == numpy.uint16:
+            self.chunk[row] = data
+        else:
+            self.chunk[row] = numpy.clip(numpy.rint(data), 0, 65535)
+
+        self.filled += 1
+        if self.filled == self.chunk_frames:
+            self.submit()
+
+    def submit(self):
+        """ Queue the filled part of the chunk for compression.
+        """
+        count = self.filled
+        if not count:
+            return
+
+        args = (self.sequences[:count], self.stamps[:count],
+                self.chunk[:count], self.codec, self.level)
+        result = self.pool.apply_async(encode_chunk, args)
+        self.queue.put((self.sequences[0], self.stamps[0], count, result))
+
+        # The pool owns the old arrays now
+        self.chunk = None
+        self.filled = 0
+
+    def close(self):
+        """ Compress and write the last partial chunk, then close.
+        """
+        if self.thread is None:
+            return False
+
+        self.submit()
+        result = super(ChunkedRecorder, self).close()
+        self.pool.close()
+        self.pool.join()
+        return result
+
+    def writer(self):
+        """ Writer thread. Wait for each chunk to be compressed, in the
+        order they were queued, then write it and its index record.
+        """
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+
+            (first_sequence, first_stamp, count, result) = item
+            compressed = result.get()
+            if not self.header_written:
+                self.frame_file.seek(0)
+                self.write_header()
+
+            record = numpy.zeros(1, dtype=CHUNK_INDEX_DTYPE)
+            record[0] = (first_sequence, first_stamp, count, self.offset,
+                         len(compressed))
+            self.frame_file.write(compressed)
+            self.frame_file.flush()
+            self.index_file.write(record.tostring())
+            self.index_file.flush()
+
+            self.offset += len(compressed)
+            self.written += count
+
+    def write_header(self):
+        description = {"dtype": numpy.dtype(numpy.uint16).str,
+                       "pixel_width": self.pixel_width,
+                       "device_id": self.device_id,
+                       "chunk_frames": self.chunk_frames,
+                       "codec": self.codec,
+                       "encoding": "pixel-delta-planes",
+                      }
+        header = CHUNK_MAGIC + json.dumps(description)
+        if len(header) > HEADER_SIZE:
+            raise ValueError("Recording header too long: %s" % header)
+
+        self.frame_file.write(header.ljust(HEADER_SIZE))
+        self.header_written = self.pixel_width is not None
+
+class ChunkedReader(object):
+    """ Read a recording made by ChunkedRecorder. The chunk index is
+    memory mapped, and only the chunk holding a requested frame is read
+    and decompressed. The most recent chunk is kept decoded.
+    """
+    def __init__(self, path):
+        super(ChunkedReader, self).__init__()
+        self.path = path
+
+        with open(path, "rb") as chunk_file:
+            header = chunk_file.read(HEADER_SIZE)
+        if not header.startswith(CHUNK_MAGIC):
+            raise ValueError("Not a chunked BlueGraph recording: %s" % path)
+
+        description = json.loads(header[len(CHUNK_MAGIC):])
+        self.pixel_width = description["pixel_width"]
+        self.device_id = description["device_id"]
+        self.codec = description["codec"]
+        self.decompress = CODECS[self.codec][1]
+
+        self.index = map_index(index_path(path), CHUNK_INDEX_DTYPE)
+        self.ends = numpy.cumsum(self.index["frames"])
+        self.cached = (None, None)
+
+    def __len__(self):
+        if not len(self.ends):
+            return 0
+        return int(self.ends[-1])
+
+    def __getitem__(self, position):
+        """ Return the frame at position in the recording.
+        """
+        (number, row) = self.locate(position)
+        return self.chunk(number)[2][row]
+
+    def timestamp(self, position):
+        """ Return the timestamp of the frame at position.
+        """
+        (number, row) = self.locate(position)
+        return self.chunk(number)[1][row]
+
+    def locate(self, position):
+        """ Return the chunk number and row in the chunk of a frame.
+        """
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError("Frame %s of %s" % (position, len(self)))
+
+        number = int(numpy.searchsorted(self.ends, position, side="right"))
+        first = self.ends[number] - self.index[number]["frames"]
+        return (number, int(position - first))
+
+    def chunk(self, number):
+        """ Return (sequences, timestamps, frames) of one chunk.
+        """
+        if self.cached[0] == number:
+            return self.cached[1]
+
+        record = self.index[number]
+        with open(self.path, "rb") as chunk_file:
+            chunk_file.seek(record["offset"])
+            compressed = chunk_file.read(record["size"])
+        payload = self.decompress(compressed)
+
+        count = int(record["frames"])
+        sequences = numpy.frombuffer(payload, "<i8", count)
+        stamps = numpy.frombuffer(payload, "<f8", count, count * 8)
+        planes = numpy.frombuffer(payload, numpy.uint8, offset=count * 16)
+        frames = delta_decode(planes, count, self.pixel_width)
+
+        self.cached = (number, (sequences, stamps, frames))
+        return self.cached[1]
+
+def open_recording(path):
+    """ Return a FrameReader or ChunkedReader for the recording at path,
+    whichever format it is.
+    """
+    with open(path, "rb") as recording:
+        magic = recording.read(len(MAGIC))
+    if magic == CHUNK_MAGIC:
+        return ChunkedReader(path)
+    return FrameReader(path)
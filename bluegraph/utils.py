@@ -2,8 +2,12 @@
 application.
 """
 
+import numpy
+
 from PySide import QtGui, QtCore
 
+from bluegraph.devices import Buffers
+
 class Basic(QtGui.QMainWindow):
     """ The most basic window possible for testing pyside, xvfb and
     travis integration. Specifically requried for py.test to
@@ -20,6 +24,15 @@ class Basic(QtGui.QMainWindow):
         self.setGeometry(0, 0, 800, 600)
         self.show()
 
+def plot_frame(curve, frame):
+    """ Show a Frame on a pyqtgraph curve, at the pixel positions of its
+    envelope if the worker decimated it.
+    """
+    if frame.x is None:
+        curve.setData(frame.data)
+    else:
+        curve.setData(frame.x, frame.data)
+
 class SimpleFPS(object):
     """ Use qtimer and a tick function to return the number of ticks
     returned for a simple FPS computation.
@@ -49,3 +62,237 @@ class SimpleFPS(object):
         """ Add one to the total tick history
         """
         self.ticks += 1
+
+class FrameMonitor(object):
+    """ Count gaps in the frame sequence numbers of each device, and keep
+    the age of the most recently displayed frame. device_id defaults to
+    the device type, so two wrappers of the same type send the same id.
+    Pass the device the frame was read from as source to count their
+    sequences apart.
+    """
+    def __init__(self):
+        super(FrameMonitor, self).__init__()
+        self.last_sequence = {}
+        self.gaps = 0
+        self.dropped = 0
+        self.age = 0.0
+
+    def update(self, frame, source=None):
+        """ Record a frame that is about to be displayed.
+        """
+        if frame.sequence is not None:
+            key = (source, frame.device_id)
+            last = self.last_sequence.get(key)
+            if last is not None and frame.sequence > last + 1:
+                self.gaps += 1
+                self.dropped += frame.sequence - last - 1
+            self.last_sequence[key] = frame.sequence
+
+        self.age = frame.age()
+
+    def summary(self):
+        """ Short age in milliseconds and gap count text for the FPS box.
+        """
+        return "A:%d G:%s" % (self.age * 1000, self.gaps)
+
+class StageTimer(object):
+    """ Keep the durations of the last window frames for each stage of
+    the display path, and report their percentiles:
+
+    read      worker time of instrumented wrappers, otherwise the time
+              the controller spent in the read call
+    transit   age of the frame when the controller received it
+    set_data  curve.setData
+    min_max   min and max text box update
+    paint     QGraphicsView paint
+    """
+    stages = ("read", "transit", "set_data", "min_max", "paint")
+
+    def __init__(self, window=1000):
+        super(StageTimer, self).__init__()
+        self.samples = dict((stage, Buffers.HistoryRing(window))
+                            for stage in self.stages)
+
+    def add(self, stage, seconds):
+        self.samples[stage].append(seconds, 0.0)
+
+    def percentiles(self, stage, points=(50, 95, 99)):
+        """ Return the percentiles of the stage in seconds, or None
+        before any samples.
+        """
+        durations = self.samples[stage].view()
+        if not len(durations):
+            return None
+        return numpy.percentile(durations, points)
+
+    def overlay(self):
+        """ Compact table of p50/p95/p99 in ms for the timing overlay.
+        """
+        lines = ["stage     p50    p95    p99 ms"]
+        for stage in self.stages:
+            points = self.percentiles(stage)
+            if points is None:
+                lines.append("%-8s     -" % stage)
+                continue
+            lines.append("%-8s %6.2f %6.2f %6.2f" %
+                         ((stage,) + tuple(points * 1000.0)))
+        return "\n".join(lines)
+
+    def dump(self, bins=10):
+        """ Percentiles and a log spaced histogram of each stage, as text
+        for the log.
+        """
+        lines = [self.overlay()]
+        for stage in self.stages:
+            durations = self.samples[stage].view()
+            if not len(durations):
+                continue
+
+            lowest = max(durations.min(), 1e-6)
+            highest = max(durations.max(), lowest * 1.01)
+            edges = numpy.logspace(numpy.log10(lowest), numpy.log10(highest),
+                                   bins + 1)
+            (edges[0], edges[-1]) = (durations.min(), highest)
+            (counts, edges) = numpy.histogram(durations, edges)
+            lines.append("%s histogram, %d frames:" % (stage, len(durations)))
+            for (count, edge) in zip(counts, edges):
+                lines.append("  >= %8.3f ms %6d" % (edge * 1000.0, count))
+        return "\n".join(lines)
+
+class TaskRunner(object):
+    """ Run generator based tasks on the Qt event loop. A task yields a
+    PendingRead from read_async(), and is resumed with the reading once
+    it completes, so each device can be written as a simple read loop
+    and many devices wait concurrently without blocking the GUI:
+
+        def acquire(device):
+            while True:
+                data = yield DeviceWrappers.read_async(device)
+                curve.setData(data)
+
+    Reads that carry a wakeup pipe are only polled when a
+    QSocketNotifier says it was set, one notifier per pipe. Any other
+    outstanding reads are polled from a single timer that only runs
+    while one of them is waiting.
+    """
+    def __init__(self, interval=1):
+        super(TaskRunner, self).__init__()
+        self.interval = interval
+        self.waiting = []
+
+        # Keyed by wakeup descriptor
+        self.watching = {}
+        self.wakeups = {}
+        self.notifiers = {}
+
+        self.poll_timer = QtCore.QTimer()
+        self.poll_timer.timeout.connect(self.poll)
+
+    def start(self, task):
+        """ Run the task up to its first yield.
+        """
+        self.step(task, None)
+
+    def step(self, task, value):
+        """ Resume the task with value and wait for the read it yields.
+        """
+        try:
+            pending = task.send(value)
+        except StopIteration:
+            return
+
+        self.wait(task, pending)
+
+    def wait(self, task, pending):
+        """ Queue the read on the notifier of its wakeup pipe, or on the
+        poll timer without one.
+        """
+        if pending.done or pending.wakeup is None:
+            self.waiting.append((task, pending))
+            if not self.poll_timer.isActive():
+                self.poll_timer.start(self.interval)
+            return
+
+        fd = pending.wakeup.fileno()
+        self.watching.setdefault(fd, []).append((task, pending))
+        self.wakeups[fd] = pending.wakeup
+
+        notifier = self.notifiers.get(fd)
+        if notifier is None:
+            read_type = QtCore.QSocketNotifier.Read
+            notifier = QtCore.QSocketNotifier(fd, read_type)
+            notifier.activated.connect(self.wake)
+            self.notifiers[fd] = notifier
+        notifier.setEnabled(True)
+
+    def wake(self, fd):
+        """ A wakeup pipe was set, resume every task waiting on it whose
+        read has completed.
+        """
+        self.notifiers[fd].setEnabled(False)
+        self.wakeups[fd].clear()
+
+        for (task, pending) in self.watching.pop(fd, []):
+            if pending.poll():
+                self.step(task, pending.result)
+            else:
+                self.wait(task, pending)
+
+    def poll(self):
+        """ Resume every task whose read has completed.
+        """
+        waiting = self.waiting
+        self.waiting = []
+        for (task, pending) in waiting:
+            if pending.poll():
+                self.step(task, pending.result)
+            else:
+                self.waiting.append((task, pending))
+
+        if not self.waiting:
+            self.poll_timer.stop()
+
+    def stop(self):
+        """ Abandon all tasks.
+        """
+        self.poll_timer.stop()
+        for notifier in self.notifiers.values():
+            notifier.setEnabled(False)
+
+        waiting = self.waiting
+        for watching in self.watching.values():
+            waiting.extend(watching)
+        for (task, pending) in waiting:
+            task.close()
+        self.waiting = []
+        self.watching = {}
+
+class PoolRefiller(object):
+    """ Refill a WorkerPool from the Qt event loop, so replacement
+    workers are forked from the GUI thread. One worker is started per
+    timeout, every interval ms while the pool is full and as soon as the
+    loop is idle while it is short.
+    """
+    def __init__(self, pool, interval=100):
+        super(PoolRefiller, self).__init__()
+        self.pool = pool
+        self.interval = interval
+
+        self.refill_timer = QtCore.QTimer()
+        self.refill_timer.setSingleShot(True)
+        self.refill_timer.timeout.connect(self.refill)
+        self.refill_timer.start(interval)
+
+    def refill(self):
+        """ Start one replacement and come back when the loop is idle
+        if more are missing.
+        """
+        if self.pool.refill():
+            self.refill_timer.start(0)
+        else:
+            self.refill_timer.start(self.interval)
+
+    def stop(self):
+        """ Stop refilling, the pool itself is left running.
+        """
+        self.refill_timer.stop()
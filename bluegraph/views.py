@@ -10,6 +10,9 @@ from PySide import QtGui, QtSvg, QtCore
 
 from assets import bluegraph_resources_rc
 
+from bluegraph.devices import Timing
+from bluegraph.devices import Tracing
+
 log = logging.getLogger(__name__)
 
 class Basic(QtGui.QMainWindow):
@@ -73,6 +76,7 @@ class MultiGraphLayout(QtGui.QMainWindow):
 class PixmapBackedGraph(QtGui.QWidget):
     def __init__(self, title="Blue Graph", icon="default"):
         super(PixmapBackedGraph, self).__init__()
+        self.create_signals()
 
         self.main_layout = QtGui.QVBoxLayout()
         self.setLayout(self.main_layout)
@@ -84,7 +88,8 @@ class PixmapBackedGraph(QtGui.QWidget):
                                               title=title, icon=icon)
         self.scene.addItem(self.graphback)
 
-        self.view = QtGui.QGraphicsView(self.scene)
+        self.view = TimedGraphicsView(self.scene)
+        self.paint_signal = self.view.paint_signal
         view_style = ("background: transparent;"
                       "border: 0px"
                      )
@@ -107,8 +112,6 @@ class PixmapBackedGraph(QtGui.QWidget):
         green_pen = "#1fd11f" # semi light-green
         self.curve = self.graphback.plot.plot(ramp_data, pen=green_pen)
 
-        self.create_signals()
-
     def create_signals(self):
         """ Create signal objects to be used by controller.
         """
@@ -117,10 +120,65 @@ class PixmapBackedGraph(QtGui.QWidget):
 
         self.exit_signal = ViewClose()
 
+        class PlotResize(QtCore.QObject):
+            resized = QtCore.Signal(int)
+
+        self.plot_signal = PlotResize()
+
+        class TimingKeys(QtCore.QObject):
+            toggle = QtCore.Signal()
+            dump = QtCore.Signal()
+
+        self.timing_signal = TimingKeys()
+
+    def keyPressEvent(self, event):
+        """ T shows or hides the stage timing overlay, D asks for the
+        timing histograms to be dumped.
+        """
+        if event.key() == QtCore.Qt.Key_T:
+            self.timing_signal.toggle.emit()
+        elif event.key() == QtCore.Qt.Key_D:
+            self.timing_signal.dump.emit()
+        else:
+            super(PixmapBackedGraph, self).keyPressEvent(event)
+
+    def plot_width(self):
+        """ Width of the plot in screen pixels, including any scaling of
+        the view.
+        """
+        scale = self.view.transform().m11()
+        return int(self.graphback.plot.width() * scale)
+
+    def resizeEvent(self, event):
+        """ Let the controller know how many pixels the plot has, so the
+        device can decimate to match.
+        """
+        super(PixmapBackedGraph, self).resizeEvent(event)
+        self.plot_signal.resized.emit(self.plot_width())
+
     def closeEvent(self, event):
         log.debug("Pixmap level close")
         self.exit_signal.exit.emit("close event")
 
+class TimedGraphicsView(QtGui.QGraphicsView):
+    """ Graphics view that reports how long each paint took, in seconds,
+    on paint_signal.
+    """
+    def __init__(self, scene, parent=None):
+        super(TimedGraphicsView, self).__init__(scene, parent)
+
+        class PaintTimed(QtCore.QObject):
+            painted = QtCore.Signal(float)
+
+        self.paint_signal = PaintTimed()
+
+    def paintEvent(self, event):
+        start = Timing.monotonic()
+        super(TimedGraphicsView, self).paintEvent(event)
+        end = Timing.monotonic()
+        Tracing.complete("paint", start, end, "render")
+        self.paint_signal.painted.emit(end - start)
+
 class SceneGraphBackground(QtGui.QGraphicsPixmapItem):
     """ Like GraphBackground, but include the scene parameter so
     certain widgets will add correctly. pyqtgraph plotwidget for
@@ -170,6 +228,29 @@ class SceneGraphBackground(QtGui.QGraphicsPixmapItem):
         self.pause_button.setPos(706, 333-289)
         self.pause_button.setParentItem(self)
 
+        self.add_timing_overlay(self)
+
+    def add_timing_overlay(self, parent):
+        """ Add the hidden stage timing table over the top left of the
+        plot.
+        """
+        self.timing_font = QtGui.QFont("Courier")
+        self.timing_font.setStyleHint(QtGui.QFont.TypeWriter)
+        self.timing_font.setPointSize(7)
+
+        white = QtGui.QColor(255, 255, 255, 255)
+        self.timing = QtGui.QGraphicsSimpleTextItem("")
+        self.timing.setPos(80, 333-285)
+        self.timing.setBrush(white)
+        self.timing.setFont(self.timing_font)
+        self.timing.setParentItem(parent)
+        self.timing.setZValue(1)
+        self.timing.setVisible(False)
+
+        self.timing_shadow = QtGui.QGraphicsDropShadowEffect()
+        self.timing_shadow.setOffset(1, 1)
+        self.timing.setGraphicsEffect(self.timing_shadow)
+
     def add_main_icon(self, filename, parent):
         """ Add a graphical indicator pixmap to the title area.
         """
@@ -8,6 +8,8 @@ import argparse
 from PySide import QtGui, QtCore
 
 from bluegraph import control
+from bluegraph import recorder
+from bluegraph.devices import Tracing
 
 logging.basicConfig(filename="BlueGraph_log.txt", filemode="w",
                     level=logging.DEBUG)
@@ -53,6 +55,11 @@ class BlueGraphApplication(object):
         help_str = "Automatically terminate the program for testing"
         parser.add_argument("-t", "--testing", action="store_true",
                             help=help_str)
+        parser.add_argument("-r", "--record", default=None,
+                            help="record every frame to this file")
+        parser.add_argument("--trace", default=None,
+                            help="write a Chrome trace event timeline to "
+                                 "this file")
         return parser
 
     def run(self):
@@ -68,11 +75,26 @@ class BlueGraphApplication(object):
         device_type = "NonBlockingInterface"
         device_args = "Simulation.SimulatedSpectra"
 
+        if self.args.trace is not None:
+            Tracing.enable(self.args.trace, process_name="BlueGraph GUI")
+
+        frame_recorder = None
+        if self.args.record is not None:
+            frame_recorder = recorder.FrameRecorder(self.args.record,
+                                                    device_args)
+
         cb = control.BlueGraphController
-        self.control = cb(device_class, device_type, device_args)
+        self.control = cb(device_class, device_type, device_args,
+                          recorder=frame_recorder)
 
         self.control.control_exit_signal.exit.connect(self.closeEvent)
-        sys.exit(app.exec_())
+        result = app.exec_()
+
+        if self.args.trace is not None:
+            Tracing.disable()
+            count = Tracing.merge(self.args.trace)
+            log.info("Wrote %s trace events to %s", count, self.args.trace)
+        sys.exit(result)
 
     def closeEvent(self):
         """ catch the exit signal from the control application, and
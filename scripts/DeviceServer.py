@@ -0,0 +1,84 @@
+""" DeviceServer - publish readings from one device over zmq for any
+number of BlueGraph subscribers.
+"""
+
+import sys
+import time
+import logging
+import argparse
+
+from bluegraph.devices import DeviceWrappers
+
+log = logging.getLogger()
+
+strm = logging.StreamHandler(sys.stderr)
+frmt = logging.Formatter("%(name)s - %(levelname)s %(message)s")
+strm.setFormatter(frmt)
+log.addHandler(strm)
+log.setLevel(logging.INFO)
+
+class DeviceServerApplication(object):
+    """ Start the publishing process for the specified device, and keep
+    it running until interrupted.
+    """
+    def __init__(self):
+        super(DeviceServerApplication, self).__init__()
+        self.parser = self.create_parser()
+        self.args = None
+
+    def parse_args(self, argv):
+        """ Handle any bad arguments, then set defaults.
+        """
+        log.debug("Process args: %s", argv)
+        self.args = self.parser.parse_args(argv)
+        return self.args
+
+    def create_parser(self):
+        """ Create the parser with arguments specific to this
+        application.
+        """
+        desc = "publish readings from the specified device over zmq"
+        parser = argparse.ArgumentParser(description=desc)
+
+        parser.add_argument("-d", "--device",
+                            default="Simulation.SimulatedSpectra",
+                            help="device type like Simulation.SimulatedSpectra")
+        parser.add_argument("-e", "--endpoint",
+                            default=DeviceWrappers.DEFAULT_ENDPOINT,
+                            help="ipc:// or tcp://127.0.0.1:port endpoint")
+        parser.add_argument("-i", "--device-id", default=None,
+                            help="topic to publish under, default device")
+        return parser
+
+    def run(self):
+        """ Publish until ctrl+c.
+        """
+        server = DeviceWrappers.DeviceServer(self.args.device,
+                                             endpoint=self.args.endpoint,
+                                             device_id=self.args.device_id)
+        server.start()
+        log.info("Serving %s on %s", self.args.device, self.args.endpoint)
+        try:
+            while True:
+                time.sleep(1.0)
+        except KeyboardInterrupt:
+            log.info("Stopping server")
+        finally:
+            server.stop()
+
+def main(argv=None):
+    """ main calls the wrapper code around the application objects with
+    as little framework as possible.
+    """
+    if argv is None:
+        argv = sys.argv
+    argv = argv[1:]
+    log.debug("Arguments: %s", argv)
+
+    go_app = DeviceServerApplication()
+    go_app.parse_args(argv)
+    go_app.run()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,125 @@
+""" RecorderBenchmark - compare write throughput and size of the raw and
+chunked recording formats on simulated spectra.
+"""
+
+import os
+import sys
+import time
+import numpy
+import shutil
+import logging
+import argparse
+import tempfile
+
+from bluegraph import recorder
+from bluegraph.devices import Simulation
+
+log = logging.getLogger()
+
+strm = logging.StreamHandler(sys.stderr)
+frmt = logging.Formatter("%(name)s - %(levelname)s %(message)s")
+strm.setFormatter(frmt)
+log.addHandler(strm)
+log.setLevel(logging.WARNING)
+
+class RecorderBenchmarkApplication(object):
+    """ Record the same simulated frames with each format, and report the
+    rate frames were accepted, the rate they reached the disk, and the
+    size on disk compared to the raw format.
+    """
+    def __init__(self):
+        super(RecorderBenchmarkApplication, self).__init__()
+        self.parser = self.create_parser()
+        self.args = None
+
+    def parse_args(self, argv):
+        """ Handle any bad arguments, then set defaults.
+        """
+        log.debug("Process args: %s", argv)
+        self.args = self.parser.parse_args(argv)
+        return self.args
+
+    def create_parser(self):
+        """ Create the parser with arguments specific to this
+        application.
+        """
+        desc = "compare raw and chunked recorders on simulated spectra"
+        parser = argparse.ArgumentParser(description=desc)
+
+        parser.add_argument("-n", "--frames", type=int, default=4000,
+                            help="number of frames to record")
+        parser.add_argument("-w", "--pixel-width", type=int, default=1024,
+                            help="pixels per frame")
+        parser.add_argument("-c", "--chunk-frames", type=int, default=64,
+                            help="frames per compressed chunk")
+        parser.add_argument("--noise", type=float, default=0.05,
+                            help="simulated noise as a fraction of range")
+        parser.add_argument("-d", "--directory", default=None,
+                            help="where to write, default a temp directory")
+        return parser
+
+    def time_recording(self, frame_recorder, frames):
+        """ Return the seconds to queue every frame, and to have them
+        all on disk.
+        """
+        frame_recorder.open()
+        start = time.time()
+        for (sequence, frame) in enumerate(frames):
+            frame_recorder.write(sequence, sequence * 0.001, frame)
+        queued = time.time() - start
+        frame_recorder.close()
+        return (queued, time.time() - start)
+
+    def run(self):
+        """ Print one line per format.
+        """
+        directory = self.args.directory
+        cleanup = directory is None
+        if cleanup:
+            directory = tempfile.mkdtemp(prefix="bluegraph")
+
+        device = Simulation.BankedSpectra(self.args.pixel_width,
+                                          dtype=numpy.uint16, seed=0,
+                                          noise=self.args.noise)
+        frames = [device.read() for i in range(self.args.frames)]
+        raw_bytes = self.args.frames * self.args.pixel_width * 2
+
+        formats = [("raw", lambda path: recorder.FrameRecorder(path))]
+        for codec in sorted(recorder.CODECS):
+            for level in (1, 6, 9):
+                def create(path, codec=codec, level=level):
+                    return recorder.ChunkedRecorder(
+                        path, chunk_frames=self.args.chunk_frames,
+                        codec=codec, level=level)
+                formats.append(("%s-%d" % (codec, level), create))
+
+        print "%d frames of %d uint16 pixels, %.1f MB, noise %s" % \
+            (self.args.frames, self.args.pixel_width, raw_bytes / 1e6,
+             self.args.noise)
+        print "%-8s %12s %12s %8s" % ("format", "queue fps", "disk fps",
+                                      "ratio")
+        for (name, create) in formats:
+            path = os.path.join(directory, "benchmark-%s" % name)
+            (queued, written) = self.time_recording(create(path), frames)
+            size = os.path.getsize(path) + os.path.getsize(path + ".idx")
+            print "%-8s %12.0f %12.0f %8.2f" % \
+                (name, self.args.frames / queued, self.args.frames / written,
+                 float(raw_bytes) / size)
+
+        if cleanup:
+            shutil.rmtree(directory)
+
+def main(argv=None):
+    """ main calls the wrapper code around the application objects with
+    as little framework as possible.
+    """
+    argv = argv[1:]
+    log.debug("Arguments: %s", argv)
+
+    go_app = RecorderBenchmarkApplication()
+    go_app.parse_args(argv)
+    go_app.run()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
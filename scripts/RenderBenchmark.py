@@ -0,0 +1,203 @@
+""" RenderBenchmark - measure how many frames PixmapBackedGraph and
+MultiGraphLayout actually paint when fed synthetic frames at increasing
+rates, graph counts and curve sizes, with and without the rendering
+options that might make them cheaper.
+
+PySide is built on Qt 4, which has no offscreen platform plugin. On a
+machine without a display run it under Xvfb, as the tests do:
+
+    xvfb-run -s "-screen 0 1920x1080x24" python scripts/RenderBenchmark.py
+"""
+
+import sys
+import json
+import numpy
+import logging
+import argparse
+
+from PySide import QtGui
+
+from bluegraph import views
+from bluegraph.devices import Timing
+from bluegraph.devices import Simulation
+
+log = logging.getLogger()
+
+strm = logging.StreamHandler(sys.stderr)
+frmt = logging.Formatter("%(name)s - %(levelname)s %(message)s")
+strm.setFormatter(frmt)
+log.addHandler(strm)
+log.setLevel(logging.WARNING)
+
+def remove_shadows(graph):
+    """ Drop every graphics effect, the drop shadows behind the title,
+    icon, buttons and text.
+    """
+    for item in graph.scene.items():
+        if item.graphicsEffect() is not None:
+            item.setGraphicsEffect(None)
+
+def downsample(graph):
+    """ Let pyqtgraph reduce the curve to a peak envelope of the visible
+    pixels before drawing it.
+    """
+    graph.curve.setDownsampling(auto=True, method="peak")
+    graph.curve.setClipToView(True)
+
+CONFIGS = {"default": (),
+           "no-shadows": (remove_shadows,),
+           "downsample": (downsample,),
+           "no-shadows+downsample": (remove_shadows, downsample),
+          }
+
+class RenderBenchmarkApplication(object):
+    """ For every configuration, graph count, curve size and rate, set
+    new data on every curve at the rate for a fixed time and count the
+    paints each graph view delivers. Graph counts above one are stacked
+    in a MultiGraphLayout, as multi_control does.
+    """
+    def __init__(self):
+        super(RenderBenchmarkApplication, self).__init__()
+        self.parser = self.create_parser()
+        self.args = None
+
+    def parse_args(self, argv):
+        """ Handle any bad arguments, then set defaults.
+        """
+        log.debug("Process args: %s", argv)
+        self.args = self.parser.parse_args(argv)
+        return self.args
+
+    def create_parser(self):
+        """ Create the parser with arguments specific to this
+        application.
+        """
+        desc = "measure graph paint rates on synthetic frames"
+        parser = argparse.ArgumentParser(description=desc)
+
+        parser.add_argument("-c", "--configs", nargs="+",
+                            default=sorted(CONFIGS), choices=sorted(CONFIGS),
+                            help="rendering configurations to compare")
+        parser.add_argument("-g", "--graphs", type=int, nargs="+",
+                            default=[1, 3, 6],
+                            help="numbers of graphs on screen")
+        parser.add_argument("-w", "--pixel-widths", type=int, nargs="+",
+                            default=[1024, 4096, 16384],
+                            help="points per curve")
+        parser.add_argument("-r", "--rates", type=float, nargs="+",
+                            default=[30, 60, 120, 0],
+                            help="frames per second fed to each graph, 0 "
+                                 "for as fast as possible")
+        parser.add_argument("-s", "--seconds", type=float, default=2.0,
+                            help="measured time per case")
+        parser.add_argument("-o", "--output", default=None,
+                            help="write the results to this JSON file")
+        return parser
+
+    def create_graphs(self, count):
+        """ Return the top level window and its graphs.
+        """
+        if count == 1:
+            graph = views.PixmapBackedGraph("RENDER")
+            return (graph, [graph])
+
+        layout = views.MultiGraphLayout()
+        graphs = []
+        for index in range(count):
+            graph = views.PixmapBackedGraph("RENDER %d" % index)
+            layout.vbox.addWidget(graph)
+            graphs.append(graph)
+        return (layout, graphs)
+
+    def measure(self, app, config, count, pixel_width, rate, frames):
+        """ Feed the graphs for the configured time, and return the case
+        with its results.
+        """
+        (window, graphs) = self.create_graphs(count)
+        for configure in CONFIGS[config]:
+            for graph in graphs:
+                configure(graph)
+
+        paints = []
+        for graph in graphs:
+            graph.paint_signal.painted.connect(paints.append)
+
+        # Let the windows map and paint once before measuring
+        for graph in graphs:
+            graph.curve.setData(frames[0])
+        app.processEvents()
+        del paints[:]
+
+        scheduler = None
+        if rate:
+            scheduler = Timing.DeadlineScheduler(rate)
+
+        fed = 0
+        start = Timing.monotonic()
+        deadline = start + self.args.seconds
+        while Timing.monotonic() < deadline:
+            data = frames[fed % len(frames)]
+            for graph in graphs:
+                graph.curve.setData(data)
+            fed += 1
+            app.processEvents()
+            if scheduler is not None:
+                scheduler.wait()
+        elapsed = Timing.monotonic() - start
+
+        window.close()
+        window.deleteLater()
+        app.processEvents()
+
+        (p50, p95) = numpy.percentile(paints or [0], (50, 95))
+        return {"config": config, "graphs": count,
+                "pixel_width": pixel_width, "rate": rate,
+                "fed_fps": fed / elapsed,
+                "painted_fps": len(paints) / float(count) / elapsed,
+                "paint_p50": p50, "paint_p95": p95}
+
+    def run(self):
+        """ Print one line per case.
+        """
+        app = QtGui.QApplication([])
+
+        print "%-22s %6s %6s %6s %8s %8s %8s %8s" % \
+            ("config", "graphs", "width", "rate", "fed fps", "painted",
+             "p50 ms", "p95 ms")
+
+        results = []
+        for pixel_width in self.args.pixel_widths:
+            device = Simulation.BankedSpectra(pixel_width, seed=0)
+            frames = [device.read() for index in range(16)]
+
+            for config in self.args.configs:
+                for count in self.args.graphs:
+                    for rate in self.args.rates:
+                        result = self.measure(app, config, count,
+                                              pixel_width, rate, frames)
+                        results.append(result)
+                        print "%-22s %6d %6d %6s %8.1f %8.1f %8.2f %8.2f" % \
+                            (config, count, pixel_width, rate or "max",
+                             result["fed_fps"], result["painted_fps"],
+                             result["paint_p50"] * 1e3,
+                             result["paint_p95"] * 1e3)
+
+        if self.args.output is not None:
+            with open(self.args.output, "w") as output:
+                json.dump({"results": results}, output, indent=1,
+                          sort_keys=True)
+        return 0
+
+def main(argv=None):
+    """ main calls the wrapper code around the application objects with
+    as little framework as possible.
+    """
+    argv = argv[1:]
+    log.debug("Arguments: %s", argv)
+
+    go_app = RenderBenchmarkApplication()
+    go_app.parse_args(argv)
+    return go_app.run()
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
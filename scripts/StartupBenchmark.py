@@ -0,0 +1,120 @@
+""" StartupBenchmark - time how long it takes to get the first frame from
+a set of devices, with a freshly started worker process per device and
+with workers taken from a pre-started WorkerPool.
+"""
+
+import sys
+import time
+import logging
+import argparse
+
+from bluegraph.devices import DeviceWrappers
+
+log = logging.getLogger()
+
+strm = logging.StreamHandler(sys.stderr)
+frmt = logging.Formatter("%(name)s - %(levelname)s %(message)s")
+strm.setFormatter(frmt)
+log.addHandler(strm)
+log.setLevel(logging.WARNING)
+
+class StartupBenchmarkApplication(object):
+    """ Create, connect and read the specified number of devices with
+    each backend, and report the time to the first frame.
+    """
+    def __init__(self):
+        super(StartupBenchmarkApplication, self).__init__()
+        self.parser = self.create_parser()
+        self.args = None
+
+    def parse_args(self, argv):
+        """ Handle any bad arguments, then set defaults.
+        """
+        log.debug("Process args: %s", argv)
+        self.args = self.parser.parse_args(argv)
+        return self.args
+
+    def create_parser(self):
+        """ Create the parser with arguments specific to this
+        application.
+        """
+        desc = "time device startup with and without a worker pool"
+        parser = argparse.ArgumentParser(description=desc)
+
+        parser.add_argument("-d", "--device",
+                            default="Simulation.SimulatedSpectra",
+                            help="device type like Simulation.SimulatedSpectra")
+        parser.add_argument("-n", "--count", type=int, default=8,
+                            help="number of devices to start")
+        parser.add_argument("-r", "--repeat", type=int, default=3,
+                            help="number of runs per backend")
+        return parser
+
+    def time_startup(self, create):
+        """ Return the seconds from creating the devices to having the
+        first frame of each, and the slowest single device.
+        """
+        start = time.time()
+        devices = []
+        slowest = 0
+        for index in range(self.args.count):
+            device_start = time.time()
+            device = create()
+            device.connect()
+            device.read()
+            slowest = max(slowest, time.time() - device_start)
+            devices.append(device)
+        total = time.time() - start
+
+        for device in devices:
+            device.disconnect()
+        return (total, slowest)
+
+    def run(self):
+        """ Print the best run of each backend.
+        """
+        device_type = self.args.device
+        pool = DeviceWrappers.WorkerPool(size=self.args.count,
+                                         preload=[device_type])
+
+        # Give the pool a moment to start, as it would while the
+        # application builds its windows
+        time.sleep(1.0)
+
+        def process():
+            return DeviceWrappers.BlockingInterface(device_type)
+
+        def pooled():
+            return DeviceWrappers.PooledInterface(device_type, pool=pool)
+
+        print "%d x %s, best of %d" % (self.args.count, device_type,
+                                       self.args.repeat)
+        for (name, create) in (("process", process), ("pool", pooled)):
+            runs = []
+            for run in range(self.args.repeat):
+                runs.append(self.time_startup(create))
+
+                # Start the replacements before the next run, as the
+                # application would while idle
+                pool.fill()
+
+            (total, slowest) = min(runs)
+            print "%-8s total %7.1f ms  slowest device %7.1f ms" % \
+                (name, total * 1000.0, slowest * 1000.0)
+
+        pool.close()
+
+def main(argv=None):
+    """ main calls the wrapper code around the application objects with
+    as little framework as possible.
+    """
+    argv = argv[1:]
+    log.debug("Arguments: %s", argv)
+
+    go_app = StartupBenchmarkApplication()
+    go_app.parse_args(argv)
+    go_app.run()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,273 @@
+""" TransportBenchmark - compare throughput, latency and cpu use of the
+direct devices and the device wrappers, without a display.
+"""
+
+import os
+import sys
+import json
+import numpy
+import logging
+import argparse
+
+from bluegraph.devices import Timing
+from bluegraph.devices import Transports
+from bluegraph.devices import DeviceWrappers
+
+log = logging.getLogger()
+
+strm = logging.StreamHandler(sys.stderr)
+frmt = logging.Formatter("%(name)s - %(levelname)s %(message)s")
+strm.setFormatter(frmt)
+log.addHandler(strm)
+log.setLevel(logging.WARNING)
+
+DEVICE_TYPE = "Simulation.BankedSpectra"
+
+def create_direct(device_kwargs):
+    return DeviceWrappers.create_device(DEVICE_TYPE, device_kwargs)
+
+def create_blocking(device_kwargs):
+    return DeviceWrappers.BlockingInterface(DEVICE_TYPE,
+                                            device_kwargs=device_kwargs)
+
+def create_nonblocking(device_kwargs):
+    return DeviceWrappers.NonBlockingInterface(DEVICE_TYPE,
+                                               device_kwargs=device_kwargs)
+
+def create_shared(device_kwargs):
+    transport = Transports.SharedMemoryTransport(slot_bytes=16384 * 8)
+    return DeviceWrappers.BlockingInterface(DEVICE_TYPE, transport=transport,
+                                            device_kwargs=device_kwargs)
+
+def create_threaded(device_kwargs):
+    return DeviceWrappers.ThreadedInterface(DEVICE_TYPE,
+                                            device_kwargs=device_kwargs)
+
+TRANSPORTS = {"direct": create_direct,
+              "blocking": create_blocking,
+              "nonblocking": create_nonblocking,
+              "shared": create_shared,
+              "threaded": create_threaded,
+             }
+
+def process_cpu(pid):
+    """ Return the user plus system cpu seconds of a process, or None
+    where /proc is not available.
+    """
+    try:
+        with open("/proc/%d/stat" % pid) as stat_file:
+            fields = stat_file.read().rsplit(")", 1)[1].split()
+    except IOError:
+        return None
+    ticks = float(os.sysconf("SC_CLK_TCK"))
+    return (int(fields[11]) + int(fields[12])) / ticks
+
+def own_cpu():
+    times = os.times()
+    return times[0] + times[1]
+
+def case_key(case):
+    return "%(transport)s/%(pixel_width)d/%(dtype)s/%(devices)d" % case
+
+class TransportBenchmarkApplication(object):
+    """ Read simulated spectra through every combination of transport,
+    pixel width, dtype and device count, then print and optionally save
+    frames per second, MB per second, cpu use and frame latency
+    percentiles. Latency is from the device read completing to the
+    reader having the frame, so it is near zero for direct devices. cpu
+    is the reader process, worker the mean of each worker process where
+    /proc is available. Results can be compared against a saved baseline,
+    the exit code is 1 if any case regressed.
+    """
+    def __init__(self):
+        super(TransportBenchmarkApplication, self).__init__()
+        self.parser = self.create_parser()
+        self.args = None
+
+    def parse_args(self, argv):
+        """ Handle any bad arguments, then set defaults.
+        """
+        log.debug("Process args: %s", argv)
+        self.args = self.parser.parse_args(argv)
+        return self.args
+
+    def create_parser(self):
+        """ Create the parser with arguments specific to this
+        application.
+        """
+        desc = "benchmark device transports on simulated spectra"
+        parser = argparse.ArgumentParser(description=desc)
+
+        parser.add_argument("-t", "--transports", nargs="+",
+                            default=["direct", "blocking", "nonblocking",
+                                     "shared", "threaded"],
+                            choices=sorted(TRANSPORTS),
+                            help="transports to measure")
+        parser.add_argument("-w", "--pixel-widths", type=int, nargs="+",
+                            default=[256, 1024, 4096, 16384],
+                            help="pixels per frame")
+        parser.add_argument("--dtypes", nargs="+",
+                            default=["uint16", "float64"],
+                            help="numpy dtypes of the frames")
+        parser.add_argument("-n", "--devices", type=int, nargs="+",
+                            default=[1, 4],
+                            help="numbers of devices read together")
+        parser.add_argument("-s", "--seconds", type=float, default=1.0,
+                            help="measured time per case")
+        parser.add_argument("-o", "--output", default=None,
+                            help="write the results to this JSON file")
+        parser.add_argument("-b", "--baseline", default=None,
+                            help="compare against results in this file")
+        parser.add_argument("--tolerance", type=float, default=0.2,
+                            help="fraction worse than the baseline that is "
+                                 "flagged as a regression")
+        return parser
+
+    def cases(self):
+        for transport in self.args.transports:
+            for pixel_width in self.args.pixel_widths:
+                for dtype in self.args.dtypes:
+                    for devices in self.args.devices:
+                        yield {"transport": transport,
+                               "pixel_width": pixel_width,
+                               "dtype": dtype, "devices": devices}
+
+    def measure(self, case):
+        """ Read round robin from the devices of the case for the
+        configured time, and return the case with its results.
+        """
+        device_kwargs = {"pixel_width": case["pixel_width"],
+                         "dtype": numpy.dtype(case["dtype"])}
+        create = TRANSPORTS[case["transport"]]
+        devices = [create(device_kwargs) for index in range(case["devices"])]
+        for device in devices:
+            device.connect()
+
+        # Warm up, so startup is not measured
+        for device in devices:
+            frame = None
+            while frame is None:
+                frame = DeviceWrappers.read_frame(device)
+
+        pids = [device.process.pid for device in devices
+                if hasattr(device, "process")
+                and hasattr(device.process, "pid")]
+        worker_start = [process_cpu(pid) for pid in pids]
+        reader_start = own_cpu()
+
+        latencies = []
+        start = Timing.monotonic()
+        deadline = start + self.args.seconds
+        while Timing.monotonic() < deadline:
+            for device in devices:
+                frame = DeviceWrappers.read_frame(device)
+                if frame is not None:
+                    latencies.append(frame.age())
+        elapsed = Timing.monotonic() - start
+
+        reader_cpu = own_cpu() - reader_start
+        worker_cpu = None
+        worker_end = [process_cpu(pid) for pid in pids]
+        if pids and None not in worker_start + worker_end:
+            used = numpy.subtract(worker_end, worker_start)
+            worker_cpu = float(used.mean()) / elapsed
+
+        for device in devices:
+            if hasattr(device, "disconnect"):
+                device.disconnect()
+
+        frames = len(latencies)
+        itemsize = numpy.dtype(case["dtype"]).itemsize
+        (p50, p95, p99) = numpy.percentile(latencies or [0], (50, 95, 99))
+        result = dict(case)
+        result.update({"frames": frames,
+                       "fps": frames / elapsed,
+                       "mb_per_second":
+                           frames * case["pixel_width"] * itemsize
+                           / elapsed / 1e6,
+                       "reader_cpu": reader_cpu / elapsed,
+                       "worker_cpu": worker_cpu,
+                       "latency_p50": p50,
+                       "latency_p95": p95,
+                       "latency_p99": p99})
+        return result
+
+    def compare(self, results, baseline):
+        """ Return a message for every case slower, or with a higher
+        p95 latency, than its baseline by more than the tolerance.
+        """
+        previous = dict((case_key(result), result) for result in baseline)
+        tolerance = self.args.tolerance
+        regressions = []
+        for result in results:
+            key = case_key(result)
+            if key not in previous:
+                continue
+            before = previous[key]
+            if result["fps"] < before["fps"] * (1.0 - tolerance):
+                regressions.append("%s fps %.0f, baseline %.0f" %
+                                   (key, result["fps"], before["fps"]))
+            # Sub-millisecond latencies are all noise
+            latency_limit = max(before["latency_p95"] * (1.0 + tolerance),
+                                0.001)
+            if result["latency_p95"] > latency_limit:
+                regressions.append("%s p95 latency %.2f ms, baseline "
+                                   "%.2f ms" %
+                                   (key, result["latency_p95"] * 1e3,
+                                    before["latency_p95"] * 1e3))
+        return regressions
+
+    def run(self):
+        """ Print one line per case, then any regressions. Return the
+        exit code.
+        """
+        print "%-12s %6s %8s %3s %9s %9s %6s %6s %8s %8s %8s" % \
+            ("transport", "width", "dtype", "n", "fps", "MB/s", "cpu",
+             "worker", "p50 ms", "p95 ms", "p99 ms")
+
+        results = []
+        for case in self.cases():
+            result = self.measure(case)
+            results.append(result)
+
+            worker_cpu = "-"
+            if result["worker_cpu"] is not None:
+                worker_cpu = "%.0f%%" % (result["worker_cpu"] * 100.0)
+            print "%-12s %6d %8s %3d %9.0f %9.1f %5.0f%% %6s %8.3f " \
+                  "%8.3f %8.3f" % \
+                (result["transport"], result["pixel_width"], result["dtype"],
+                 result["devices"], result["fps"], result["mb_per_second"],
+                 result["reader_cpu"] * 100.0, worker_cpu,
+                 result["latency_p50"] * 1e3, result["latency_p95"] * 1e3,
+                 result["latency_p99"] * 1e3)
+
+        if self.args.output is not None:
+            with open(self.args.output, "w") as output:
+                json.dump({"results": results}, output, indent=1,
+                          sort_keys=True)
+
+        if self.args.baseline is None:
+            return 0
+
+        with open(self.args.baseline) as baseline:
+            regressions = self.compare(results, json.load(baseline)["results"])
+        for regression in regressions:
+            print "REGRESSION %s" % regression
+        if regressions:
+            return 1
+        print "No regressions against %s" % self.args.baseline
+        return 0
+
+def main(argv=None):
+    """ main calls the wrapper code around the application objects with
+    as little framework as possible.
+    """
+    argv = argv[1:]
+    log.debug("Arguments: %s", argv)
+
+    go_app = TransportBenchmarkApplication()
+    go_app.parse_args(argv)
+    return go_app.run()
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -6,7 +6,9 @@ import logging
 from PySide import QtTest
 
 from bluegraph import control
+from bluegraph import recorder
 from bluegraph.devices import Simulation
+from bluegraph.devices import DeviceWrappers
 
 
 log = logging.getLogger()
@@ -109,6 +111,24 @@ class TestControllerSpeed:
         assert simulator.render_fps.rate() > simulator.data_fps.rate()
         simulator.form.closeEvent(None)
 
+    def test_nonblocking_idle_controller_waits_for_wakeups(self, qtbot):
+        cb = control.BlueGraphController
+        simulator = cb(device_class="DeviceWrappers",
+                       device_type="NonBlockingInterface",
+                       device_args="Simulation.RegulatedSpectra")
+        assert simulator.notifier is not None
+
+        signal = simulator.form.customContextMenuRequested
+        with qtbot.wait_signal(signal, timeout=2000):
+            simulator.form.show()
+
+        # A spinning loop runs thousands of passes a second, waiting on
+        # the wakeup takes a few per frame
+        assert simulator.data_fps.rate() > 2
+        assert simulator.render_fps.rate() < 50 * simulator.data_fps.rate()
+        assert simulator.render_fps.rate() < 1000
+        simulator.form.closeEvent(None)
+
 class TestControllerDevices:
     def test_control_creates_simulation_device(self, qtbot):
         simulator = control.BlueGraphController()
@@ -142,3 +162,51 @@ class TestControllerDevices:
             simulator.form.show()
         points = simulator.form.curve.getData()
         assert len(points[0]) == 20
+
+    def test_direct_device_records_through_a_wrapper(self, qtbot, tmpdir):
+        path = str(tmpdir.join("direct.bgf"))
+        frame_recorder = recorder.FrameRecorder(path)
+        simulator = control.BlueGraphController(recorder=frame_recorder)
+        assert isinstance(simulator.device,
+                          DeviceWrappers.NonBlockingInterface)
+        assert simulator.device.recorder is frame_recorder
+        simulator.form.closeEvent(None)
+
+class TestAsyncController:
+    def test_nonblocking_device_updates_display(self, qtbot):
+        cb = control.AsyncBlueGraphController
+        simulator = cb(device_class="DeviceWrappers",
+                       device_type="NonBlockingInterface",
+                       device_args="Simulation.RegulatedSpectra")
+
+        signal = simulator.form.customContextMenuRequested
+        with qtbot.wait_signal(signal, timeout=2000):
+            simulator.form.show()
+
+        assert simulator.data_fps.rate() > 2
+        assert simulator.form.graphback.minimum.text == "100.00"
+        assert simulator.form.graphback.maximum.text == "65535.00"
+        simulator.form.closeEvent(None)
+
+class TestStageTiming:
+    def test_stages_are_timed_and_overlay_toggles(self, qtbot):
+        simulator = control.BlueGraphController()
+
+        signal = simulator.form.customContextMenuRequested
+        with qtbot.wait_signal(signal, timeout=1000):
+            simulator.form.show()
+
+        for stage in ("read", "transit", "set_data", "min_max", "paint"):
+            assert simulator.stages.percentiles(stage) is not None
+
+        overlay = simulator.form.graphback.timing
+        assert not overlay.isVisible()
+        qtbot.keyPress(simulator.form, "T")
+        assert overlay.isVisible()
+
+        with qtbot.wait_signal(signal, timeout=500):
+            simulator.form.show()
+        assert overlay.text().startswith("stage")
+
+        assert "paint histogram" in simulator.dump_timing()
+        simulator.form.closeEvent(None)
@@ -1,12 +1,25 @@
 """ unit and functional tests for bluegraph application.
 """
+import os
 import sys
+import json
+import Queue
+import pickle
+import select
 import time
 import numpy
 import pytest
 import logging
 
+from bluegraph import recorder
 from bluegraph.devices import Simulation
+from bluegraph.devices import Timing
+from bluegraph.devices import Buffers
+from bluegraph.devices import Registry
+from bluegraph.devices import Processing
+from bluegraph.devices import Tracing
+from bluegraph.devices import Instrumentation
+from bluegraph.devices import Transports
 from bluegraph.devices import DeviceWrappers
 
 
@@ -72,6 +85,54 @@ class TestStripChartDevice:
 
         assert len(device.read()) == 20
 
+    def test_history_is_a_contiguous_array(self, device):
+        for i in range(25):
+            result = device.read()
+
+        assert isinstance(result, numpy.ndarray)
+        assert result.flags["C_CONTIGUOUS"]
+        assert len(result) == 20
+
+class TestHistoryRing:
+    def test_view_rolls_oldest_first(self):
+        ring = Buffers.HistoryRing(4)
+        for value in range(3):
+            ring.append(value, stamp=value * 10.0)
+        assert list(ring.view()) == [0, 1, 2]
+        assert list(ring.timestamps()) == [0, 10, 20]
+
+        for value in range(3, 7):
+            ring.append(value, stamp=value * 10.0)
+        assert list(ring.view()) == [3, 4, 5, 6]
+        assert list(ring.timestamps()) == [30, 40, 50, 60]
+        assert len(ring) == 4
+        assert ring.total == 7
+
+    def test_view_shares_memory_with_ring(self):
+        ring = Buffers.HistoryRing(1000000)
+        for value in range(10):
+            ring.append(value)
+        view = ring.view()
+        assert view.base is ring.values
+        assert view.flags["C_CONTIGUOUS"]
+
+    def test_extend_matches_appends(self):
+        appended = Buffers.HistoryRing(5)
+        extended = Buffers.HistoryRing(5)
+        extended.append(-1, 0.0)
+        appended.append(-1, 0.0)
+        for value in range(8):
+            appended.append(value, float(value))
+        extended.extend(numpy.arange(8), numpy.arange(8.0))
+
+        assert list(extended.view()) == list(appended.view())
+        assert list(extended.timestamps()) == list(appended.timestamps())
+        assert extended.total == appended.total == 9
+
+    def test_zero_capacity_raises(self):
+        with pytest.raises(ValueError):
+            Buffers.HistoryRing(0)
+
 class TestSimulatedLaserPowerMeter:
     def test_list_hardware_returns_simulated_device(self):
         device = Simulation.SimulatedLaserPowerMeter()
@@ -250,3 +311,1440 @@ class TestRegulatedSpectra:
         assert time_diff <= 2.1
 
         assert device.disconnect() == True
+
+class TestSharedMemoryInterface:
+    def test_connect_and_disconnect_close_effectively(self):
+        shared = DeviceWrappers.SharedMemoryInterface()
+        assert shared.connect() == True
+        assert shared.disconnect() == True
+
+    def test_frames_are_views_on_shared_memory(self):
+        shared = DeviceWrappers.SharedMemoryInterface()
+        shared.connect()
+        first = numpy.array(shared.read())
+        second = shared.read()
+        shared.disconnect()
+
+        assert len(second) == 1024
+        assert second.base is not None
+        assert numpy.array_equal(first, second) == False
+        assert second[0] == 100
+        assert second[-1] == 65535
+
+    def test_ring_slots_are_reused(self):
+        shared = DeviceWrappers.SharedMemoryInterface(slots=2)
+        shared.connect()
+        for i in range(10):
+            assert len(shared.read()) == 1024
+        assert shared.disconnect() == True
+
+    def test_non_array_readings_fall_back_to_queue(self):
+        shared = DeviceWrappers.SharedMemoryInterface(
+            "Simulation.StripChartDevice")
+        shared.connect()
+        shared.read()
+        assert len(shared.read()) == 2
+        shared.disconnect()
+
+    def test_nonblocking_shared_memory_returns_data(self):
+        nblk = DeviceWrappers.NonBlockingSharedMemoryInterface()
+        nblk.connect()
+        result = nblk.read()
+        while result is None:
+            result = nblk.read()
+        assert len(result) == 1024
+        assert nblk.disconnect() == True
+
+    def test_chooser_creates_shared_memory_interface(self):
+        dev_wrap = DeviceWrappers.DeviceChooser()
+        device = dev_wrap.create("DeviceWrappers",
+                                 "NonBlockingSharedMemoryInterface",
+                                 "Simulation.SimulatedSpectra")
+        assert device.connect() == True
+        assert device.disconnect() == True
+
+class TestStreamingInterface:
+    def test_connect_and_disconnect_close_effectively(self):
+        stream = DeviceWrappers.StreamingInterface()
+        assert stream.connect() == True
+        assert stream.disconnect() == True
+
+    def test_unknown_overflow_policy_is_rejected(self):
+        with pytest.raises(ValueError):
+            DeviceWrappers.StreamingInterface(overflow="drop-middle")
+
+    def test_read_returns_newest_and_counts_skipped(self):
+        stream = DeviceWrappers.StreamingInterface(buffer_size=4)
+        stream.connect()
+
+        # SimulatedDevice reads at 10Hz, let the buffer fill and overflow
+        time.sleep(1.0)
+        result = stream.read()
+        assert result is not None
+        assert stream.frames_skipped >= 6
+        assert stream.read() is None
+        assert stream.disconnect() == True
+
+    def test_drop_newest_and_block_policies_stream(self):
+        for policy in ("drop-newest", "block"):
+            stream = DeviceWrappers.StreamingInterface(buffer_size=2,
+                                                       overflow=policy)
+            stream.connect()
+            time.sleep(0.5)
+            assert stream.read() is not None
+            assert stream.disconnect() == True
+
+    def test_streaming_is_not_throttled_by_reader(self):
+        stream = DeviceWrappers.StreamingInterface("Simulation.SimulatedSpectra")
+        stream.connect()
+
+        total_frames = 0
+        start_time = time.time()
+        while time.time() - start_time < 0.5:
+            if stream.read() is not None:
+                total_frames += 1 + stream.frames_skipped
+            time.sleep(0.05)
+
+        assert total_frames > 20
+        assert stream.disconnect() == True
+
+    def test_streaming_read_full_between_decimated_frames(self):
+        stream = DeviceWrappers.StreamingInterface("Simulation.SimulatedSpectra")
+        stream.set_plot_width(100)
+        stream.connect()
+        result = stream.read()
+        while result is None:
+            result = stream.read()
+        assert len(result) == 200
+
+        full = stream.read_full()
+        assert len(full.data) == 1024
+        assert full.x is None
+
+        frame = stream.read_frame()
+        while frame is None:
+            frame = stream.read_frame()
+        assert len(frame.data) == 200
+        assert frame.sequence > full.sequence
+        assert stream.disconnect() == True
+
+    def test_streaming_over_shared_memory(self):
+        transport = Transports.SharedMemoryTransport(slots=8)
+        stream = DeviceWrappers.StreamingInterface("Simulation.SimulatedSpectra",
+                                                   transport=transport)
+        stream.connect()
+        for i in range(20):
+            result = stream.read()
+            while result is None:
+                result = stream.read()
+            assert len(result) == 1024
+        assert stream.disconnect() == True
+
+class TestReadMany:
+    def test_blocking_read_many_stacks_frames(self):
+        block = DeviceWrappers.BlockingInterface("Simulation.SimulatedSpectra")
+        block.connect()
+        (frames, stamps) = block.read_many(max_frames=50, timeout=5.0)
+        assert block.disconnect() == True
+
+        assert frames.shape == (50, 1024)
+        assert len(stamps) == 50
+        assert numpy.all(numpy.diff(stamps) >= 0)
+
+    def test_read_many_stops_at_timeout(self):
+        block = DeviceWrappers.BlockingInterface()
+        block.connect()
+
+        # SimulatedDevice reads at 10Hz
+        (frames, stamps) = block.read_many(max_frames=100, timeout=0.45)
+        assert block.disconnect() == True
+        assert 4 <= len(frames) <= 6
+        assert frames.shape[1] == 1
+
+    def test_history_batches_are_successive_copies(self):
+        kwargs = {"size": 3}
+        block = DeviceWrappers.BlockingInterface("Simulation.StripChartDevice",
+                                                 device_kwargs=kwargs)
+        block.connect()
+        for i in range(3):
+            block.read()
+        (frames, stamps) = block.read_many(max_frames=3, timeout=5.0)
+        assert block.disconnect() == True
+
+        assert frames.shape == (3, 3)
+        assert list(frames[1][:-1]) == list(frames[0][1:])
+        assert list(frames[2][:-1]) == list(frames[1][1:])
+
+    def test_failed_batch_raises_and_the_worker_carries_on(self):
+        kwargs = {"size": 5}
+        block = DeviceWrappers.BlockingInterface("Simulation.StripChartDevice",
+                                                 device_kwargs=kwargs)
+        block.connect()
+
+        # The history grows between readings, they can't be stacked
+        with pytest.raises(IOError):
+            block.read_many(max_frames=3, timeout=5.0)
+        assert len(block.read()) == 4
+        assert block.disconnect() == True
+
+    def test_nonblocking_read_many_keeps_outstanding_frame(self):
+        nblk = DeviceWrappers.NonBlockingInterface("Simulation.SimulatedSpectra")
+        nblk.connect()
+        nblk.send_acquire()
+        assert nblk.acquire_sent == True
+
+        (frames, stamps) = nblk.read_many(max_frames=10, timeout=5.0)
+        assert frames.shape == (10, 1024)
+        assert len(stamps) == 10
+        assert nblk.acquire_sent == False
+        assert nblk.disconnect() == True
+
+    def test_nonblocking_read_many_is_full_resolution_when_decimating(self):
+        nblk = DeviceWrappers.NonBlockingInterface("Simulation.SimulatedSpectra")
+        nblk.connect()
+        nblk.set_plot_width(100)
+        nblk.read()
+        assert nblk.acquire_sent == True
+
+        (frames, stamps) = nblk.read_many(max_frames=5, timeout=1.0)
+        assert frames.shape == (5, 1024)
+        assert len(stamps) == 5
+        assert nblk.acquire_sent == False
+        assert nblk.disconnect() == True
+
+    def test_streaming_read_many_returns_every_buffered_frame(self):
+        stream = DeviceWrappers.StreamingInterface(buffer_size=100)
+        stream.connect()
+        time.sleep(0.55)
+        (frames, stamps) = stream.read_many(max_frames=100, timeout=1.0)
+        assert 4 <= len(frames) <= 7
+        assert stream.frames_skipped == 0
+        assert stream.disconnect() == True
+
+class TestZMQStreaming:
+    @pytest.fixture
+    def server(self, request):
+        pytest.importorskip("zmq")
+        endpoint = "ipc:///tmp/bluegraph-test-%s" % id(request)
+        server = DeviceWrappers.DeviceServer("Simulation.SimulatedSpectra",
+                                             endpoint=endpoint)
+        assert server.start() == True
+        request.addfinalizer(server.stop)
+        return server
+
+    def wait_for_frame(self, subscriber):
+        start_time = time.time()
+        result = subscriber.read()
+        while result is None and time.time() - start_time < 5.0:
+            time.sleep(0.01)
+            result = subscriber.read()
+        return result
+
+    def test_subscriber_receives_published_frames(self, server):
+        sub = DeviceWrappers.SubscriberInterface(server.endpoint)
+        assert sub.connect() == True
+        result = self.wait_for_frame(sub)
+        assert len(result) == 1024
+        assert result[0] == 100
+        assert result[-1] == 65535
+        assert sub.header["device_id"] == "Simulation.SimulatedSpectra"
+        assert sub.disconnect() == True
+
+    def test_multiple_subscribers_share_one_device(self, server):
+        subs = [DeviceWrappers.SubscriberInterface(server.endpoint)
+                for i in range(3)]
+        for sub in subs:
+            sub.connect()
+        for sub in subs:
+            assert len(self.wait_for_frame(sub)) == 1024
+            sub.disconnect()
+
+    def test_device_id_filters_subscription(self, server):
+        sub = DeviceWrappers.SubscriberInterface(server.endpoint,
+                                                 device_id="other")
+        sub.connect()
+        time.sleep(0.3)
+        assert sub.read() is None
+        sub.disconnect()
+
+    def test_device_id_is_not_a_prefix_match(self, server):
+        # The server publishes as Simulation.SimulatedSpectra
+        prefix = DeviceWrappers.SubscriberInterface(
+            server.endpoint, device_id="Simulation.Simulated")
+        exact = DeviceWrappers.SubscriberInterface(
+            server.endpoint, device_id="Simulation.SimulatedSpectra")
+        prefix.connect()
+        exact.connect()
+        assert self.wait_for_frame(exact) is not None
+        assert prefix.read() is None
+        prefix.disconnect()
+        exact.disconnect()
+
+    def test_slow_subscriber_counts_skipped_frames(self, server):
+        sub = DeviceWrappers.SubscriberInterface(server.endpoint)
+        sub.connect()
+        self.wait_for_frame(sub)
+        time.sleep(0.2)
+        assert sub.read() is not None
+        assert sub.frames_skipped > 0
+        sub.disconnect()
+
+class TestDeviceHost:
+    def wait_for_read(self, device):
+        result = device.read()
+        while result is None:
+            result = device.read()
+        return result
+
+    def test_hosted_devices_share_one_process(self):
+        host = DeviceWrappers.DeviceHost()
+        devices = []
+        for device_type in ("Simulation.StripChartDevice",
+                            "Simulation.StripChartDevice",
+                            "Simulation.SimulatedSpectra"):
+            hosted = DeviceWrappers.HostedInterface(device_type, host=host)
+            assert hosted.connect() == True
+            devices.append(hosted)
+
+        assert host.process.is_alive()
+        assert len(set(device.device_id for device in devices)) == 3
+
+        assert len(self.wait_for_read(devices[0])) == 1
+        assert len(self.wait_for_read(devices[0])) == 2
+        assert len(self.wait_for_read(devices[2])) == 1024
+
+        for hosted in devices:
+            assert hosted.disconnect() == True
+        assert host.process is None
+
+    def test_late_commands_do_not_stop_the_host(self):
+        host = DeviceWrappers.DeviceHost()
+        kept = DeviceWrappers.HostedInterface("Simulation.SimulatedSpectra",
+                                              host=host)
+        gone = DeviceWrappers.HostedInterface("Simulation.SimulatedSpectra",
+                                              host=host)
+        kept.connect()
+        gone.connect()
+        assert gone.disconnect() == True
+
+        # Racing the disconnect, or for an id the host never had
+        host.acquire(gone.device_id)
+        host.set_plot_width(gone.device_id, 100)
+        host.resync(999)
+        assert host.queue_command(("DISCONNECT", gone.device_id),
+                                  "disconnect_successful") == True
+
+        assert len(self.wait_for_read(kept)) == 1024
+        assert host.process.is_alive()
+        assert kept.disconnect() == True
+
+    def test_hosted_devices_decimate_to_plot_width(self):
+        host = DeviceWrappers.DeviceHost()
+        early = DeviceWrappers.HostedInterface("Simulation.SimulatedSpectra",
+                                               host=host)
+        early.set_plot_width(100)
+        late = DeviceWrappers.HostedInterface("Simulation.SimulatedSpectra",
+                                              host=host)
+        early.connect()
+        late.connect()
+
+        assert len(self.wait_for_read(early)) == 200
+        assert len(self.wait_for_read(late)) == 1024
+        late.set_plot_width(50)
+        assert len(self.wait_for_read(late)) == 100
+        late.set_plot_width(0)
+        assert len(self.wait_for_read(late)) == 1024
+
+        early.disconnect()
+        late.disconnect()
+
+    def test_slow_device_does_not_block_others(self):
+        host = DeviceWrappers.DeviceHost()
+        slow = DeviceWrappers.HostedInterface("Simulation.RegulatedSpectra",
+                                              host=host)
+        fast = DeviceWrappers.HostedInterface("Simulation.SimulatedSpectra",
+                                              host=host)
+        slow.connect()
+        fast.connect()
+
+        slow_reads = 0
+        fast_reads = 0
+        start_time = time.time()
+        while time.time() - start_time < 1.0:
+            if slow.read() is not None:
+                slow_reads += 1
+            if fast.read() is not None:
+                fast_reads += 1
+
+        slow.disconnect()
+        fast.disconnect()
+        assert 4 <= slow_reads <= 6
+        assert fast_reads > 50
+
+    def test_host_restarts_after_last_disconnect(self):
+        host = DeviceWrappers.DeviceHost()
+        hosted = DeviceWrappers.HostedInterface(host=host)
+        hosted.connect()
+        hosted.disconnect()
+
+        hosted = DeviceWrappers.HostedInterface(host=host)
+        assert hosted.connect() == True
+        assert self.wait_for_read(hosted) is not None
+        assert hosted.disconnect() == True
+
+    def test_interval_spaces_reads(self):
+        host = DeviceWrappers.DeviceHost()
+        hosted = DeviceWrappers.HostedInterface("Simulation.SimulatedSpectra",
+                                                host=host, interval=0.1)
+        hosted.connect()
+        start_time = time.time()
+        for i in range(5):
+            self.wait_for_read(hosted)
+        time_diff = time.time() - start_time
+        hosted.disconnect()
+        assert time_diff >= 0.39
+
+    def test_failed_connect_raises_and_stops_the_host(self):
+        host = DeviceWrappers.DeviceHost()
+        hosted = DeviceWrappers.HostedInterface(
+            "Simulation.SimulatedSpectra", host=host,
+            device_kwargs={"no_such_argument": 1})
+        with pytest.raises(IOError):
+            hosted.connect()
+        assert host.process is None
+
+        hosted = DeviceWrappers.HostedInterface(host=host)
+        assert hosted.connect() == True
+        assert hosted.disconnect() == True
+
+    def test_chooser_hands_out_proxies_to_shared_host(self):
+        dev_wrap = DeviceWrappers.DeviceChooser()
+        first = dev_wrap.create("DeviceWrappers", "HostedInterface",
+                                "Simulation.StripChartDevice")
+        second = dev_wrap.create("DeviceWrappers", "HostedInterface",
+                                 "Simulation.SimulatedDevice")
+        assert first.host is second.host
+        assert first.connect() == True
+        assert second.connect() == True
+        assert first.disconnect() == True
+        assert second.disconnect() == True
+
+class TestThreadedInterface:
+    def test_connect_and_disconnect_close_effectively(self):
+        threaded = DeviceWrappers.ThreadedInterface()
+        assert threaded.connect() == True
+        assert threaded.disconnect() == True
+        assert threaded.process.is_alive() == False
+
+    def test_blocking_data_stream_is_time_locked(self):
+        threaded = DeviceWrappers.ThreadedInterface()
+        threaded.connect()
+
+        start_time = time.time()
+        first = threaded.read()
+        for i in range(9):
+            second = threaded.read()
+        time_diff = time.time() - start_time
+        threaded.disconnect()
+
+        assert first != second
+        assert time_diff > 0.9
+        assert time_diff < 1.1
+
+    def test_nonblocking_wait_for_data_is_time_locked(self):
+        nblk = DeviceWrappers.NonBlockingThreadedInterface()
+        nblk.connect()
+        total_reads = 0
+        start_time = time.time()
+        for i in range(10):
+            result = nblk.read()
+            while result is None:
+                total_reads += 1
+                result = nblk.read()
+        time_diff = time.time() - start_time
+        assert nblk.disconnect() == True
+
+        assert total_reads > 100
+        assert time_diff >= 0.9
+        assert time_diff <= 1.1
+
+    def test_read_many_from_thread(self):
+        threaded = DeviceWrappers.ThreadedInterface("Simulation.SimulatedSpectra")
+        threaded.connect()
+        (frames, stamps) = threaded.read_many(max_frames=20, timeout=5.0)
+        threaded.disconnect()
+        assert frames.shape == (20, 1024)
+
+    def test_worker_thread_never_writes_a_returned_history(self):
+        nblk = DeviceWrappers.NonBlockingThreadedInterface(
+            "Simulation.StripChartDevice")
+        nblk.connect()
+        frame = None
+        while frame is None:
+            frame = nblk.read_frame()
+        held = frame.data
+        kept = held.copy()
+
+        # Let the worker thread read the device, and append to its ring,
+        # twice while the view is held
+        for index in range(2):
+            nblk.send_acquire()
+            start_time = time.time()
+            while nblk.data_queue.qsize() == 0:
+                assert time.time() - start_time < 5.0
+                time.sleep(0.01)
+            nblk.data_queue.get()
+            nblk.acquire_sent = False
+        assert nblk.disconnect() == True
+
+        assert (held == kept).all()
+
+    def test_default_backend_is_nonblocking_process(self):
+        chooser = DeviceWrappers.DeviceChooser()
+        device = chooser.create_backend("Simulation.SimulatedDevice")
+        assert isinstance(device, DeviceWrappers.NonBlockingInterface)
+        assert device.connect() == True
+        assert device.disconnect() == True
+
+    def test_configured_backends_are_used(self):
+        backends = {"Simulation.SimulatedDevice": "thread",
+                    "Simulation.SimulatedSpectra": "inline",
+                   }
+        chooser = DeviceWrappers.DeviceChooser(backends)
+
+        device = chooser.create_backend("Simulation.SimulatedDevice")
+        assert isinstance(device, DeviceWrappers.NonBlockingThreadedInterface)
+
+        device = chooser.create_backend("Simulation.SimulatedDevice",
+                                        blocking=True)
+        assert type(device) is DeviceWrappers.ThreadedInterface
+
+        device = chooser.create_backend("Simulation.SimulatedSpectra")
+        assert isinstance(device, Simulation.SimulatedSpectra)
+
+    def test_unknown_backend_is_rejected(self):
+        chooser = DeviceWrappers.DeviceChooser()
+        with pytest.raises(ValueError):
+            chooser.create_backend("Simulation.SimulatedDevice",
+                                   backend="host", blocking=True)
+
+class TestReadAsync:
+    def wait_for(self, pending):
+        start_time = time.time()
+        while not pending.poll():
+            assert time.time() - start_time < 5.0
+        return pending.result
+
+    def test_direct_devices_complete_immediately(self):
+        device = Simulation.SimulatedSpectra()
+        device.connect()
+        pending = DeviceWrappers.read_async(device)
+        assert pending.done == True
+        assert len(pending.result.data) == 1024
+        assert pending.result.sequence is None
+
+    def test_blocking_read_async_does_not_block(self):
+        block = DeviceWrappers.BlockingInterface()
+        block.connect()
+
+        start_time = time.time()
+        pending = DeviceWrappers.read_async(block)
+        assert pending.poll() == False
+        assert time.time() - start_time < 0.05
+
+        assert self.wait_for(pending) is not None
+        assert block.disconnect() == True
+
+    def test_many_devices_are_awaited_concurrently(self):
+        devices = [DeviceWrappers.NonBlockingInterface() for i in range(3)]
+        for device in devices:
+            device.connect()
+
+        start_time = time.time()
+        pending = [DeviceWrappers.read_async(device) for device in devices]
+        for item in pending:
+            self.wait_for(item)
+        time_diff = time.time() - start_time
+
+        for device in devices:
+            assert device.disconnect() == True
+        assert time_diff < 0.2
+
+    def test_disconnect_with_read_in_flight(self):
+        block = DeviceWrappers.BlockingInterface()
+        block.connect()
+        block.read_async()
+        assert block.disconnect() == True
+
+class TestFrameEnvelope:
+    def test_blocking_frames_carry_sequence_and_timestamp(self):
+        block = DeviceWrappers.BlockingInterface("Simulation.SimulatedSpectra")
+        block.connect()
+        cue_time = Timing.monotonic()
+        first = block.read_frame()
+        second = block.read_frame()
+        block.disconnect()
+
+        assert first.sequence == 0
+        assert second.sequence == 1
+        assert cue_time <= first.timestamp <= second.timestamp
+        assert second.timestamp <= Timing.monotonic()
+        assert first.device_id == "Simulation.SimulatedSpectra"
+        assert len(second.data) == 1024
+
+    def test_device_id_can_be_assigned(self):
+        nblk = DeviceWrappers.NonBlockingInterface(device_id="amps")
+        nblk.connect()
+        frame = nblk.read_frame()
+        while frame is None:
+            frame = nblk.read_frame()
+        nblk.disconnect()
+        assert frame.device_id == "amps"
+        assert frame.age() >= 0
+
+    def test_streaming_sequence_gaps_match_skipped(self):
+        stream = DeviceWrappers.StreamingInterface(buffer_size=2)
+        stream.connect()
+        time.sleep(0.6)
+        frame = stream.read_frame()
+        assert frame.sequence >= 4
+        assert stream.frames_skipped == frame.sequence
+        assert stream.disconnect() == True
+
+    def test_hosted_frames_are_tagged_with_host_id(self):
+        host = DeviceWrappers.DeviceHost()
+        hosted = DeviceWrappers.HostedInterface(host=host)
+        hosted.connect()
+        frames = []
+        while len(frames) < 2:
+            frame = hosted.read_frame()
+            if frame is not None:
+                frames.append(frame)
+        hosted.disconnect()
+        assert [frame.sequence for frame in frames] == [0, 1]
+        assert frames[0].device_id == hosted.device_id
+
+    def test_direct_devices_are_wrapped(self):
+        device = Simulation.SimulatedSpectra()
+        device.connect()
+        frame = DeviceWrappers.read_frame(device)
+        assert frame.sequence is None
+        assert len(frame.data) == 1024
+
+    def test_clock_is_monotonic(self):
+        first = Timing.monotonic()
+        second = Timing.monotonic()
+        assert second >= first
+
+class TestFrameStatistics:
+    def test_statistics_match_numpy(self):
+        data = numpy.array([5.0, 100.0, 65535.0, 3.0, 65535.0])
+        stats = Processing.FrameStatistics().compute(data)
+        assert stats["min"] == 3.0
+        assert stats["max"] == 65535.0
+        assert stats["argmax"] == 2
+        assert stats["mean"] == numpy.mean(data)
+        assert stats["saturated"] == 2
+        assert "argmin" not in stats
+
+    def test_statistics_set_is_configurable(self):
+        statistics = Processing.FrameStatistics(("argmin", "max"),
+                                                saturation=10)
+        stats = statistics.compute([4, 2, 8])
+        assert stats == {"argmin": 1, "max": 8}
+
+        with pytest.raises(ValueError):
+            Processing.FrameStatistics(("median",))
+
+    def test_saturated_count_with_and_without_the_maximum(self):
+        data = numpy.array([1, 7, 9, 7])
+        for stats in (("saturated",), ("max", "saturated")):
+            statistics = Processing.FrameStatistics(stats, saturation=7)
+            assert statistics.compute(data)["saturated"] == 3
+            statistics = Processing.FrameStatistics(stats, saturation=10)
+            assert statistics.compute(data)["saturated"] == 0
+
+    def test_worker_attaches_statistics(self):
+        block = DeviceWrappers.BlockingInterface("Simulation.SimulatedSpectra")
+        block.connect()
+        frame = block.read_frame()
+        block.disconnect()
+
+        assert frame.stats["min"] == 100
+        assert frame.stats["max"] == 65535
+        assert frame.stats["argmax"] == 1023
+        assert frame.stats["saturated"] == 1
+
+    def test_statistics_can_be_disabled(self):
+        nblk = DeviceWrappers.NonBlockingInterface(statistics=None)
+        nblk.connect()
+        frame = nblk.read_frame()
+        while frame is None:
+            frame = nblk.read_frame()
+        nblk.disconnect()
+        assert frame.stats is None
+
+    def test_hosted_frames_carry_statistics(self):
+        host = DeviceWrappers.DeviceHost()
+        hosted = DeviceWrappers.HostedInterface("Simulation.SimulatedSpectra",
+                                                host=host)
+        hosted.connect()
+        frame = hosted.read_frame()
+        while frame is None:
+            frame = hosted.read_frame()
+        hosted.disconnect()
+        assert frame.stats["max"] == 65535
+
+class TestDecimation:
+    def test_envelope_keeps_extremes_of_each_bin(self):
+        data = numpy.arange(4096, dtype=numpy.float64)
+        data[1000] = 99999
+        (x, envelope) = Processing.min_max_envelope(data, 512)
+
+        assert len(envelope) == 1024
+        assert len(x) == 1024
+        assert envelope[0] == 0
+        assert envelope[-1] == 4095
+        assert envelope.max() == 99999
+        assert x[0] == x[1] == 3.5
+
+    def test_small_readings_are_not_decimated(self):
+        data = [1, 2, 3]
+        assert Processing.min_max_envelope(data, 668) == (None, data)
+        assert Processing.min_max_envelope(data, 0) == (None, data)
+
+    def test_worker_decimates_to_plot_width(self):
+        block = DeviceWrappers.BlockingInterface("Simulation.SimulatedSpectra")
+        block.connect()
+        full = block.read_frame()
+
+        block.set_plot_width(100)
+        frame = block.read_frame()
+        full_again = block.read_full()
+        (frames, stamps) = block.read_many(max_frames=2)
+        block.disconnect()
+
+        assert full.x is None
+        assert len(full.data) == 1024
+        assert len(frame.data) == 200
+        assert len(frame.x) == 200
+        assert frame.data[0] == 100
+        assert frame.data[-1] == 65535
+        assert frame.stats["argmax"] == 1023
+        assert len(full_again.data) == 1024
+        assert frames.shape == (2, 1024)
+
+    def test_nonblocking_read_full_after_outstanding_acquire(self):
+        nblk = DeviceWrappers.NonBlockingInterface("Simulation.SimulatedSpectra")
+        nblk.connect()
+        nblk.set_plot_width(100)
+        frame = nblk.read_frame()
+        while frame is None:
+            frame = nblk.read_frame()
+        assert len(frame.data) == 200
+
+        nblk.send_acquire()
+        assert len(nblk.read_full().data) == 1024
+        assert nblk.disconnect() == True
+
+class TestDeviceRegistry:
+    def test_builtin_devices_are_cached_factories(self):
+        registry = Registry.DeviceRegistry()
+        factory = registry.resolve("Simulation.SimulatedSpectra")
+        assert factory is Simulation.SimulatedSpectra
+        assert registry.resolve("Simulation.SimulatedSpectra") is factory
+
+    def test_arguments_are_passed_typed(self):
+        registry = Registry.DeviceRegistry()
+        device = registry.create("Simulation.SimulatedSpectra",
+                                 pixel_width=2048)
+        assert device.pixel_width == 2048
+
+    def test_registered_paths_import_on_first_use(self):
+        registry = Registry.DeviceRegistry()
+        registry.register("Lab.Spectra",
+                          "bluegraph.devices.Simulation:RegulatedSpectra")
+        assert "Lab.Spectra" in registry.names()
+        device = registry.create("Lab.Spectra")
+        assert isinstance(device, Simulation.RegulatedSpectra)
+
+    def test_unknown_devices_raise(self):
+        registry = Registry.DeviceRegistry()
+        with pytest.raises(ValueError):
+            registry.resolve("Simulation.NoSuchDevice")
+        with pytest.raises(ImportError):
+            registry.resolve("NoSuchModule.NoSuchDevice")
+
+    def test_wrappers_pass_device_kwargs_to_worker(self):
+        chooser = DeviceWrappers.DeviceChooser()
+        device = chooser.create("DeviceWrappers", "BlockingInterface",
+                                "Simulation.SimulatedSpectra",
+                                {"device_kwargs": {"pixel_width": 512}})
+        device.connect()
+        assert len(device.read()) == 512
+        assert device.disconnect() == True
+
+    def test_inline_backend_passes_device_kwargs(self):
+        chooser = DeviceWrappers.DeviceChooser()
+        device = chooser.create_backend("Simulation.SimulatedSpectra",
+                                        backend="inline",
+                                        device_kwargs={"pixel_width": 256})
+        device.connect()
+        assert len(device.read()) == 256
+
+class TestWorkerPool:
+    def test_pooled_device_reads_and_refills_pool(self):
+        pool = DeviceWrappers.WorkerPool(size=2)
+        device = DeviceWrappers.PooledInterface("Simulation.SimulatedSpectra",
+                                                pool=pool)
+        assert device.process is None
+        assert device.connect() == True
+        assert len(pool.idle) == 1
+        assert pool.refill() == False
+        assert len(pool.idle) == 2
+
+        frame = device.read_frame()
+        assert len(frame.data) == 1024
+        assert frame.stats["min"] == 100
+        assert device.disconnect() == True
+        assert pool.close() == True
+
+    def test_take_does_not_wait_for_the_replacement(self):
+        pool = DeviceWrappers.WorkerPool(size=1)
+
+        take_times = []
+        spawn_times = []
+        for i in range(3):
+            start = Timing.monotonic()
+            worker = pool.take()
+            take_times.append(Timing.monotonic() - start)
+
+            start = Timing.monotonic()
+            fresh = pool.spawn()
+            spawn_times.append(Timing.monotonic() - start)
+
+            assert len(pool.idle) == 0
+            pool.fill()
+            assert len(pool.idle) == 1
+            for (process, control_queue) in (worker[:2], fresh[:2]):
+                control_queue.put("STOP")
+                process.join()
+
+        assert min(take_times) < min(spawn_times)
+        assert pool.close() == True
+
+    def test_refill_starts_one_worker_per_call(self):
+        pool = DeviceWrappers.WorkerPool(size=2)
+        taken = [pool.take(), pool.take()]
+        assert len(pool.idle) == 0
+
+        # The pool is empty, so take() spawns rather than waiting
+        taken.append(pool.take())
+        assert len(pool.idle) == 0
+
+        assert pool.refill() == True
+        assert len(pool.idle) == 1
+        assert pool.refill() == False
+        assert pool.refill() == False
+        assert len(pool.idle) == 2
+
+        for (process, control_queue) in [worker[:2] for worker in taken]:
+            control_queue.put("STOP")
+            process.join()
+        assert pool.close() == True
+
+    def test_pooled_device_keeps_settings_from_before_connect(self):
+        pool = DeviceWrappers.WorkerPool(size=1)
+        kwargs = {"pixel_width": 2048}
+        device = DeviceWrappers.PooledInterface("Simulation.SimulatedSpectra",
+                                                pool=pool,
+                                                device_kwargs=kwargs)
+        device.set_plot_width(100)
+        device.connect()
+        assert len(device.read()) == 200
+        assert len(device.read_full().data) == 2048
+        device.disconnect()
+        pool.close()
+
+    def test_chooser_creates_pooled_backend(self):
+        chooser = DeviceWrappers.DeviceChooser()
+        device = chooser.create_backend("Simulation.SimulatedDevice",
+                                        backend="pool", blocking=True)
+        assert isinstance(device, DeviceWrappers.PooledInterface)
+        assert device.connect() == True
+        assert device.disconnect() == True
+
+class TestHistoryDelta:
+    def test_delta_holds_only_new_samples(self):
+        ring = Buffers.HistoryRing(1000)
+        for value in range(1500):
+            ring.append(value)
+        sent = ring.total
+        ring.append(1500)
+
+        delta = ring.since(sent)
+        assert list(delta.values) == [1500]
+        assert delta.start == 1500
+        assert delta.full == False
+
+        full_size = len(pickle.dumps(ring.since(None), 2))
+        delta_size = len(pickle.dumps(delta, 2))
+        assert full_size > 30 * delta_size
+
+    def test_consumer_follows_and_detects_gaps(self):
+        source = Buffers.HistoryRing(10)
+        copy = Buffers.HistoryRing(10)
+        assert copy.apply(source.since(None)) == True
+
+        sent = None
+        for value in range(15):
+            source.append(value)
+            assert copy.apply(source.since(sent)) == True
+            sent = source.total
+        assert list(copy.view()) == list(source.view())
+
+        source.append(15)
+        source.append(16)
+        missed = source.since(source.total - 1)
+        assert copy.apply(missed) == False
+        assert list(copy.view()) == range(5, 15)
+
+        assert copy.apply(source.since(None)) == True
+        assert list(copy.view()) == list(source.view())
+
+    def test_wrapper_rebuilds_history_from_deltas(self):
+        kwargs = {"size": 5}
+        block = DeviceWrappers.BlockingInterface("Simulation.StripChartDevice",
+                                                 device_kwargs=kwargs)
+        block.connect()
+        for i in range(4):
+            result = block.read()
+        assert len(result) == 4
+
+        # Lose a delta, the wrapper asks for and gets a resync
+        block.control_queue.put("ACQUIRE")
+        block.data_queue.get()
+        gap = block.read()
+        full = block.read()
+        block.disconnect()
+
+        assert len(gap) == 4
+        assert len(full) == 5
+        assert block.history.total == 7
+
+    def wait_for_frame(self, device):
+        start_time = time.time()
+        frame = device.read_frame()
+        while frame is None:
+            assert time.time() - start_time < 5.0
+            time.sleep(0.01)
+            frame = device.read_frame()
+        return frame
+
+    def test_send_acquire_leaves_a_resync_for_the_worker(self):
+        nblk = DeviceWrappers.NonBlockingInterface(
+            "Simulation.StripChartDevice")
+        nblk.connect()
+        self.wait_for_frame(nblk)
+        self.wait_for_frame(nblk)
+
+        nblk.control_queue.put("RESYNC")
+        nblk.send_acquire()
+        start_time = time.time()
+        while nblk.data_queue.qsize() == 0:
+            assert time.time() - start_time < 5.0
+            time.sleep(0.01)
+        frame = nblk.data_queue.get()
+        nblk.acquire_sent = False
+        assert nblk.disconnect() == True
+
+        delta = nblk.transport.unpack(frame.data)
+        assert delta.full == True
+        assert len(delta) == 3
+
+    def test_hosted_history_follows_deltas_and_resyncs(self):
+        host = DeviceWrappers.DeviceHost()
+        kwargs = {"size": 5}
+        hosted = DeviceWrappers.HostedInterface(
+            "Simulation.StripChartDevice", host=host, device_kwargs=kwargs)
+        hosted.connect()
+        for i in range(3):
+            frame = self.wait_for_frame(hosted)
+        assert len(frame.data) == 3
+        assert hosted.history.total == 3
+
+        # Lose a delta, the proxy asks for and gets a resync
+        host.acquire(hosted.device_id)
+        start_time = time.time()
+        while host.take(hosted.device_id) is None:
+            assert time.time() - start_time < 5.0
+            time.sleep(0.01)
+        gap = self.wait_for_frame(hosted)
+        assert len(gap.data) == 3
+        assert hosted.history.total == 3
+        full = self.wait_for_frame(hosted)
+        hosted.disconnect()
+
+        assert len(full.data) == 5
+        assert hosted.history.total == 6
+
+class TestBankedSpectra:
+    def test_frames_have_width_dtype_and_extremes(self):
+        device = Simulation.BankedSpectra(pixel_width=2048,
+                                          dtype=numpy.uint16, seed=1)
+        device.connect()
+        result = device.read()
+        assert result.shape == (2048,)
+        assert result.dtype == numpy.uint16
+        assert result[0] == 100
+        assert result.max() == 65535
+
+    def test_frames_vary_between_reads(self):
+        device = Simulation.BankedSpectra(seed=1)
+        first = device.read()
+        second = device.read()
+        assert not numpy.array_equal(first, second)
+
+    def test_unpaced_reads_are_fast(self):
+        device = Simulation.BankedSpectra(dtype=numpy.float32)
+        start_time = time.time()
+        for i in range(2000):
+            device.read()
+        assert time.time() - start_time < 0.5
+
+    def test_reads_are_paced_to_rate(self):
+        device = Simulation.BankedSpectra(rate=1000)
+        start_time = time.time()
+        for i in range(200):
+            device.read()
+        time_diff = time.time() - start_time
+        assert time_diff > 0.18
+        assert time_diff < 0.4
+
+class FakeClock(object):
+    """ Clock for DeadlineScheduler that only moves when slept on.
+    """
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+class TestDeadlineScheduler:
+    def test_rate_does_not_drift_with_work(self):
+        scheduler = Timing.DeadlineScheduler(200)
+        start_time = time.time()
+        scheduler.wait()
+        for i in range(200):
+            # Uneven work inside each period
+            time.sleep(0.0005 * (i % 3))
+            scheduler.wait()
+        time_diff = time.time() - start_time
+
+        jitter = scheduler.jitter()
+        assert jitter["count"] == 200
+        assert jitter["missed"] < 40
+        assert jitter["mean"] < 0.001
+
+        # Only skipped deadlines, never accumulated lateness, add time
+        expected = (200 + jitter["missed"]) * 0.005
+        assert time_diff > expected - 0.01
+        assert time_diff < expected + 0.02
+
+    def test_skip_drops_missed_deadlines(self, monkeypatch):
+        clock = FakeClock()
+        monkeypatch.setattr(time, "sleep", clock.sleep)
+        scheduler = Timing.DeadlineScheduler(100, policy="skip", clock=clock)
+        scheduler.wait()
+        clock.sleep(0.055)
+
+        # The missed deadlines are dropped and the wait is for the next
+        # one, 60 ms after the first call
+        assert scheduler.wait() == 0.0
+        assert abs(clock.now - 0.06) < 1e-9
+        assert scheduler.jitter()["missed"] == 5
+
+        # Less than a period late is not a miss, it runs straight away
+        clock.sleep(0.015)
+        assert abs(scheduler.wait() - 0.005) < 1e-9
+        assert abs(clock.now - 0.075) < 1e-9
+        assert scheduler.jitter()["missed"] == 5
+
+    def test_catch_up_runs_missed_calls_back_to_back(self):
+        scheduler = Timing.DeadlineScheduler(100, policy="catch-up")
+        scheduler.wait()
+        time.sleep(0.055)
+        start_time = time.time()
+        for i in range(4):
+            scheduler.wait()
+        assert time.time() - start_time < 0.003
+        assert scheduler.jitter()["missed"] > 0
+
+    def test_bad_arguments_raise(self):
+        with pytest.raises(ValueError):
+            Timing.DeadlineScheduler(0)
+        with pytest.raises(ValueError):
+            Timing.DeadlineScheduler(10, policy="burst")
+
+    def test_regulated_spectra_run_above_100hz(self):
+        device = Simulation.RegulatedSpectra(rate=400)
+        start_time = time.time()
+        for i in range(100):
+            device.read()
+        time_diff = time.time() - start_time
+
+        # Only skipped deadlines lengthen the run, see the drift test
+        missed = device.scheduler.jitter()["missed"]
+        assert missed < 25
+        expected = (100 + missed) * 0.0025
+        assert time_diff > expected - 0.01
+        assert time_diff < expected + 0.02
+
+class TestPlaybackDevice:
+    @pytest.fixture
+    def recording(self, tmpdir):
+        path = str(tmpdir.join("field.bgf"))
+        frame_recorder = recorder.FrameRecorder(path, "field")
+        frame_recorder.open()
+        for sequence in range(10):
+            data = numpy.arange(256.0) + sequence
+            frame_recorder.write(sequence, 100.0 + sequence * 0.05, data)
+        frame_recorder.close()
+        return path
+
+    def time_reads(self, device, count):
+        device.connect()
+        start_time = time.time()
+        frames = [device.read() for i in range(count)]
+        return (time.time() - start_time, frames)
+
+    def test_original_timing(self, recording):
+        device = Simulation.PlaybackDevice(recording)
+        (time_diff, frames) = self.time_reads(device, 10)
+        assert time_diff > 0.44
+        assert time_diff < 0.5
+        assert [frame[0] for frame in frames] == range(10)
+
+    def test_accelerated_and_unpaced(self, recording):
+        device = Simulation.PlaybackDevice(recording, speed=10)
+        (time_diff, frames) = self.time_reads(device, 10)
+        assert time_diff > 0.044
+        assert time_diff < 0.07
+
+        device = Simulation.PlaybackDevice(recording, speed=0)
+        (time_diff, frames) = self.time_reads(device, 1000)
+        assert time_diff < 0.2
+
+    def test_frames_are_views_of_the_file(self, recording):
+        device = Simulation.PlaybackDevice(recording, speed=0)
+        device.connect()
+        frame = device.read()
+        assert isinstance(frame, numpy.memmap)
+        assert frame.flags["WRITEABLE"] == False
+
+    def test_loop_or_hold_last_frame(self, recording):
+        device = Simulation.PlaybackDevice(recording, speed=0)
+        (time_diff, frames) = self.time_reads(device, 12)
+        assert [frame[0] for frame in frames[9:]] == [9, 0, 1]
+
+        device = Simulation.PlaybackDevice(recording, speed=0, loop=False)
+        (time_diff, frames) = self.time_reads(device, 12)
+        assert [frame[0] for frame in frames[9:]] == [9, 9, 9]
+        assert device.finished == True
+
+    def test_finished_playback_is_paced(self, recording):
+        device = Simulation.PlaybackDevice(recording, speed=2, loop=False)
+        self.time_reads(device, 10)
+        assert device.finished == False
+
+        # The last frame repeats at the recorded 50 ms interval, scaled
+        start_time = time.time()
+        frames = [device.read() for i in range(4)]
+        time_diff = time.time() - start_time
+        assert device.finished == True
+        assert [frame[0] for frame in frames] == [9] * 4
+        assert time_diff > 0.099
+        assert time_diff < 0.13
+
+    def test_plays_chunked_recordings(self, tmpdir):
+        path = str(tmpdir.join("field.bgc"))
+        chunked = recorder.ChunkedRecorder(path, chunk_frames=4)
+        chunked.open()
+        for sequence in range(10):
+            chunked.write(sequence, sequence * 0.01, numpy.arange(64) + 1)
+        chunked.close()
+
+        device = Simulation.PlaybackDevice(path, speed=0)
+        (time_diff, frames) = self.time_reads(device, 10)
+        assert list(frames[9]) == range(1, 65)
+
+    def test_plays_through_chooser_and_nonblocking(self, recording):
+        chooser = DeviceWrappers.DeviceChooser()
+        kwargs = {"device_kwargs": {"path": recording, "speed": 0}}
+        nblk = chooser.create("DeviceWrappers", "NonBlockingInterface",
+                              "Simulation.PlaybackDevice", kwargs)
+        nblk.connect()
+        result = nblk.read()
+        while result is None:
+            result = nblk.read()
+        assert result[0] == 0
+        assert nblk.disconnect() == True
+
+        device = chooser.create("Simulation", "PlaybackDevice", recording)
+        assert device.path == recording
+
+class TestInstrumentation:
+    def test_disabled_wrappers_bind_nothing(self):
+        block = DeviceWrappers.BlockingInterface("Simulation.SimulatedSpectra")
+        assert block.stats() is None
+        assert "read_frame" not in vars(block)
+        assert "acquire" not in vars(block)
+        block.connect()
+        assert block.read_frame().worker_time is None
+        block.disconnect()
+
+    def test_blocking_reads_are_measured(self):
+        block = DeviceWrappers.BlockingInterface("Simulation.RegulatedSpectra",
+                                                 instrument=True)
+        block.connect()
+        for i in range(3):
+            frame = block.read_frame()
+        stats = block.stats()
+        block.disconnect()
+
+        assert frame.worker_time > 0.15
+        assert stats["read_wait"]["count"] == 3
+        assert stats["read_wait"]["mean"] > 0.15
+        assert stats["worker"]["max"] > 0.15
+        assert stats["command_wait"]["count"] == 1
+        assert stats["data_depth"]["max"] == 0
+        assert stats["age"]["count"] == 3
+
+    def test_timed_acquire_is_only_bound_in_the_worker(self):
+        block = DeviceWrappers.BlockingInterface("Simulation.SimulatedSpectra",
+                                                 instrument=True)
+        assert "read_frame" in vars(block)
+        assert "acquire" not in vars(block)
+        pickle.dumps(block.instruments, 2)
+
+        block.connect()
+        assert block.read_frame().worker_time > 0
+        assert block.disconnect() == True
+
+    def test_unsized_queues_are_not_sampled(self, monkeypatch):
+        # As on OS X, where multiprocessing.Queue.qsize is missing
+        monkeypatch.setattr(Instrumentation, "QSIZE_WORKS", False)
+        block = DeviceWrappers.BlockingInterface("Simulation.SimulatedSpectra",
+                                                 instrument=True)
+        assert Instrumentation.has_depth(block.data_queue) == False
+        block.connect()
+        block.read_frame()
+        stats = block.stats()
+        block.disconnect()
+        assert stats["read_wait"]["count"] == 1
+        assert stats["data_depth"]["count"] == 0
+
+        nblk = DeviceWrappers.NonBlockingThreadedInterface(instrument=True)
+        assert Instrumentation.has_depth(nblk.data_queue) == True
+        assert Instrumentation.has_depth(nblk.control_queue) == True
+        nblk.connect()
+        nblk.read_frame()
+        stats = nblk.stats()
+        nblk.disconnect()
+        assert stats["data_depth"]["count"] == 1
+
+    def test_streaming_reads_are_measured(self):
+        stream = DeviceWrappers.StreamingInterface(
+            "Simulation.RegulatedSpectra", instrument=True, log_interval=0)
+        stream.connect()
+        frame = None
+        start_time = time.time()
+        while frame is None:
+            assert time.time() - start_time < 5.0
+            frame = stream.read_frame()
+        stats = stream.stats()
+        stream.disconnect()
+
+        assert frame.worker_time > 0.15
+        assert stats["read_wait"]["count"] >= 1
+        assert stats["worker"]["count"] == 1
+
+    def test_nonblocking_logs_periodic_summary(self, caplog):
+        nblk = DeviceWrappers.NonBlockingInterface(
+            "Simulation.SimulatedSpectra", instrument=True, log_interval=0.1)
+        nblk.connect()
+        start_time = time.time()
+        with caplog.at_level(logging.INFO):
+            while time.time() - start_time < 0.3:
+                nblk.read()
+        nblk.disconnect()
+
+        lines = [record.getMessage() for record in caplog.records
+                 if record.name == "bluegraph.devices.Instrumentation"]
+        assert len(lines) >= 2
+        assert "read_wait" in lines[0]
+        assert "data_depth" in lines[0]
+
+class TestTracing:
+    def test_disabled_spans_record_nothing(self):
+        assert Tracing.active() is None
+        with Tracing.span("read") as span:
+            assert span is Tracing.NULL_SPAN
+
+    def test_gui_and_worker_processes_are_merged(self, tmpdir):
+        path = str(tmpdir.join("trace.json"))
+        Tracing.enable(path, flush_interval=0.05, process_name="test")
+        try:
+            block = DeviceWrappers.BlockingInterface(
+                "Simulation.SimulatedSpectra")
+            block.connect()
+            for i in range(3):
+                block.read_frame()
+            block.disconnect()
+        finally:
+            Tracing.disable()
+
+        assert len(tmpdir.listdir()) == 2
+        count = Tracing.merge(path)
+        assert tmpdir.listdir() == [tmpdir.join("trace.json")]
+
+        events = json.load(open(path))["traceEvents"]
+        assert len(events) == count
+        spans = [event for event in events if event["ph"] == "X"]
+        pids = set(event["pid"] for event in spans)
+        assert len(pids) == 2
+
+        names = [event["name"] for event in spans]
+        assert names.count("device read") == 3
+        assert names.count("data get") == 3
+        assert names.count("control put") == 3
+
+        # On the shared clock each read starts after the GUI asked for it,
+        # and ends before the GUI has the frame
+        reads = [event for event in spans if event["name"] == "device read"]
+        puts = [event for event in spans if event["name"] == "control put"]
+        gets = [event for event in spans if event["name"] == "data get"]
+        for (put, read, get) in zip(puts, reads, gets):
+            assert put["ts"] <= read["ts"]
+            assert read["ts"] + read["dur"] <= get["ts"] + get["dur"]
+
+    def test_buffer_cap_drops_oldest(self, tmpdir):
+        tracer = Tracing.Tracer(str(tmpdir.join("trace")), capacity=10,
+                                flush_interval=60)
+        for i in range(25):
+            tracer.complete("span %d" % i, i, i + 0.5)
+        assert tracer.dropped == 15
+        tracer.close()
+
+        lines = tmpdir.join("trace.%d.events" % tracer.pid).readlines()
+        names = [json.loads(line)["name"] for line in lines[1:]]
+        assert names == ["span %d" % i for i in range(15, 25)]
+
+class TestWakePipe:
+    def test_blocking_devices_have_no_wakeup(self):
+        block = DeviceWrappers.BlockingInterface("Simulation.SimulatedSpectra")
+        assert DeviceWrappers.wakeup_fd(block) is None
+        block.connect()
+        block.disconnect()
+
+        device = Simulation.SimulatedSpectra()
+        assert DeviceWrappers.wakeup_fd(device) is None
+
+    def test_nonblocking_frames_wake_the_reader(self):
+        nblk = DeviceWrappers.NonBlockingInterface(
+            "Simulation.RegulatedSpectra")
+        fd = DeviceWrappers.wakeup_fd(nblk)
+        nblk.connect()
+
+        # The wakeup for the connect response is set just after it is
+        # written, let it arrive before starting on a clean pipe
+        time.sleep(0.1)
+        assert nblk.wakeup.clear() == 1
+        assert nblk.read_frame() is None
+        assert select.select([fd], [], [], 0)[0] == []
+
+        ready = select.select([fd], [], [], 2.0)[0]
+        assert ready == [fd]
+        assert nblk.wakeup.clear() == 1
+
+        # Woken only once the frame can be got, so the first read has it
+        frame = nblk.read_frame()
+        assert frame is not None
+        assert frame.age() < 0.05
+        nblk.disconnect()
+
+    def test_a_woken_reader_always_gets_the_item(self):
+        wakeup = Transports.WakePipe.create()
+        queue = Transports.SignalledQueue(wakeup)
+        # Larger than the pipe buffer, so the write can't finish unread
+        for index in range(50):
+            queue.put(numpy.zeros(100000) + index)
+            assert select.select([wakeup.fileno()], [], [], 2.0)[0]
+            wakeup.clear()
+            assert queue.get_nowait()[0] == index
+        assert queue.qsize() == 0
+        wakeup.close()
+
+    def test_signalled_queue_is_bounded(self):
+        wakeup = Transports.WakePipe.create()
+        queue = Transports.SignalledQueue(wakeup, maxsize=2)
+        queue.put("first")
+        queue.put_nowait("second")
+        with pytest.raises(Queue.Full):
+            queue.put_nowait("third")
+        assert queue.qsize() == 2
+
+        assert queue.get(timeout=2.0) == "first"
+        queue.put_nowait("third")
+        assert queue.get(timeout=2.0) == "second"
+        assert queue.get(timeout=2.0) == "third"
+        with pytest.raises(Queue.Empty):
+            queue.get(timeout=0.01)
+        wakeup.close()
+
+    def test_unpicklable_items_give_back_their_slot(self):
+        wakeup = Transports.WakePipe.create()
+        queue = Transports.SignalledQueue(wakeup, maxsize=1)
+        queue.put(lambda: None)
+        queue.buffer.join()
+        assert queue.qsize() == 0
+
+        queue.put_nowait("next")
+        assert queue.get(timeout=2.0) == "next"
+        wakeup.close()
+
+    def test_hosted_devices_share_the_host_wakeup(self):
+        host = DeviceWrappers.DeviceHost()
+        first = DeviceWrappers.HostedInterface("Simulation.SimulatedSpectra",
+                                               host=host)
+        second = DeviceWrappers.HostedInterface("Simulation.SimulatedSpectra",
+                                                host=host)
+        first.connect()
+        second.connect()
+        fd = DeviceWrappers.wakeup_fd(first)
+        assert fd == DeviceWrappers.wakeup_fd(second)
+
+        first.wakeup.clear()
+        first.read_frame()
+        assert select.select([fd], [], [], 2.0)[0] == [fd]
+        assert first.read_frame() is not None
+        first.disconnect()
+        second.disconnect()
+
+    def test_host_closes_its_wakeup_when_it_stops(self):
+        host = DeviceWrappers.DeviceHost()
+        device = DeviceWrappers.HostedInterface("Simulation.SimulatedSpectra",
+                                                host=host)
+        device.connect()
+        wakeup = device.wakeup
+        device.disconnect()
+        assert device.wakeup is None
+        with pytest.raises(OSError):
+            os.fstat(wakeup.fileno())
+
+        device.connect()
+        assert DeviceWrappers.wakeup_fd(device) is not None
+        device.disconnect()
@@ -0,0 +1,184 @@
+""" Recorder tests for BlueGraph application
+"""
+
+import os
+import time
+import numpy
+import pytest
+
+from bluegraph import recorder
+from bluegraph.devices import Simulation
+from bluegraph.devices import DeviceWrappers
+
+class TestFrameRecorder:
+    def test_frames_read_back_with_index(self, tmpdir):
+        path = str(tmpdir.join("spectra.bgf"))
+        frame_recorder = recorder.FrameRecorder(path, "spectra",
+                                                dtype=numpy.uint16)
+        frame_recorder.open()
+        for sequence in range(10):
+            data = numpy.arange(512) + sequence
+            frame_recorder.write(sequence, sequence * 0.5, data)
+        assert frame_recorder.close() == True
+
+        reader = recorder.FrameReader(path)
+        assert len(reader) == 10
+        assert reader.dtype == numpy.uint16
+        assert reader.pixel_width == 512
+        assert reader.device_id == "spectra"
+        assert list(reader.sequences) == range(10)
+        assert reader.timestamps[3] == 1.5
+        assert reader[7][0] == 7
+        assert reader.frames.shape == (10, 512)
+        assert reader.index["offset"][1] == recorder.HEADER_SIZE + 1024
+
+    def test_caller_buffer_can_be_reused(self, tmpdir):
+        path = str(tmpdir.join("reuse.bgf"))
+        frame_recorder = recorder.FrameRecorder(path)
+        frame_recorder.open()
+        data = numpy.zeros(16)
+        for value in range(3):
+            data[:] = value
+            frame_recorder.write(value, 0.0, data)
+        frame_recorder.close()
+
+        reader = recorder.FrameReader(path)
+        assert [frame[0] for frame in reader] == [0, 1, 2]
+
+    def test_mismatched_frames_raise(self, tmpdir):
+        frame_recorder = recorder.FrameRecorder(str(tmpdir.join("bad")))
+        frame_recorder.open()
+        frame_recorder.write(0, 0.0, numpy.zeros(16))
+        with pytest.raises(ValueError):
+            frame_recorder.write(1, 0.0, numpy.zeros(8))
+        frame_recorder.close()
+
+    def test_writer_keeps_up_without_dropping(self, tmpdir):
+        path = str(tmpdir.join("fast.bgf"))
+        frame_recorder = recorder.FrameRecorder(path)
+        frame_recorder.open()
+        data = numpy.random.uniform(0, 65535, 1024)
+
+        start_time = time.time()
+        for sequence in range(5000):
+            frame_recorder.write(sequence, 0.0, data)
+        queue_time = time.time() - start_time
+        frame_recorder.close()
+
+        assert queue_time < 1.0
+        assert frame_recorder.written == 5000
+        assert len(recorder.FrameReader(path)) == 5000
+
+    def test_worker_records_full_resolution(self, tmpdir):
+        path = str(tmpdir.join("worker.bgf"))
+        frame_recorder = recorder.FrameRecorder(path, "spectra")
+        block = DeviceWrappers.BlockingInterface(
+            "Simulation.SimulatedSpectra", recorder=frame_recorder)
+        block.connect()
+        block.set_plot_width(100)
+        for i in range(5):
+            assert len(block.read()) == 200
+        block.disconnect()
+
+        reader = recorder.FrameReader(path)
+        assert len(reader) == 5
+        assert reader.pixel_width == 1024
+        assert list(reader.sequences) == range(5)
+        assert reader[4][-1] == 65535
+
+    def test_recording_without_frames_reads_back_empty(self, tmpdir):
+        path = str(tmpdir.join("empty.bgf"))
+        frame_recorder = recorder.FrameRecorder(path, "spectra")
+        frame_recorder.open()
+        assert os.path.getsize(path) == recorder.HEADER_SIZE
+        frame_recorder.close()
+
+        reader = recorder.FrameReader(path)
+        assert len(reader) == 0
+        assert reader.pixel_width is None
+        assert reader.device_id == "spectra"
+
+    def test_direct_devices_are_wrapped_to_record(self, tmpdir):
+        path = str(tmpdir.join("direct.bgf"))
+        frame_recorder = recorder.FrameRecorder(path)
+        chooser = DeviceWrappers.DeviceChooser()
+        device = chooser.create_backend("Simulation.SimulatedSpectra",
+                                        blocking=True,
+                                        recorder=frame_recorder)
+        device.connect()
+        for i in range(3):
+            device.read()
+        device.disconnect()
+        assert len(recorder.FrameReader(path)) == 3
+
+    def test_backends_that_cannot_record_raise(self, tmpdir):
+        frame_recorder = recorder.FrameRecorder(str(tmpdir.join("no")))
+        chooser = DeviceWrappers.DeviceChooser()
+        for backend in ("inline", "host"):
+            with pytest.raises(ValueError):
+                chooser.create_backend("Simulation.SimulatedSpectra",
+                                       backend=backend,
+                                       recorder=frame_recorder)
+        with pytest.raises(ValueError):
+            DeviceWrappers.HostedInterface("Simulation.SimulatedSpectra",
+                                           recorder=frame_recorder)
+
+class TestChunkedRecorder:
+    def record(self, path, frames, **kwargs):
+        chunked = recorder.ChunkedRecorder(path, "spectra", **kwargs)
+        chunked.open()
+        for (sequence, frame) in enumerate(frames):
+            chunked.write(sequence, sequence * 0.01, frame)
+        chunked.close()
+        return chunked
+
+    def test_round_trip_is_lossless_for_uint16(self, tmpdir):
+        path = str(tmpdir.join("chunks.bgc"))
+        device = Simulation.BankedSpectra(dtype=numpy.uint16, seed=3)
+        frames = [device.read() for i in range(50)]
+        chunked = self.record(path, frames, chunk_frames=16)
+        assert chunked.written == 50
+
+        reader = recorder.ChunkedReader(path)
+        assert len(reader) == 50
+        assert len(reader.index) == 4
+        assert list(reader.index["frames"]) == [16, 16, 16, 2]
+        for position in (0, 15, 16, 33, 49, -1):
+            assert numpy.array_equal(reader[position], frames[position])
+
+        (sequences, stamps, decoded) = reader.chunk(2)
+        assert list(sequences) == range(32, 48)
+        assert stamps[0] == 0.32
+
+    def test_float_frames_are_rounded_and_clipped(self, tmpdir):
+        path = str(tmpdir.join("floats.bgc"))
+        frames = [numpy.array([-5.0, 1.4, 1.6, 70000.0])] * 3
+        self.record(path, frames, codec="bz2")
+
+        reader = recorder.ChunkedReader(path)
+        assert list(reader[2]) == [0, 1, 2, 65535]
+
+    def test_compresses_simulated_spectra(self, tmpdir):
+        path = str(tmpdir.join("ratio.bgc"))
+        device = Simulation.BankedSpectra(dtype=numpy.uint16, seed=3)
+        frames = [device.read() for i in range(256)]
+        self.record(path, frames)
+
+        raw_size = 256 * 1024 * 2
+        written = os.path.getsize(path) + os.path.getsize(path + ".idx")
+        assert written < raw_size
+
+    def test_recording_without_frames_reads_back_empty(self, tmpdir):
+        path = str(tmpdir.join("empty.bgc"))
+        self.record(path, [])
+        assert len(recorder.ChunkedReader(path)) == 0
+
+    def test_unknown_codec_raises(self, tmpdir):
+        with pytest.raises(ValueError):
+            recorder.ChunkedRecorder(str(tmpdir.join("x")), codec="rar")
+
+    def test_out_of_range_frame_raises(self, tmpdir):
+        path = str(tmpdir.join("short.bgc"))
+        self.record(path, [numpy.zeros(4)])
+        with pytest.raises(IndexError):
+            recorder.ChunkedReader(path)[1]
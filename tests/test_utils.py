@@ -43,3 +43,135 @@ class TestFPS:
             simulator.show()
         assert fps.rate() == 0
 
+
+class TestTaskRunner:
+    def test_tasks_resume_with_read_results(self, qtbot):
+        from bluegraph.devices import DeviceWrappers, Simulation
+
+        results = []
+        def task(device):
+            for i in range(3):
+                data = yield DeviceWrappers.read_async(device)
+                results.append(data)
+
+        device = Simulation.SimulatedSpectra()
+        device.connect()
+        runner = utils.TaskRunner()
+        runner.start(task(device))
+
+        simulator = utils.Basic()
+        known_signal = simulator.customContextMenuRequested
+        with qtbot.wait_signal(known_signal, timeout=200):
+            simulator.show()
+
+        assert len(results) == 3
+        assert runner.poll_timer.isActive() == False
+
+    def test_wakeup_reads_are_resumed_without_polling(self, qtbot):
+        from bluegraph.devices import DeviceWrappers
+
+        results = []
+        def task(device):
+            for i in range(3):
+                frame = yield DeviceWrappers.read_async(device)
+                results.append(frame)
+
+        device = DeviceWrappers.NonBlockingInterface(
+            "Simulation.SimulatedSpectra")
+        device.connect()
+        runner = utils.TaskRunner()
+        runner.start(task(device))
+
+        # Waiting on the notifier of the wakeup pipe, not the timer
+        assert runner.poll_timer.isActive() == False
+        assert len(runner.notifiers) == 1
+
+        simulator = utils.Basic()
+        known_signal = simulator.customContextMenuRequested
+        with qtbot.wait_signal(known_signal, timeout=1000):
+            simulator.show()
+
+        assert len(results) == 3
+        assert None not in results
+        assert runner.poll_timer.isActive() == False
+        device.disconnect()
+
+class TestFrameMonitor:
+    def test_gaps_are_counted_per_device(self):
+        from bluegraph.devices import DeviceWrappers
+        Frame = DeviceWrappers.Frame
+
+        monitor = utils.FrameMonitor()
+        for sequence in (0, 1, 2, 5, 6, 9):
+            monitor.update(Frame([1], sequence, device_id="first"))
+        monitor.update(Frame([1], 0, device_id="second"))
+        monitor.update(Frame([1], 1, device_id="second"))
+
+        assert monitor.gaps == 2
+        assert monitor.dropped == 4
+        assert monitor.age >= 0
+        assert monitor.summary().endswith("G:2")
+
+    def test_devices_of_the_same_type_are_counted_apart(self):
+        from bluegraph.devices import DeviceWrappers
+        Frame = DeviceWrappers.Frame
+
+        (first, second) = (object(), object())
+        monitor = utils.FrameMonitor()
+        for sequence in range(5):
+            monitor.update(Frame([1], sequence + 10, device_id="same"), first)
+            monitor.update(Frame([1], sequence, device_id="same"), second)
+
+        assert monitor.gaps == 0
+        assert monitor.dropped == 0
+
+    def test_direct_frames_are_not_counted(self):
+        from bluegraph.devices import DeviceWrappers
+
+        monitor = utils.FrameMonitor()
+        for i in range(3):
+            monitor.update(DeviceWrappers.Frame([1]))
+        assert monitor.gaps == 0
+
+class TestStageTimer:
+    def test_percentiles_of_recent_window(self):
+        stages = utils.StageTimer(window=100)
+        assert stages.percentiles("paint") is None
+
+        for i in range(200):
+            stages.add("paint", (i % 100 + 1) * 0.001)
+        (p50, p95, p99) = stages.percentiles("paint")
+        assert 0.049 < p50 < 0.052
+        assert 0.094 < p95 < 0.097
+        assert p99 <= 0.1
+
+    def test_overlay_and_dump_text(self):
+        stages = utils.StageTimer()
+        for i in range(50):
+            stages.add("set_data", 0.002)
+            stages.add("paint", 0.001 * (i + 1))
+
+        overlay = stages.overlay()
+        assert overlay.startswith("stage")
+        assert "set_data   2.00   2.00   2.00" in overlay
+        assert "read         -" in overlay
+
+        dump = stages.dump(bins=5)
+        assert "paint histogram, 50 frames:" in dump
+        assert "set_data histogram, 50 frames:" in dump
+        assert "read histogram" not in dump
+
+class TestPoolRefiller:
+    def test_refills_taken_workers(self, qtbot):
+        from bluegraph.devices import DeviceWrappers
+
+        pool = DeviceWrappers.WorkerPool(size=2)
+        refiller = utils.PoolRefiller(pool, interval=10)
+        for (process, control_queue) in (pool.take()[:2], pool.take()[:2]):
+            control_queue.put("STOP")
+            process.join()
+        assert len(pool.idle) == 0
+
+        qtbot.wait_until(lambda: len(pool.idle) == 2, timeout=5000)
+        refiller.stop()
+        assert pool.close() == True